@@ -0,0 +1,377 @@
+#!/usr/bin/env python3
+"""
+Benchmark every public metric across data sizes (1 day to 10 years of 5 minute CGM data), layouts (one 1D time
+series, or a matrix where each column is a time series) and dtypes (int and float).
+
+The minimum wall time over several repeats and the peak memory allocated during one call are written to a JSON file.
+The cold start import of the package and of its core metric modules, and the first call of a metric (import
+included), are timed the same way, each in a fresh interpreter (after numpy, which is not ours to speed up), and
+the run fails if one of them pulls in a heavy optional dependency such as pandas or numba. When a baseline file is
+given, the run fails (exit code 1) if any benchmark is slower than the baseline by more than the threshold ratio.
+The machine a baseline was recorded on is stored with it, and comparing against a baseline from another machine (or
+python or numpy version) prints a warning, since the timings are only comparable on the same machine.
+
+Usage:
+    python benchmarks/run_benchmarks.py                            # write benchmarks/results.json
+    python benchmarks/run_benchmarks.py --baseline benchmarks/baseline.json
+    python benchmarks/run_benchmarks.py --save-baseline           # overwrite benchmarks/baseline.json
+    python benchmarks/run_benchmarks.py --imports-only            # only the cold start imports and first calls
+"""
+import argparse
+import json
+import operator
+import os
+import platform
+import subprocess
+import sys
+import timeit
+import tracemalloc
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from tidepool_data_science_metrics.common import common  # noqa: E402
+from tidepool_data_science_metrics.glucose import agp, glucose, histogram, rolling, streaming, variability  # noqa: E402
+from tidepool_data_science_metrics.insulin import insulin  # noqa: E402
+
+BENCHMARK_DIR = Path(__file__).resolve().parent
+SAMPLES_PER_DAY = 288
+SIZES = {
+    "1_day": SAMPLES_PER_DAY,
+    "14_days": 14 * SAMPLES_PER_DAY,
+    "90_days": 90 * SAMPLES_PER_DAY,
+    "1_year": 365 * SAMPLES_PER_DAY,
+    "10_years": 3650 * SAMPLES_PER_DAY,
+}
+# the grid of time in range bounds of the sweep benchmark
+SWEEP_LOWER_BOUNDS = np.arange(54, 101, 2)
+SWEEP_UPPER_BOUNDS = np.arange(140, 251, 5)
+
+
+def glucose_metrics(axis):
+    metrics = {
+        "glucose.glucose_management_index": lambda bg: glucose.glucose_management_index(bg, axis=axis),
+        "glucose.percent_values_by_range": lambda bg: glucose.percent_values_by_range(
+            bg, 70, 180, upper_bound_operator=operator.le, axis=axis
+        ),
+        "glucose.percent_values_by_range_sweep": lambda bg: glucose.percent_values_by_range_sweep(
+            bg, SWEEP_LOWER_BOUNDS[:, np.newaxis], SWEEP_UPPER_BOUNDS, axis=axis
+        ),
+        "glucose.percent_values_ge_70_le_180": lambda bg: glucose.percent_values_ge_70_le_180(bg, axis=axis),
+        "glucose.percent_values_lt_70": lambda bg: glucose.percent_values_lt_70(bg, axis=axis),
+        "glucose.percent_values_lt_54": lambda bg: glucose.percent_values_lt_54(bg, axis=axis),
+        "glucose.percent_values_lt_40": lambda bg: glucose.percent_values_lt_40(bg, axis=axis),
+        "glucose.percent_values_gt_180": lambda bg: glucose.percent_values_gt_180(bg, axis=axis),
+        "glucose.percent_values_gt_250": lambda bg: glucose.percent_values_gt_250(bg, axis=axis),
+        "glucose.percent_values_gt_300": lambda bg: glucose.percent_values_gt_300(bg, axis=axis),
+        "glucose.percent_values_gt_400": lambda bg: glucose.percent_values_gt_400(bg, axis=axis),
+        "glucose.episodes": lambda bg: glucose.episodes(bg, 54, 3, axis=axis),
+        "glucose.blood_glucose_risk_index": lambda bg: glucose.blood_glucose_risk_index(bg, axis=axis),
+        "glucose.summary": lambda bg: glucose.summary(bg, axis=axis),
+        "glucose.validation_report": lambda bg: glucose.validation_report(bg, axis=axis),
+        "glucose.data_sufficiency": lambda bg: glucose.data_sufficiency(bg, axis=axis),
+        "common.mean": lambda bg: common.mean(bg, axis=axis),
+        "common.avg": lambda bg: common.avg(bg, axis=axis),
+        "common.std_deviation": lambda bg: common.std_deviation(bg, axis=axis),
+        "common.coefficient_of_variation": lambda bg: common.coefficient_of_variation(bg, axis=axis),
+        "rolling.rolling_percent_values_by_range": lambda bg: rolling.rolling_percent_values_by_range(
+            bg, SAMPLES_PER_DAY, 70, 180, upper_bound_operator=operator.le, axis=axis
+        ),
+        "rolling.rolling_mean": lambda bg: rolling.rolling_mean(bg, SAMPLES_PER_DAY, axis=axis),
+        "rolling.rolling_std_deviation": lambda bg: rolling.rolling_std_deviation(bg, SAMPLES_PER_DAY, axis=axis),
+        "rolling.rolling_coefficient_of_variation": lambda bg: rolling.rolling_coefficient_of_variation(
+            bg, SAMPLES_PER_DAY, axis=axis
+        ),
+        "rolling.rolling_glucose_management_index": lambda bg: rolling.rolling_glucose_management_index(
+            bg, SAMPLES_PER_DAY, axis=axis
+        ),
+        "histogram.GlucoseHistogram.from_values": lambda bg: histogram.GlucoseHistogram.from_values(bg, axis=axis),
+        "agp.ambulatory_glucose_profile": lambda bg: agp.ambulatory_glucose_profile(bg, axis=axis),
+        "variability.mean_amplitude_of_glycemic_excursions": lambda bg: (
+            variability.mean_amplitude_of_glycemic_excursions(bg, axis=axis)
+        ),
+        "variability.continuous_overall_net_glycemic_action": lambda bg: (
+            variability.continuous_overall_net_glycemic_action(bg, axis=axis)
+        ),
+        "variability.mean_of_daily_differences": lambda bg: variability.mean_of_daily_differences(bg, axis=axis),
+        "variability.j_index": lambda bg: variability.j_index(bg, axis=axis),
+        "variability.average_daily_risk_range": lambda bg: variability.average_daily_risk_range(bg, axis=axis),
+        "variability.glycemic_risk_assessment_diabetes_equation": lambda bg: (
+            variability.glycemic_risk_assessment_diabetes_equation(bg, axis=axis)
+        ),
+        "variability.variability_summary": lambda bg: variability.variability_summary(bg, axis=axis),
+    }
+    if axis is None:
+        # the accumulator takes the values of one time series
+        metrics["streaming.GlucoseAccumulator.from_values"] = lambda bg: streaming.GlucoseAccumulator.from_values(bg)
+    return metrics
+
+
+INSULIN_METRICS = {
+    "insulin.dka_index": lambda iob: insulin.dka_index(iob, scheduled_basal_rate=1.0),
+    "insulin.insulin_on_board": lambda delivered: insulin.insulin_on_board(delivered),
+}
+
+# scored over an array of index values, e.g. one per patient or per window
+RISK_SCORE_METRICS = {
+    "glucose.lbgi_risk_score": lambda index: glucose.lbgi_risk_score(index),
+    "glucose.lbgi_risk_score_counts": lambda index: glucose.lbgi_risk_score_counts(index),
+    "insulin.dka_risk_score": lambda index: insulin.dka_risk_score(index),
+    "insulin.dka_risk_score_counts": lambda index: insulin.dka_risk_score_counts(index),
+}
+
+DOSE_METRICS = {
+    "insulin.delivered_insulin": lambda doses: insulin.delivered_insulin(**doses),
+}
+
+SCALAR_METRICS = {
+    "glucose.lbgi_risk_score": lambda: glucose.lbgi_risk_score(3.2),
+    "insulin.dka_risk_score": lambda: insulin.dka_risk_score(9.5),
+    "insulin.approximate_steady_state_iob_from_sbr": lambda: insulin.approximate_steady_state_iob_from_sbr(1.0),
+    "insulin.steady_state_iob": lambda: insulin.steady_state_iob(1.0),
+}
+
+
+# the modules whose cold start import is timed, the metrics whose first call (with the import) is timed, and the
+# optional dependencies none of them may import
+IMPORTS = [
+    "tidepool_data_science_metrics",
+    "tidepool_data_science_metrics.glucose.glucose",
+    "tidepool_data_science_metrics.common.common",
+    "tidepool_data_science_metrics.insulin.insulin",
+]
+FIRST_CALLS = {
+    "tidepool_data_science_metrics.glucose.glucose.summary": (
+        "from tidepool_data_science_metrics.glucose import glucose\n"
+        "glucose.summary(numpy.full(288, 120.0))"
+    ),
+}
+HEAVY_DEPENDENCIES = ["pandas", "pyarrow", "numba", "scipy"]
+
+COLD_START_SCRIPT = """
+import json, sys, time, tracemalloc
+import numpy
+if {trace}:
+    tracemalloc.start()
+start = time.perf_counter()
+{statement}
+seconds = time.perf_counter() - start
+print(json.dumps([seconds, tracemalloc.get_traced_memory()[1], sorted(set(sys.modules) & set({heavy}))]))
+"""
+
+
+def synthetic_cgm(n_values, n_series, seed=0):
+    # a bounded random walk around 140 mg/dL, which crosses every summary threshold
+    rng = np.random.default_rng(seed)
+    steps = rng.normal(0, 4, size=(n_values, n_series))
+    bg = 140 + np.cumsum(steps, axis=0) % 320 - 100 + 60 * np.sin(np.arange(n_values) / 288 * 2 * np.pi)[:, None]
+    return np.clip(np.abs(bg) + 40, 40, 400)
+
+
+def synthetic_iob(n_values, seed=0):
+    rng = np.random.default_rng(seed)
+    return np.clip(2.1 + np.cumsum(rng.normal(0, 0.05, size=n_values)) % 3 - 1.5, 0, None)
+
+
+def synthetic_risk_indices(n_values, seed=0):
+    # LBGI and DKA Index values (hours) across every risk score
+    return np.random.default_rng(seed).uniform(0, 25, size=n_values)
+
+
+def synthetic_doses(n_values, seed=0):
+    # four boluses a day and a basal dose every 30 minutes, over the time of n_values 5 minute samples
+    rng = np.random.default_rng(seed)
+    start = np.datetime64("2020-01-01T00:00")
+    n_minutes = n_values * 5
+    n_boluses = max(1, n_values * 4 // SAMPLES_PER_DAY)
+    basal_starts = start + np.arange(0, n_minutes, 30).astype("timedelta64[m]")
+    return {
+        "start": start,
+        "end": start + np.timedelta64(n_minutes, "m"),
+        "bolus_times": start + np.sort(rng.integers(0, n_minutes, n_boluses)).astype("timedelta64[m]"),
+        "bolus_units": rng.uniform(0.5, 8, n_boluses),
+        "basal_start_times": basal_starts,
+        "basal_end_times": basal_starts + np.timedelta64(30, "m"),
+        "basal_rates": rng.uniform(0, 2, len(basal_starts)),
+    }
+
+
+def measure(function, args, repeat):
+    # call often enough that each measurement takes about 20 ms
+    single_call = timeit.timeit(lambda: function(*args), number=1)
+    number = max(1, min(10 ** 5, int(0.02 / max(single_call, 1e-7))))
+    seconds = min(timeit.repeat(lambda: function(*args), number=number, repeat=repeat)) / number
+    tracemalloc.start()
+    function(*args)
+    _, peak_bytes = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return seconds, peak_bytes
+
+
+def measure_cold_start(statement, repeat):
+    # A fresh interpreter for every run, so nothing is cached in sys.modules, and the peak memory from one more
+    # run, since tracing the allocations slows the import down. Bytecode is written (and compiled by a first,
+    # untimed import) as for an installed package, so the time is not the time to compile the source.
+    env = {name: value for name, value in os.environ.items() if name != "PYTHONDONTWRITEBYTECODE"}
+
+    def import_in_subprocess(trace):
+        script = COLD_START_SCRIPT.format(statement=statement, trace=trace, heavy=HEAVY_DEPENDENCIES)
+        command = [sys.executable, "-c", script]
+        output = subprocess.run(
+            command,
+            check=True,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            universal_newlines=True,
+            cwd=BENCHMARK_DIR.parent,
+            env=env,
+        )
+        return json.loads(output.stdout)
+
+    import_in_subprocess(trace=False)
+    seconds = min(import_in_subprocess(trace=False)[0] for _ in range(repeat))
+    _, peak_bytes, heavy_modules = import_in_subprocess(trace=True)
+    return seconds, peak_bytes, heavy_modules
+
+
+def run_imports(repeat):
+    results = []
+    heavy_imports = []
+    cold_starts = [(module, "cold", f"import {module}") for module in IMPORTS]
+    cold_starts += [(name, "first call", statement) for name, statement in FIRST_CALLS.items()]
+    for name, layout, statement in cold_starts:
+        seconds, peak_bytes, heavy_modules = measure_cold_start(statement, repeat)
+        results.append(_result(name, "import", layout, "-", seconds, peak_bytes))
+        _report(results[-1])
+        heavy_imports += [(name, heavy_module) for heavy_module in heavy_modules]
+    return results, heavy_imports
+
+
+def run(sizes, n_series, repeat):
+    results = []
+    for size_name in sizes:
+        n_values = SIZES[size_name]
+        float_matrix = synthetic_cgm(n_values, n_series)
+        for layout, axis in [("1d", None), ("matrix", 0)]:
+            for dtype in ["int", "float"]:
+                bg = float_matrix[:, 0] if layout == "1d" else float_matrix
+                bg = np.rint(bg).astype(np.int64) if dtype == "int" else bg
+                for name, function in glucose_metrics(axis).items():
+                    seconds, peak_bytes = measure(function, (bg,), repeat)
+                    results.append(_result(name, size_name, layout, dtype, seconds, peak_bytes))
+                    _report(results[-1])
+        for name, function in INSULIN_METRICS.items():
+            seconds, peak_bytes = measure(function, (synthetic_iob(n_values),), repeat)
+            results.append(_result(name, size_name, "1d", "float", seconds, peak_bytes))
+            _report(results[-1])
+        for name, function in RISK_SCORE_METRICS.items():
+            seconds, peak_bytes = measure(function, (synthetic_risk_indices(n_values),), repeat)
+            results.append(_result(name, size_name, "1d", "float", seconds, peak_bytes))
+            _report(results[-1])
+        for name, function in DOSE_METRICS.items():
+            seconds, peak_bytes = measure(function, (synthetic_doses(n_values),), repeat)
+            results.append(_result(name, size_name, "events", "float", seconds, peak_bytes))
+            _report(results[-1])
+    for name, function in SCALAR_METRICS.items():
+        seconds, peak_bytes = measure(function, (), repeat)
+        results.append(_result(name, "scalar", "scalar", "float", seconds, peak_bytes))
+        _report(results[-1])
+    return results
+
+
+def cpu_name():
+    # platform.processor() is empty on most Linux machines, where /proc/cpuinfo has the model name
+    try:
+        with open("/proc/cpuinfo") as cpuinfo:
+            for line in cpuinfo:
+                if line.startswith("model name"):
+                    return line.split(":", 1)[1].strip()
+    except OSError:
+        pass
+    return platform.processor() or platform.machine()
+
+
+def compare(results, baseline, threshold, noise_seconds, import_noise_seconds):
+    baseline_seconds = {_key(result): result["seconds"] for result in baseline["results"]}
+    regressions = []
+    for result in results:
+        previous = baseline_seconds.get(_key(result))
+        # very fast calls (and imports, which depend on the file system cache) vary a lot between runs, so a
+        # slowdown must also exceed the noise floor
+        noise = import_noise_seconds if result["size"] == "import" else noise_seconds
+        if previous and result["seconds"] > previous * threshold and result["seconds"] - previous > noise:
+            regressions.append((_key(result), previous, result["seconds"]))
+    return regressions
+
+
+def _result(name, size, layout, dtype, seconds, peak_bytes):
+    return {"name": name, "size": size, "layout": layout, "dtype": dtype, "seconds": seconds, "peak_bytes": peak_bytes}
+
+
+def _key(result):
+    return "{name}[{size},{layout},{dtype}]".format(**result)
+
+
+def _report(result):
+    print(f"{_key(result):80s} {result['seconds'] * 1e3:12.4f} ms {result['peak_bytes'] / 2 ** 20:10.2f} MiB")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", nargs="+", choices=list(SIZES), default=list(SIZES))
+    parser.add_argument("--n-series", type=int, default=10, help="number of time series in the matrix layout")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--output", default=str(BENCHMARK_DIR / "results.json"))
+    parser.add_argument("--baseline", help="fail if slower than this baseline by more than the threshold")
+    parser.add_argument("--threshold", type=float, default=1.5, help="allowed ratio of time to the baseline time")
+    parser.add_argument("--noise", type=float, default=1e-5, help="ignore slowdowns smaller than this many seconds")
+    parser.add_argument("--import-noise", type=float, default=5e-3, help="the noise floor of the import benchmarks")
+    parser.add_argument(
+        "--imports-only", action="store_true", help="only benchmark the cold start imports and first calls"
+    )
+    parser.add_argument("--save-baseline", action="store_true", help="write the results as the stored baseline")
+    args = parser.parse_args()
+
+    results, heavy_imports = run_imports(args.repeat)
+    if not args.imports_only:
+        results += run(args.sizes, args.n_series, args.repeat)
+    output = {
+        "meta": {
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "machine": platform.machine(),
+            "system": platform.system(),
+            "cpu": cpu_name(),
+            "cpu_count": os.cpu_count(),
+            "n_series": args.n_series,
+            "repeat": args.repeat,
+        },
+        "results": results,
+    }
+    output_path = BENCHMARK_DIR / "baseline.json" if args.save_baseline else Path(args.output)
+    output_path.write_text(json.dumps(output, indent=2) + "\n")
+    print(f"wrote {output_path}")
+
+    for module, heavy_module in heavy_imports:
+        print(f"HEAVY IMPORT {module} imports {heavy_module}")
+    regressions = []
+    if args.baseline:
+        baseline = json.loads(Path(args.baseline).read_text())
+        for field in ["python", "numpy", "machine", "system", "cpu", "cpu_count"]:
+            if baseline["meta"].get(field) != output["meta"][field]:
+                print(
+                    f"WARNING the baseline was recorded with {field} {baseline['meta'].get(field)}, not "
+                    f"{output['meta'][field]}, so its timings may not be comparable. Record a baseline on this machine "
+                    "with --save-baseline."
+                )
+        regressions = compare(results, baseline, args.threshold, args.noise, args.import_noise)
+        for key, previous, seconds in regressions:
+            print(f"REGRESSION {key}: {previous * 1e3:.4f} ms -> {seconds * 1e3:.4f} ms")
+    if regressions or heavy_imports:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
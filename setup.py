@@ -36,4 +36,5 @@ setuptools.setup(
         "Programming Language :: Python :: 3.7",
     ],
     install_requires=["numpy>=1.18.1", "pandas>=1.0.1",],
+    extras_require={"arrow": ["pyarrow"], "numba": ["numba"]},
 )
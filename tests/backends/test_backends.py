@@ -0,0 +1,85 @@
+import numpy as np
+import pytest
+from tidepool_data_science_metrics.backends import backends
+from tidepool_data_science_metrics.glucose import glucose, variability
+
+
+@pytest.fixture
+def bg_matrix():
+    rng = np.random.default_rng(0)
+    bg_matrix = np.clip(np.round(120 + np.cumsum(rng.normal(0, 6, size=(2 * 288, 5)), axis=0)), 40, 400)
+    bg_matrix[rng.random(bg_matrix.shape) < 0.02] = np.nan
+    return bg_matrix
+
+
+def test_use_backend_restores_the_previous_backend():
+    with backends.use_backend("numpy"):
+        assert backends.get_backend() == "numpy"
+    assert backends.get_backend() in backends.available_backends()
+
+
+def test_unknown_backend():
+    with pytest.raises(Exception):
+        backends.set_backend("cuda")
+
+
+def test_numpy_is_the_default_backend():
+    assert backends._backend == "numpy"
+
+
+def test_numpy_backend_is_always_available():
+    assert "numpy" in backends.available_backends()
+
+
+@pytest.mark.parametrize("min_length", [1, 3, 12])
+def test_run_counts_match(bg_matrix, min_length):
+    pytest.importorskip("numba")
+    mask_rows = bg_matrix.T < 100
+    with backends.use_backend("numba"):
+        numba_counts = glucose._run_counts(mask_rows, min_length)
+    np.testing.assert_array_equal(numba_counts, glucose._run_counts.numpy(mask_rows, min_length))
+
+
+def test_timed_run_counts_match(bg_matrix):
+    pytest.importorskip("numba")
+    rng = np.random.default_rng(1)
+    minutes = np.cumsum(rng.choice([5, 5, 5, 10, 40], size=len(bg_matrix))).astype(np.float64)
+    mask_rows = bg_matrix.T < 100
+    minute_rows = np.broadcast_to(minutes, mask_rows.shape)
+    with backends.use_backend("numba"):
+        numba_counts = glucose._timed_run_counts(mask_rows, minute_rows, 15, 15)
+    np.testing.assert_array_equal(numba_counts, glucose._timed_run_counts.numpy(mask_rows, minute_rows, 15, 15))
+
+
+def test_timed_run_counts_match_with_dropped_missing_values(bg_matrix):
+    pytest.importorskip("numba")
+    bg_rows = bg_matrix.T.copy()
+    bg_rows[0] = np.nan
+    bg_rows[1, 1:] = np.nan
+    minute_rows = np.broadcast_to(np.arange(len(bg_matrix)) * 5.0, bg_rows.shape)
+    mask_rows, minute_rows = glucose._episode_rows(bg_rows, 100, ignore_nan=True, minute_rows=minute_rows)
+    with backends.use_backend("numba"):
+        numba_counts = glucose._timed_run_counts(mask_rows, minute_rows, 15, 15)
+    np.testing.assert_array_equal(numba_counts, glucose._timed_run_counts.numpy(mask_rows, minute_rows, 15, 15))
+
+
+@pytest.mark.parametrize("ignore_nan", [False, True])
+def test_mage_matches(bg_matrix, ignore_nan):
+    pytest.importorskip("numba")
+    if not ignore_nan:
+        bg_matrix = np.nan_to_num(bg_matrix, nan=120)
+    bg_rows = bg_matrix.T
+    std_bg = np.nanstd(bg_rows, axis=1)
+    with backends.use_backend("numba"):
+        numba_mage = variability._mage(bg_rows, std_bg, 5, 32, ignore_nan)
+    np.testing.assert_array_equal(numba_mage, variability._mage.numpy(bg_rows, std_bg, 5, 32, ignore_nan))
+
+
+def test_episodes_match(bg_matrix):
+    pytest.importorskip("numba")
+    bg_matrix = np.nan_to_num(bg_matrix, nan=120)
+    with backends.use_backend("numba"):
+        numba_episodes = glucose.episodes(bg_matrix, 70, axis=0)
+    with backends.use_backend("numpy"):
+        numpy_episodes = glucose.episodes(bg_matrix, 70, axis=0)
+    np.testing.assert_array_equal(numba_episodes, numpy_episodes)
@@ -0,0 +1,122 @@
+import operator
+import numpy as np
+import pytest
+from tidepool_data_science_metrics.cache import cache
+from tidepool_data_science_metrics.common import common
+from tidepool_data_science_metrics.glucose import glucose
+
+
+@pytest.fixture(autouse=True)
+def clean_cache():
+    cache.disable()
+    cache.clear()
+    yield
+    cache.disable()
+    cache.clear()
+
+
+@pytest.fixture
+def bg_values():
+    return np.array([50, 60, 65, 100, 120, 150, 190, 260, 310, 400], dtype=np.float64)
+
+
+def test_nothing_cached_when_disabled(bg_values):
+    glucose.percent_values_lt_70(bg_values)
+    assert cache.stats()["misses"] == 0
+    assert cache.stats()["entries"] == 0
+
+
+def test_equal_arguments_hit(bg_values):
+    with cache.caching():
+        first = glucose.blood_glucose_risk_index(bg_values)
+        # a different array with the same values, and the default passed by keyword
+        second = glucose.blood_glucose_risk_index(bg_values.copy(), round_to_n_digits=2)
+    assert first == second
+    assert cache.stats()["hits"] == 1
+    assert cache.stats()["misses"] == 1
+
+
+def test_changed_values_or_parameters_miss(bg_values):
+    with cache.caching():
+        glucose.percent_values_by_range(bg_values, 70, 180)
+        glucose.percent_values_by_range(bg_values, 70, 180, upper_bound_operator=operator.le)
+        glucose.percent_values_by_range(bg_values.astype(np.int64), 70, 180)
+        bg_values[0] = 55
+        glucose.percent_values_by_range(bg_values, 70, 180)
+    assert cache.stats()["hits"] == 0
+    assert cache.stats()["misses"] == 4
+
+
+def test_cached_results_are_copies(bg_values):
+    with cache.caching():
+        report = glucose.summary(bg_values)
+        report["mean"] = -1
+        assert glucose.summary(bg_values)["mean"] == np.round(np.mean(bg_values), 2)
+
+
+def test_least_recently_used_is_evicted(bg_values):
+    with cache.caching(max_entries=2):
+        glucose.episodes(bg_values, 54)
+        glucose.episodes(bg_values, 70)
+        glucose.episodes(bg_values, 54)  # hit, so the episodes below 70 are the least recently used
+        glucose.episodes(bg_values, 180)
+        glucose.episodes(bg_values, 54)
+        glucose.episodes(bg_values, 70)
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"], stats["evictions"], stats["entries"]) == (2, 4, 2, 2)
+
+
+def test_max_bytes(bg_values):
+    with cache.caching(max_bytes=3 * bg_values.nbytes):
+        for _ in range(2):
+            glucose.blood_glucose_risk_index(bg_values, return_risk_values=True)
+    # each result holds two arrays the size of the values
+    assert cache.stats()["bytes"] == 2 * bg_values.nbytes
+    with cache.caching(max_bytes=bg_values.nbytes):
+        glucose.blood_glucose_risk_index(bg_values, return_risk_values=True)
+    assert cache.stats()["entries"] == 0
+
+
+def test_disk_tier(bg_values, tmp_path):
+    with cache.caching(directory=str(tmp_path)):
+        first = glucose.summary(bg_values)
+    cache.clear()
+    with cache.caching(directory=str(tmp_path)):
+        second = glucose.summary(bg_values)
+    assert cache.stats()["disk_hits"] == 1
+    assert cache.stats()["misses"] == 0
+    assert first == second
+    cache.clear(disk=True)
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_disk_tier_misses_results_of_other_code(bg_values, tmp_path, monkeypatch):
+    with cache.caching(directory=str(tmp_path)):
+        glucose.summary(bg_values)
+    cache.clear()
+    # as if the package was upgraded between the two processes
+    monkeypatch.setattr(cache, "_code_digest", lambda: b"other code")
+    with cache.caching(directory=str(tmp_path)):
+        glucose.summary(bg_values)
+    assert cache.stats()["disk_hits"] == 0
+    assert cache.stats()["misses"] == 1
+
+
+def test_uncacheable_arguments_are_calculated(bg_values):
+    with cache.caching():
+        glucose.percent_values_by_range(bg_values, 70, 180, lower_bound_operator=lambda a, b: a > b)
+    assert cache.stats()["misses"] == 0
+    assert cache.stats()["entries"] == 0
+
+
+def test_inner_cached_calls_are_not_keyed(bg_values, monkeypatch):
+    n_keys = []
+    key = cache._key
+    monkeypatch.setattr(cache, "_key", lambda *args: n_keys.append(args[0]) or key(*args))
+    with cache.caching():
+        # calls the cached std_deviation and avg
+        common.coefficient_of_variation(bg_values)
+        # calls the cached percent_values_by_range
+        glucose.percent_values_ge_70_le_180(bg_values)
+    assert n_keys == ["common.coefficient_of_variation", "glucose.percent_values_ge_70_le_180"]
+    assert cache.stats()["entries"] == 2
@@ -0,0 +1,102 @@
+import functools
+import numpy as np
+import pytest
+from tidepool_data_science_metrics.cohort.cohort import run_cohort
+from tidepool_data_science_metrics.glucose import glucose
+from tidepool_data_science_metrics.common import common
+
+
+@pytest.fixture
+def cohort(bg_matrix):
+    return [bg_matrix[:, col] for col in range(20)]
+
+
+def test_run_cohort_in_process(cohort):
+    table = run_cohort(cohort, [glucose.percent_values_lt_70, common.mean], n_workers=1)
+    assert list(table.columns) == [
+        "percent_values_lt_70",
+        "mean",
+        "n_values_lt_38",
+        "n_values_gt_402",
+        "n_values_missing",
+    ]
+    assert len(table) == 20
+    assert table.loc[7, "mean"] == common.mean(cohort[7])
+
+
+def test_run_cohort_process_pool_matches_in_process(cohort):
+    metrics = {
+        "tir": glucose.percent_values_ge_70_le_180,
+        "episodes": functools.partial(glucose.episodes, episodes_threshold=54),
+        "cv": common.coefficient_of_variation,
+    }
+    in_process = run_cohort(cohort, metrics, n_workers=1)
+    pooled = run_cohort(cohort, metrics, n_workers=2, chunk_size=3)
+    assert in_process.equals(pooled)
+
+
+def test_run_cohort_expands_dict_results(cohort):
+    table = run_cohort(cohort, [glucose.summary], n_workers=2)
+    assert table.loc[3, "summary.glucose_management_index"] == glucose.glucose_management_index(cohort[3])
+    assert table.loc[3, "summary.episodes"] == glucose.summary(cohort[3])["episodes"]
+
+
+def test_run_cohort_columns_do_not_collide(cohort):
+    episodes = functools.partial(glucose.episodes, episodes_threshold=54)
+    table = run_cohort(cohort[:2], [episodes, glucose.summary], n_workers=1)
+    assert list(table["episodes"]) == [episodes(bg_array) for bg_array in cohort[:2]]
+    assert list(table["summary.episodes"]) == [glucose.summary(bg_array)["episodes"] for bg_array in cohort[:2]]
+    with pytest.raises(Exception) as excinfo:
+        run_cohort(cohort[:2], [functools.partial(glucose.episodes, episodes_threshold=70), episodes])
+    assert "Metrics with the same function name must be passed as a dict of column names." in str(excinfo.value)
+
+
+def test_run_cohort_file_paths(cohort, tmp_path):
+    paths = []
+    for i, bg_array in enumerate(cohort[:4]):
+        path = str(tmp_path / f"patient_{i}.npy")
+        np.save(path, bg_array)
+        paths.append(path)
+    table = run_cohort(paths + cohort[4:6], [common.mean], n_workers=2)
+    assert list(table.index[:4]) == paths
+    assert list(table["mean"]) == [common.mean(bg_array) for bg_array in cohort[:6]]
+
+
+def test_run_cohort_patient_ids(cohort):
+    with pytest.raises(Exception) as excinfo:
+        run_cohort(cohort, [common.mean], patient_ids=["a"], n_workers=1)
+    assert "patient_ids must have one id per patient." in str(excinfo.value)
+
+
+def test_run_cohort_aggregates_validation(cohort, recwarn):
+    cohort = cohort[:3] + [np.array([30, 100, 450, 35])]
+    table = run_cohort(cohort, [glucose.percent_values_lt_70, glucose.summary], n_workers=1)
+    assert len(recwarn) == 0
+    assert list(table["n_values_lt_38"]) == [0, 0, 0, 2]
+    assert list(table["n_values_gt_402"]) == [0, 0, 0, 1]
+    assert table.loc[3, "percent_values_lt_70"] == 50
+
+
+def test_run_cohort_invalid_patient(cohort):
+    with pytest.raises(Exception) as excinfo:
+        run_cohort(cohort[:2] + [np.array([0, 100])], [common.mean], n_workers=1)
+    assert "Patient 2 had glucose values less than 1 or greater than 1000." in str(excinfo.value)
+
+
+def test_run_cohort_with_missing_values(cohort):
+    cohort = [patient.copy() for patient in cohort[:3]]
+    cohort[1][10:20] = np.nan
+    cohort[2][5] = np.nan
+    metrics = {
+        "tir": functools.partial(glucose.percent_values_ge_70_le_180, ignore_nan=True),
+        "mean": functools.partial(common.mean, ignore_nan=True),
+    }
+    table = run_cohort(cohort, metrics, n_workers=1)
+    assert list(table["n_values_missing"]) == [0, 10, 1]
+    assert table.loc[1, "tir"] == glucose.percent_values_ge_70_le_180(cohort[1], ignore_nan=True)
+    assert table.loc[2, "mean"] == common.mean(cohort[2], ignore_nan=True)
+
+
+def test_run_cohort_without_validation():
+    table = run_cohort([np.zeros(12), np.ones(12)], [common.mean], n_workers=1, validate=False)
+    assert list(table.columns) == ["mean"]
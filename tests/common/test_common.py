@@ -5,6 +5,9 @@ from tidepool_data_science_metrics.common.common import (
     coefficient_of_variation,
 )
 
+import numpy as np
+import pytest
+
 """  
 def test_avg_glucose(bg_array):
     average = avg(bg_array)
@@ -45,3 +48,19 @@ def test_coefficient_of_variation(bg_array):
 def test_coefficient_of_variation_round(bg_array):
     std = coefficient_of_variation(bg_array, 3)
     assert std == 25.177
+
+
+@pytest.mark.parametrize("metric", [mean, avg, std_deviation, coefficient_of_variation])
+def test_metrics_along_axis(bg_matrix, metric):
+    expected = [metric(bg_matrix[:, col]) for col in range(bg_matrix.shape[1])]
+    assert np.array_equal(metric(bg_matrix, axis=0), expected)
+    assert np.array_equal(metric(bg_matrix.T, axis=1), expected)
+
+
+@pytest.mark.parametrize("metric", [mean, avg, std_deviation, coefficient_of_variation])
+def test_metrics_ignore_nan(bg_matrix, metric):
+    with_missing = bg_matrix.copy()
+    with_missing[::3, 1] = np.nan
+    expected = [metric(col[~np.isnan(col)]) for col in with_missing.T]
+    assert np.array_equal(metric(with_missing, axis=0, ignore_nan=True), expected)
+    assert np.isnan(metric(with_missing))
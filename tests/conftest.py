@@ -57,3 +57,12 @@ def get_episodes_array(scope="module"):
         f"{Path(__file__).parent.resolve()}/../data/tests/episodes_values.csv"
     )
     return df.to_numpy(dtype=object)
+
+
+@pytest.fixture
+def bg_matrix(scope="module"):
+    df = pd.read_csv(
+        f"{Path(__file__).parent.resolve()}/../data/tests/bg-matrix-sample-each-col-is-a-unique-time-series.csv",
+        header=None,
+    )
+    return df.to_numpy()
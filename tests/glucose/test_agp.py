@@ -0,0 +1,85 @@
+import numpy as np
+import pandas as pd
+import pytest
+from tidepool_data_science_metrics.glucose.agp import ambulatory_glucose_profile, _nan_percentiles
+
+
+@pytest.fixture
+def two_weeks():
+    rng = np.random.default_rng(0)
+    timestamps = np.arange("2020-01-01T00:00", "2020-01-15T00:00", np.timedelta64(5, "m"), dtype="datetime64[m]")
+    bg_array = np.clip(rng.normal(140, 40, size=(len(timestamps), 3)), 40, 400).round()
+    return bg_array, timestamps
+
+
+def test_agp_matches_pandas_groupby_by_time_of_day(two_weeks):
+    bg_array, timestamps = two_weeks
+    agp = ambulatory_glucose_profile(bg_array[:, 0], timestamps, round_to_n_digits=6)
+    df = pd.DataFrame({"bg": bg_array[:, 0], "time_of_day": pd.DatetimeIndex(timestamps).time})
+    expected = df.groupby("time_of_day")["bg"].quantile([0.05, 0.25, 0.5, 0.75, 0.95]).unstack().T.to_numpy()
+    assert agp.shape == (5, 288)
+    assert np.allclose(agp, expected)
+
+
+def test_agp_without_timestamps_starts_at_midnight(two_weeks):
+    bg_array, timestamps = two_weeks
+    agp = ambulatory_glucose_profile(bg_array[:, 0])
+    assert np.array_equal(agp, ambulatory_glucose_profile(bg_array[:, 0], timestamps))
+
+
+def test_agp_matrix_layout(two_weeks):
+    bg_array, timestamps = two_weeks
+    agp = ambulatory_glucose_profile(bg_array, timestamps, percentiles=[50], slot_minutes=60, axis=0)
+    assert agp.shape == (1, 24, 3)
+    for patient in range(3):
+        expected = ambulatory_glucose_profile(bg_array[:, patient], timestamps, percentiles=[50], slot_minutes=60)
+        assert np.array_equal(agp[:, :, patient], expected)
+
+
+def test_agp_gaps_and_start_time():
+    # values at 23:50 and 00:10 on two days, with nothing in between
+    timestamps = np.array(
+        ["2020-01-01T23:50", "2020-01-02T00:10", "2020-01-02T23:50", "2020-01-03T00:10"], dtype="datetime64"
+    )
+    agp = ambulatory_glucose_profile(np.array([100, 200, 120, 220]), timestamps, percentiles=[0, 100], slot_minutes=10)
+    assert agp.shape == (2, 144)
+    assert np.array_equal(agp[:, 143], [100, 120])
+    assert np.array_equal(agp[:, 1], [200, 220])
+    assert np.isnan(agp[:, 2:143]).all()
+
+
+def test_agp_smoothing_wraps_around_midnight():
+    bg_array = np.full(288, 100.0)
+    bg_array[0] = 130
+    agp = ambulatory_glucose_profile(bg_array, percentiles=[50], smoothing_slots=3)
+    assert np.array_equal(agp[0, [287, 0, 1, 2]], [110, 110, 110, 100])
+
+
+def test_agp_invalid_parameters():
+    with pytest.raises(Exception) as excinfo:
+        ambulatory_glucose_profile(np.array([100, 120]), slot_minutes=7)
+    assert "slot_minutes must divide a day evenly" in str(excinfo.value)
+    with pytest.raises(Exception):
+        ambulatory_glucose_profile(np.array([100, 120]), smoothing_slots=2)
+
+
+def test_nan_percentiles_matches_numpy():
+    grid = np.random.default_rng(1).uniform(40, 400, size=(4, 14, 288))
+    grid[grid < 100] = np.nan
+    grid[0, :, 5] = np.nan
+    with pytest.warns(RuntimeWarning):
+        expected = np.nanpercentile(grid, [0, 5, 50, 95, 100], axis=1)
+    assert np.allclose(_nan_percentiles(grid, [0, 5, 50, 95, 100]), expected, equal_nan=True)
+
+
+def test_agp_ignore_nan():
+    # two values in the 00:00 slot of each day, one of them missing on the second day
+    timestamps = np.array(
+        ["2020-01-01T00:00", "2020-01-01T00:05", "2020-01-02T00:00", "2020-01-02T00:05"], dtype="datetime64"
+    )
+    bg_array = np.array([100, 120, 140, np.nan])
+    agp = ambulatory_glucose_profile(bg_array, timestamps, percentiles=[0, 100], slot_minutes=10, ignore_nan=True)
+    assert np.array_equal(agp[:, 0], [110, 140])
+    # without ignore_nan the missing value makes the slot of the second day missing
+    agp = ambulatory_glucose_profile(bg_array, timestamps, percentiles=[0, 100], slot_minutes=10)
+    assert np.array_equal(agp[:, 0], [110, 110])
@@ -1,10 +1,14 @@
+import operator
 import pytest
+import pandas as pd
 import numpy as np
 from tidepool_data_science_metrics.glucose.glucose import (
     percent_values_by_range,
+    percent_values_by_range_sweep,
     glucose_management_index,
     blood_glucose_risk_index,
     lbgi_risk_score,
+    lbgi_risk_score_counts,
     episodes,
     percent_values_ge_70_le_180,
     percent_values_lt_40,
@@ -14,8 +18,11 @@ from tidepool_data_science_metrics.glucose.glucose import (
     percent_values_gt_250,
     percent_values_gt_300,
     percent_values_gt_400,
+    summary,
     _validate_bg,
 )
+from tidepool_data_science_metrics.common import common
+from tidepool_data_science_metrics.glucose import glucose
 
 
 def test_percent_values_by_range():
@@ -114,6 +121,16 @@ def test_lbgi_risk_scores():
     for lbgi, lbgi_score in zip(lbgi_array, lbgi_rs):
         lbgi_risk_score_val = lbgi_risk_score(lbgi)
         assert lbgi_risk_score_val == lbgi_score
+    assert np.array_equal(lbgi_risk_score(lbgi_array), lbgi_rs)
+    assert np.array_equal(lbgi_risk_score(lbgi_array.reshape(1, -1)), lbgi_rs.reshape(1, -1))
+
+
+def test_lbgi_risk_score_counts():
+    lbgi_matrix = np.array([[0, 1, 3, 11], [0.5, 0.5, 7, np.nan]])
+    assert np.array_equal(lbgi_risk_score_counts(lbgi_matrix), [2, 3, 1, 1, 1])
+    assert np.array_equal(lbgi_risk_score_counts(lbgi_matrix, axis=1), [[1, 1, 1, 0, 1], [1, 2, 0, 1, 0]])
+    assert np.array_equal(lbgi_risk_score_counts(lbgi_matrix, axis=-1), lbgi_risk_score_counts(lbgi_matrix, axis=1))
+    assert np.array_equal(lbgi_risk_score_counts(lbgi_matrix, axis=0)[3], [1, 0, 0, 0, 1])
 
 
 def test_get_episodes_3_consecutive(get_episodes_array):
@@ -252,3 +269,373 @@ def test_integration_of_percentages(bg_array):
         + percent_values_gt_180(bg_array, round_to_n_digits=9)
     )
     assert total == 100
+
+
+def test_blood_glucose_risk_index_does_not_mutate_input(bg_array):
+    bg_array = bg_array.copy()
+    bg_array.setflags(write=False)
+    LBGI, HBGI, BGRI = blood_glucose_risk_index(bg_array)
+    assert BGRI == 3.58
+
+
+def test_summary_matches_individual_functions(bg_array):
+    report = summary(bg_array)
+    for name in [
+        "percent_values_lt_40",
+        "percent_values_lt_54",
+        "percent_values_lt_70",
+        "percent_values_ge_70_le_180",
+        "percent_values_gt_180",
+        "percent_values_gt_250",
+        "percent_values_gt_300",
+        "percent_values_gt_400",
+        "glucose_management_index",
+    ]:
+        assert report[name] == getattr(glucose, name)(bg_array)
+    assert (report["lbgi"], report["hbgi"], report["bgri"]) == blood_glucose_risk_index(bg_array)
+    assert report["episodes"] == episodes(bg_array, 54, 3)
+    assert report["mean"] == common.mean(bg_array)
+    assert report["std_deviation"] == common.std_deviation(bg_array)
+    assert report["coefficient_of_variation"] == common.coefficient_of_variation(bg_array)
+    assert report["count"] == 99
+
+
+def test_summary_episodes(get_episodes_array):
+    bg_array = get_episodes_array.astype(float)
+    assert summary(bg_array, episodes_threshold=55, min_ct_per_ep=3)["episodes"] == 2
+    assert summary(bg_array, episodes_threshold=55, min_ct_per_ep=4)["episodes"] == 1
+
+
+def test_summary_upper_limit():
+    bg_array = np.array([100, 179.9999, 180, 180.0001, 401, 1000])
+    report = summary(bg_array, round_to_n_digits=2)
+    assert report["percent_values_gt_180"] == percent_values_gt_180(bg_array, round_to_n_digits=2)
+    assert report["percent_values_gt_400"] == percent_values_gt_400(bg_array, round_to_n_digits=2)
+    assert report["percent_values_ge_70_le_180"] == percent_values_ge_70_le_180(bg_array, round_to_n_digits=2)
+
+
+@pytest.mark.parametrize(
+    "metric",
+    [
+        glucose_management_index,
+        percent_values_ge_70_le_180,
+        percent_values_lt_40,
+        percent_values_lt_54,
+        percent_values_lt_70,
+        percent_values_gt_180,
+        percent_values_gt_250,
+        percent_values_gt_300,
+        percent_values_gt_400,
+    ],
+)
+def test_metrics_along_axis(bg_matrix, metric):
+    expected = [metric(bg_matrix[:, col]) for col in range(bg_matrix.shape[1])]
+    assert np.array_equal(metric(bg_matrix, axis=0), expected)
+    assert np.array_equal(metric(bg_matrix.T, axis=1), expected)
+
+
+def test_percent_values_by_range_along_axis(bg_matrix):
+    percent = percent_values_by_range(bg_matrix, 60, 100, axis=0)
+    assert percent.shape == (bg_matrix.shape[1],)
+    assert percent[0] == percent_values_by_range(bg_matrix[:, 0], 60, 100)
+
+
+def test_percent_values_by_range_sweep(bg_matrix):
+    lower_bounds = [40, 54, 70, 70]
+    upper_bounds = [180, 140, 180, 70]
+    lower_bound_operators = [operator.ge, operator.gt, operator.ge, operator.gt]
+    upper_bound_operators = [operator.lt, operator.le, operator.le, operator.lt]
+    percent = percent_values_by_range_sweep(
+        bg_matrix, lower_bounds, upper_bounds, lower_bound_operators, upper_bound_operators, axis=0
+    )
+    assert percent.shape == (4, bg_matrix.shape[1])
+    for i in range(4):
+        expected = percent_values_by_range(
+            bg_matrix, lower_bounds[i], upper_bounds[i], lower_bound_operators[i], upper_bound_operators[i], axis=0
+        )
+        assert np.array_equal(percent[i], expected)
+    assert np.all(percent[3] == 0)
+
+
+@pytest.mark.parametrize("n_values", [24, 2000])
+def test_percent_values_by_range_sweep_of_many_series_with_missing_values(n_values):
+    # short series are searched all at once and long series one at a time
+    rng = np.random.default_rng(0)
+    bg_matrix = np.round(rng.uniform(40, 400, size=(n_values, 50)), 1)
+    bg_matrix[rng.random(bg_matrix.shape) < 0.1] = np.nan
+    bg_matrix[1:, 0] = np.nan
+    bg_matrix[:, 1] = 70
+    lower_bounds, upper_bounds = [54, 70, 70.5, 0], [70, 180, 180, 1000]
+    percent = percent_values_by_range_sweep(bg_matrix, lower_bounds, upper_bounds, axis=0, ignore_nan=True)
+    for i in range(4):
+        expected = percent_values_by_range(bg_matrix, lower_bounds[i], upper_bounds[i], axis=0, ignore_nan=True)
+        np.testing.assert_array_equal(percent[i], expected)
+
+
+def test_percent_values_by_range_sweep_grid():
+    bg_array = np.array([40, 70, 180, 400])
+    percent = percent_values_by_range_sweep(bg_array, np.array([0, 70])[:, np.newaxis], [140, 200, 500])
+    assert np.array_equal(percent, [[50.0, 75.0, 100.0], [25.0, 50.0, 75.0]])
+
+
+def test_percent_values_by_range_sweep_invalid_operator(bg_array):
+    with pytest.raises(Exception) as excinfo:
+        percent_values_by_range_sweep(bg_array, [54, 70], [180, 180], lower_bound_operators=[operator.ge, operator.lt])
+    assert "lower_bound_operators must be operator.ge or operator.gt" in str(excinfo.value)
+
+
+def test_percent_values_by_range_sweep_lower_above_upper(bg_array):
+    with pytest.raises(Exception) as excinfo:
+        percent_values_by_range_sweep(bg_array, [54, 200], [180, 180])
+    assert "lower threshold is higher than the upper threshold" in str(excinfo.value)
+
+
+def test_blood_glucose_risk_index_along_axis(bg_matrix):
+    LBGI, HBGI, BGRI = blood_glucose_risk_index(bg_matrix, axis=0)
+    for col in [0, 50, 99]:
+        assert (LBGI[col], HBGI[col], BGRI[col]) == blood_glucose_risk_index(bg_matrix[:, col])
+
+
+def test_episodes_along_axis(get_episodes_array):
+    bg_array = get_episodes_array.astype(float)
+    bg_matrix = np.hstack([bg_array, np.full_like(bg_array, 100), bg_array[::-1]])
+    assert np.array_equal(episodes(bg_matrix, 55, 3, axis=0), [2, 0, 2])
+    assert np.array_equal(episodes(bg_matrix, 55, 4, axis=0), [1, 0, 1])
+
+
+def test_summary_along_axis(bg_matrix):
+    report = summary(bg_matrix, axis=0)
+    col_report = summary(bg_matrix[:, 7])
+    assert report["count"] == col_report.pop("count")
+    for name, value in col_report.items():
+        assert report[name][7] == value
+
+
+def test_episodes_do_not_wrap_around():
+    bg_array = np.array([40, 40, 100, 100, 40, 40])
+    assert episodes(bg_array, 54, 2) == 2
+    assert episodes(bg_array, 54, 3) == 0
+    assert episodes(bg_array, 54, 4) == 0
+
+
+def test_episodes_at_the_end_of_the_array():
+    bg_array = np.array([100, 100, 40, 40, 40])
+    assert episodes(bg_array, 54, 3) == 1
+
+
+def test_episodes_long_minimum_count():
+    bg_array = np.concatenate([np.full(500, 45), [100], np.full(499, 45), [100]])
+    assert episodes(bg_array, 54, 500) == 1
+    assert episodes(bg_array, 54, 499) == 2
+
+
+def test_episodes_do_not_join_series_along_axis():
+    bg_matrix = np.array([[100, 40], [100, 40], [40, 100], [40, 100]])
+    assert np.array_equal(episodes(bg_matrix, 54, 2, axis=0), [1, 1])
+    assert np.array_equal(episodes(bg_matrix, 54, 3, axis=0), [0, 0])
+    assert episodes(bg_matrix, 54, 3) == 0
+
+
+def test_episodes_with_timestamps(get_date_ep_array):
+    timestamps = pd.to_datetime(get_date_ep_array[:, 0], format="%m/%d/%Y %H:%M:%S").to_numpy()
+    bg_array = get_date_ep_array[:, 1].astype(float)
+    # the last run of four values below 55 is split by the gap of a day between 01:55 and 02:00
+    assert episodes(bg_array, 55, timestamps=timestamps, min_duration=15) == 2
+    assert episodes(bg_array, 55, timestamps=timestamps, min_duration=20) == 0
+    assert episodes(bg_array, 55, timestamps=timestamps, min_duration=15, max_gap=60 * 25) == 2
+    assert episodes(bg_array, 55, timestamps=timestamps, min_duration=20, max_gap=60 * 25) == 1
+
+
+def test_episodes_with_timestamps_and_jitter():
+    timestamps = np.datetime64("2020-01-01T00:00") + np.array([0, 5, 11, 16, 20, 35, 40, 45], dtype="timedelta64[m]")
+    bg_array = np.array([100, 50, 50, 50, 100, 50, 50, 50])
+    assert episodes(bg_array, 54, timestamps=timestamps, min_duration=15) == 2
+    assert episodes(bg_array, 54, timestamps=timestamps, min_duration=15, max_gap=5) == 1
+
+
+def test_episodes_with_timestamps_along_axis():
+    timestamps = np.arange("2020-01-01T00:00", "2020-01-01T00:40", 5, dtype="datetime64[m]")
+    bg_matrix = np.array([[100, 50, 50, 50, 100, 100, 50, 50], [50, 50, 50, 50, 50, 100, 100, 100]]).T
+    assert np.array_equal(episodes(bg_matrix, 54, timestamps=timestamps, min_duration=15, axis=0), [1, 1])
+    assert np.array_equal(episodes(bg_matrix, 54, timestamps=timestamps, min_duration=10, axis=0), [2, 1])
+    timestamp_matrix = np.stack([timestamps, timestamps], axis=1)
+    assert np.array_equal(episodes(bg_matrix, 54, timestamps=timestamp_matrix, min_duration=10, axis=0), [2, 1])
+
+
+def test_validation_report(bg_array_low_high):
+    report = glucose.validation_report(bg_array_low_high)
+    assert report["n_values_lt_38"] == 2
+    assert report["n_values_gt_402"] == 1
+    assert report["n_values_lt_1"] == 0
+    assert report["n_values_gt_1000"] == 0
+    assert report["valid"]
+
+
+def test_validation_report_along_axis():
+    bg_matrix = np.array([[100, 30, 0], [100, 500, 1001], [100, 35, 50]])
+    report = glucose.validation_report(bg_matrix, axis=0)
+    assert np.array_equal(report["n_values_lt_38"], [0, 2, 1])
+    assert np.array_equal(report["n_values_gt_402"], [0, 1, 1])
+    assert np.array_equal(report["n_values_lt_1"], [0, 0, 1])
+    assert np.array_equal(report["n_values_gt_1000"], [0, 0, 1])
+    assert np.array_equal(report["valid"], [True, True, False])
+
+
+def test_metrics_skip_validation(bg_array_low_high, recwarn):
+    percent = percent_values_lt_70(bg_array_low_high, validate=False)
+    gmi = glucose_management_index(bg_array_low_high, validate=False)
+    assert len(recwarn) == 0
+    assert percent == 40
+    assert gmi == glucose_management_index(np.array([158.6]))
+
+
+def test_summary_reports_instead_of_warning(bg_array_low_high, recwarn):
+    report = summary(bg_array_low_high)
+    assert len(recwarn) == 0
+    assert report["n_values_lt_38"] == 2
+    assert report["n_values_gt_402"] == 1
+
+
+def test_summary_missing_values_are_not_counted_as_high():
+    report = summary(np.array([np.nan, 30.0, 100.0, 410.0, np.nan]))
+    assert report["n_values_lt_38"] == 1
+    assert report["n_values_gt_402"] == 1
+
+
+def test_summary_invalid(bg_array_less_than_one):
+    with pytest.raises(Exception) as excinfo:
+        summary(bg_array_less_than_one)
+    assert "Some values in the passed in array had glucose values less than 1." in str(excinfo.value)
+
+
+def _exact_risk_values(bg_array):
+    transformed_bg = 1.509 * ((np.log(np.maximum(bg_array, 1)) ** 1.084) - 5.381)
+    risk_power = 10 * (transformed_bg ** 2)
+    return risk_power * (transformed_bg < 0), risk_power * (transformed_bg > 0)
+
+
+def test_blood_glucose_risk_index_risk_values_integers():
+    bg_array = np.arange(1, 1001)
+    *_, rlBG, rhBG = blood_glucose_risk_index(bg_array, return_risk_values=True, validate=False)
+    exact_rlBG, exact_rhBG = _exact_risk_values(bg_array.astype(float))
+    assert np.array_equal(rlBG, exact_rlBG)
+    assert np.array_equal(rhBG, exact_rhBG)
+    float_risk_values = blood_glucose_risk_index(bg_array.astype(float), validate=False, return_risk_values=True)
+    assert np.array_equal(float_risk_values[3], rlBG)
+
+
+@pytest.mark.parametrize("dtype", [np.uint8, np.int16])
+def test_blood_glucose_risk_index_small_integer_dtypes(dtype):
+    bg_array = np.array([40, 100, 200, 250])
+    expected = blood_glucose_risk_index(bg_array)
+    assert blood_glucose_risk_index(bg_array.astype(dtype)) == expected
+    assert expected == (9.22, 8.51, 17.74)
+
+
+def test_blood_glucose_risk_index_risk_values_floats(bg_matrix):
+    LBGI, HBGI, BGRI, rlBG, rhBG = blood_glucose_risk_index(bg_matrix, axis=0, return_risk_values=True)
+    exact_rlBG, exact_rhBG = _exact_risk_values(bg_matrix)
+    assert rlBG.shape == bg_matrix.shape
+    assert np.allclose(rlBG, exact_rlBG, rtol=0, atol=1e-3)
+    assert np.allclose(rhBG, exact_rhBG, rtol=0, atol=1e-3)
+    assert np.array_equal(LBGI, np.round(np.mean(exact_rlBG, axis=0), 2))
+
+
+def test_blood_glucose_risk_index_low_float_values_are_exact():
+    bg_array = np.linspace(0.5, 37.9, 1000)
+    rlBG = blood_glucose_risk_index(bg_array, validate=False, return_risk_values=True)[3]
+    assert np.allclose(rlBG, _exact_risk_values(bg_array)[0], rtol=1e-12, atol=0)
+    assert blood_glucose_risk_index(np.array([1.05, 100]), validate=False)[2] == 325.28
+
+
+@pytest.mark.parametrize(
+    "metric",
+    [
+        glucose_management_index,
+        percent_values_ge_70_le_180,
+        percent_values_lt_54,
+        percent_values_lt_70,
+        percent_values_gt_250,
+        blood_glucose_risk_index,
+    ],
+)
+def test_metrics_ignore_nan(bg_matrix, metric):
+    with_missing = bg_matrix.copy()
+    with_missing[::7, 0] = np.nan
+    with_missing[:20, 1] = np.nan
+    results = metric(with_missing, axis=0, ignore_nan=True)
+    for col in range(bg_matrix.shape[1]):
+        valid = with_missing[:, col][~np.isnan(with_missing[:, col])]
+        expected = metric(valid)
+        assert np.array_equal(np.asarray(results)[..., col], expected)
+
+
+def test_summary_ignore_nan(bg_matrix):
+    with_missing = bg_matrix.copy()
+    with_missing[::5, 0] = np.nan
+    results = summary(with_missing, axis=0, ignore_nan=True)
+    expected = summary(with_missing[~np.isnan(with_missing[:, 0]), 0])
+    for key, value in expected.items():
+        assert results[key][0] == value, key
+
+
+def test_episodes_ignore_nan(get_episodes_array):
+    bg_array = np.repeat(get_episodes_array.astype(float).ravel(), 3)
+    expected = episodes(bg_array, 55, 3)
+    with_missing = bg_array.copy()
+    with_missing[1::7] = np.nan
+    assert episodes(with_missing, 55, 3) != expected
+    assert episodes(with_missing, 55, 3, ignore_nan=True) == episodes(bg_array[~np.isnan(with_missing)], 55, 3)
+    # a missing value within an episode does not split it
+    bg_array = np.array([100, 40, 40, np.nan, 40, 40, 100, 40, 40, np.nan, 100])
+    assert episodes(bg_array, 54, 4) == 0
+    assert episodes(bg_array, 54, 4, ignore_nan=True) == 1
+    assert np.array_equal(episodes(np.stack([bg_array, bg_array]), 54, 4, axis=1, ignore_nan=True), [1, 1])
+
+
+def test_timed_episodes_ignore_nan():
+    minutes = np.array([0, 5, 10, 15, 20, 25, 30, 80, 85, 90, 95], dtype="timedelta64[m]")
+    timestamps = np.datetime64("2020-01-01T00:00") + minutes
+    bg_array = np.array([40, 40, np.nan, 40, 40, np.nan, 40, 40, 40, np.nan, 40])
+    assert episodes(bg_array, 54, timestamps=timestamps) == 0
+    # the missing values are bridged, but the 50 minute gap from 30 to 80 still ends the first episode
+    assert episodes(bg_array, 54, timestamps=timestamps, ignore_nan=True) == 2
+    assert episodes(bg_array, 54, timestamps=timestamps, max_gap=60, ignore_nan=True) == 1
+
+
+def test_validation_is_not_hidden_by_nan():
+    with pytest.warns(UserWarning, match="less than 38"):
+        _validate_bg(np.array([np.nan, 30.0, 100.0]))
+    with pytest.raises(Exception):
+        percent_values_lt_70(np.array([np.nan, 0.5, 2000.0]))
+    with pytest.raises(Exception):
+        summary(np.array([np.nan, 100.0, 2000.0]))
+
+
+def test_validation_report_with_nan():
+    report = glucose.validation_report(np.array([100.0, np.nan, 30, 500]))
+    assert report["n_values_lt_38"] == 1
+    assert report["n_values_gt_402"] == 1
+    assert report["n_values_lt_1"] == 0
+    assert report["n_values_gt_1000"] == 0
+    # a missing value is only valid when ignoring NaN
+    assert not report["valid"]
+    assert glucose.validation_report(np.array([100.0, np.nan, 30, 500]), ignore_nan=True)["valid"]
+    assert glucose.validation_report(np.array([np.nan, 0.5]), ignore_nan=True)["n_values_lt_1"] == 1
+    assert not glucose.validation_report(np.array([np.nan, 0.5]), ignore_nan=True)["valid"]
+    bg_matrix = np.array([[100.0, np.nan], [np.nan, np.nan], [30, 1001]])
+    report = glucose.validation_report(bg_matrix, axis=1, ignore_nan=True)
+    assert np.array_equal(report["n_values_lt_38"], [0, 0, 1])
+    assert np.array_equal(report["n_values_gt_1000"], [0, 0, 1])
+    assert np.array_equal(report["valid"], [True, True, False])
+
+
+def test_data_sufficiency():
+    bg_matrix = np.full((288, 2), 100.0)
+    bg_matrix[:72, 0] = np.nan
+    assert np.array_equal(glucose.data_sufficiency(bg_matrix, axis=0), [75, 100])
+    assert glucose.data_sufficiency(bg_matrix[:, 1], expected_n_values=576) == 50
+    # 2 readings dropped from an hour of 5 minute readings
+    timestamps = np.arange("2020-01-01T00:00", "2020-01-01T01:05", np.timedelta64(5, "m"), dtype="datetime64[m]")
+    timestamps = np.delete(timestamps, [3, 4])
+    assert glucose.data_sufficiency(np.full(len(timestamps), 100.0), timestamps=timestamps) == round(11 / 13 * 100, 3)
@@ -0,0 +1,80 @@
+import numpy as np
+import operator
+import pytest
+from tidepool_data_science_metrics.common import common
+from tidepool_data_science_metrics.glucose import glucose
+from tidepool_data_science_metrics.glucose.histogram import GlucoseHistogram
+
+
+@pytest.mark.parametrize(
+    "metric, bounds",
+    [
+        (glucose.percent_values_lt_40, (1, 40, operator.ge, operator.lt)),
+        (glucose.percent_values_lt_54, (1, 54, operator.ge, operator.lt)),
+        (glucose.percent_values_lt_70, (1, 70, operator.ge, operator.lt)),
+        (glucose.percent_values_ge_70_le_180, (70, 180, operator.ge, operator.le)),
+        (glucose.percent_values_gt_180, (180, 1000, operator.gt, operator.lt)),
+        (glucose.percent_values_gt_250, (250, 1000, operator.gt, operator.lt)),
+        (glucose.percent_values_gt_300, (300, 1000, operator.gt, operator.lt)),
+        (glucose.percent_values_gt_400, (400, 1000, operator.gt, operator.lt)),
+    ],
+)
+def test_histogram_range_percentages(bg_array, metric, bounds):
+    histogram = GlucoseHistogram.from_values(bg_array)
+    assert histogram.percent_values_by_range(*bounds) == metric(bg_array)
+
+
+def test_histogram_metrics(bg_array):
+    histogram = GlucoseHistogram.from_values(bg_array)
+    assert histogram.count == 99
+    assert histogram.mean() == common.mean(bg_array)
+    assert histogram.std_deviation() == common.std_deviation(bg_array)
+    assert histogram.coefficient_of_variation() == common.coefficient_of_variation(bg_array)
+    assert histogram.glucose_management_index() == glucose.glucose_management_index(bg_array)
+    assert histogram.blood_glucose_risk_index() == glucose.blood_glucose_risk_index(bg_array)
+
+
+def test_histograms_add(bg_array):
+    bg_array = bg_array.ravel()
+    days = [GlucoseHistogram.from_values(bg_array[start : start + 24]) for start in range(0, len(bg_array), 24)]
+    assert GlucoseHistogram.merge(days) == GlucoseHistogram.from_values(bg_array)
+    assert days[0] + days[1] == GlucoseHistogram.from_values(bg_array[:48])
+    assert (days[0] + days[1]).mean() == common.mean(bg_array[:48])
+
+
+def test_histogram_along_axis(bg_matrix):
+    bg_matrix = np.rint(bg_matrix)
+    histogram = GlucoseHistogram.from_values(bg_matrix, axis=0)
+    assert histogram.counts.shape == (100, 1001)
+    assert np.array_equal(histogram.mean(), common.mean(bg_matrix, axis=0))
+    assert np.array_equal(
+        histogram.percent_values_by_range(70, 180, upper_bound_operator=operator.le),
+        glucose.percent_values_ge_70_le_180(bg_matrix, axis=0),
+    )
+    assert histogram.count[0] == 96
+
+
+def test_histogram_rounds_float_values():
+    histogram = GlucoseHistogram.from_values(np.array([69.6, 70.4, 180.2]))
+    assert histogram.counts[70] == 2
+    assert histogram.counts[180] == 1
+
+
+def test_histogram_invalid_counts():
+    with pytest.raises(Exception) as excinfo:
+        GlucoseHistogram(np.zeros(400))
+    assert "counts must have one bin for every integer glucose value from 0 to 1000." in str(excinfo.value)
+
+
+def test_histogram_ignore_nan(bg_matrix):
+    bg_matrix = np.rint(bg_matrix)
+    bg_matrix[::7, 0] = np.nan
+    with pytest.raises(Exception) as excinfo:
+        GlucoseHistogram.from_values(bg_matrix, axis=0)
+    assert "Some values in the passed in array are NaN, set ignore_nan to leave them out." in str(excinfo.value)
+    histogram = GlucoseHistogram.from_values(bg_matrix, axis=0, ignore_nan=True)
+    assert histogram.n_missing[0] == len(range(0, bg_matrix.shape[0], 7))
+    assert histogram.count[0] + histogram.n_missing[0] == bg_matrix.shape[0]
+    assert np.array_equal(histogram.mean(), common.mean(bg_matrix, axis=0, ignore_nan=True))
+    merged = GlucoseHistogram.merge([histogram, histogram])
+    assert np.array_equal(merged.n_missing, 2 * histogram.n_missing)
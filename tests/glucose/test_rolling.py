@@ -0,0 +1,93 @@
+import functools
+import numpy as np
+import operator
+import pytest
+from tidepool_data_science_metrics.common import common
+from tidepool_data_science_metrics.glucose import glucose
+from tidepool_data_science_metrics.glucose.rolling import (
+    rolling_percent_values_by_range,
+    rolling_mean,
+    rolling_std_deviation,
+    rolling_coefficient_of_variation,
+    rolling_glucose_management_index,
+)
+
+
+def test_rolling_percent_values_by_range(bg_array):
+    bg_array = bg_array.ravel()
+    percent = rolling_percent_values_by_range(bg_array, 12, 70, 180, upper_bound_operator=operator.le)
+    expected = [glucose.percent_values_ge_70_le_180(bg_array[end - 11 : end + 1]) for end in range(11, len(bg_array))]
+    assert np.array_equal(percent, expected)
+
+
+@pytest.mark.parametrize(
+    "rolling_metric, metric",
+    [
+        (rolling_mean, common.mean),
+        (rolling_std_deviation, common.std_deviation),
+        (rolling_coefficient_of_variation, common.coefficient_of_variation),
+        (rolling_glucose_management_index, glucose.glucose_management_index),
+    ],
+)
+def test_rolling_metrics_match_each_window(bg_matrix, rolling_metric, metric):
+    bg_array = bg_matrix[:, 95]
+    values = rolling_metric(bg_array, 24, step=5)
+    expected = [metric(bg_array[end - 23 : end + 1]) for end in range(23, len(bg_array), 5)]
+    assert np.array_equal(values, expected)
+
+
+def test_rolling_metrics_along_axis(bg_matrix):
+    values = rolling_coefficient_of_variation(bg_matrix, 36, step=12, axis=0)
+    assert values.shape == (len(range(35, bg_matrix.shape[0], 12)), bg_matrix.shape[1])
+    for col in [0, 42, 99]:
+        assert np.array_equal(values[:, col], rolling_coefficient_of_variation(bg_matrix[:, col], 36, step=12))
+    assert np.array_equal(rolling_mean(bg_matrix.T, 36, axis=1), rolling_mean(bg_matrix, 36, axis=0).T)
+
+
+def test_rolling_time_windows():
+    timestamps = np.datetime64("2020-01-01T00:00") + np.array([0, 5, 10, 30, 35, 40], dtype="timedelta64[m]")
+    bg_array = np.array([60, 100, 100, 60, 60, 100])
+    percent = rolling_percent_values_by_range(bg_array, 15, 70, 180, timestamps=timestamps, round_to_n_digits=1)
+    # each window covers the 15 minutes up to and including the value it ends at
+    assert np.array_equal(percent, [0, 50, 66.7, 0, 0, 33.3])
+    means = rolling_mean(np.stack([bg_array, bg_array[::-1]], axis=1), 15, timestamps=timestamps, axis=0)
+    assert np.array_equal(means[:, 0], [60, 80, 86.67, 60, 60, 73.33])
+    assert np.array_equal(means[:, 1], [100, 80, 73.33, 100, 100, 86.67])
+
+
+def test_rolling_invalid_window(bg_array):
+    with pytest.raises(Exception) as excinfo:
+        rolling_mean(bg_array, 0)
+    assert "window and step must be positive." in str(excinfo.value)
+
+
+@pytest.mark.parametrize(
+    "rolling_metric, metric",
+    [
+        (rolling_mean, common.mean),
+        (rolling_std_deviation, common.std_deviation),
+        (rolling_coefficient_of_variation, common.coefficient_of_variation),
+        (rolling_glucose_management_index, glucose.glucose_management_index),
+        (
+            functools.partial(
+                rolling_percent_values_by_range, lower_bound=70, upper_bound=180, upper_bound_operator=operator.le
+            ),
+            glucose.percent_values_ge_70_le_180,
+        ),
+    ],
+)
+def test_rolling_metrics_ignore_nan(bg_matrix, rolling_metric, metric):
+    bg_array = bg_matrix[:100, 95].astype(float)
+    bg_array[[3, 40, 41]] = np.nan
+    values = rolling_metric(bg_array, 12, ignore_nan=True)
+    expected = [metric(bg_array[end - 11 : end + 1], ignore_nan=True) for end in range(11, len(bg_array))]
+    assert np.array_equal(values, expected)
+
+
+def test_rolling_nan_only_affects_its_windows(bg_matrix):
+    bg_array = bg_matrix[:100, 95].astype(float)
+    bg_array[3] = np.nan
+    values = rolling_mean(bg_array, 12)
+    # the windows ending at values 11 to 14 contain value 3
+    assert np.all(np.isnan(values[:4]))
+    assert np.array_equal(values[4:], rolling_mean(bg_array[4:], 12))
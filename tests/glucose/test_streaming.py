@@ -0,0 +1,119 @@
+import json
+import numpy as np
+import pytest
+from tidepool_data_science_metrics.glucose.glucose import summary
+from tidepool_data_science_metrics.glucose.streaming import GlucoseAccumulator
+
+
+def test_accumulator_one_value_at_a_time(bg_array):
+    accumulator = GlucoseAccumulator()
+    for bg in bg_array:
+        accumulator.update(bg)
+    assert accumulator.summary() == summary(bg_array)
+
+
+def test_accumulator_batches(bg_matrix):
+    bg_array = bg_matrix[:, 3]
+    accumulator = GlucoseAccumulator(episodes_threshold=70, min_ct_per_ep=4)
+    for batch in np.array_split(bg_array, [1, 2, 10, 50, 51]):
+        accumulator.update(batch)
+    assert accumulator.summary(round_to_n_digits=2) == summary(
+        bg_array, episodes_threshold=70, min_ct_per_ep=4, round_to_n_digits=2
+    )
+
+
+def test_accumulator_episodes_across_updates(get_episodes_array):
+    bg_array = get_episodes_array.astype(float).ravel()
+    for min_ct_per_ep in [1, 2, 3, 4, 6]:
+        expected = summary(bg_array, episodes_threshold=55, min_ct_per_ep=min_ct_per_ep)["episodes"]
+        for split in range(1, len(bg_array)):
+            accumulator = GlucoseAccumulator(episodes_threshold=55, min_ct_per_ep=min_ct_per_ep)
+            accumulator.update(bg_array[:split]).update(bg_array[split:])
+            assert accumulator.episodes_count == expected
+        accumulator = GlucoseAccumulator(episodes_threshold=55, min_ct_per_ep=min_ct_per_ep)
+        for bg in bg_array:
+            accumulator.update(bg)
+        assert accumulator.episodes_count == expected
+
+
+def test_accumulator_long_episode_is_counted_once():
+    accumulator = GlucoseAccumulator(episodes_threshold=54, min_ct_per_ep=3)
+    for _ in range(10):
+        accumulator.update([40, 40])
+    assert accumulator.episodes_count == 1
+    accumulator.update([100, 40, 40, 40])
+    assert accumulator.episodes_count == 2
+
+
+def test_accumulator_merge_matches_summary(bg_matrix):
+    bg_array = bg_matrix[:, 98]
+    shards = np.array_split(bg_array, [7, 8, 40, 80])
+    accumulators = [GlucoseAccumulator.from_values(shard, episodes_threshold=88) for shard in shards]
+    merged = GlucoseAccumulator.merge_all(accumulators)
+    assert merged.summary() == summary(bg_array, episodes_threshold=88)
+    # the merge is associative
+    first, second, third, fourth, fifth = accumulators
+    left = first.merge(second).merge(third.merge(fourth)).merge(fifth)
+    right = first.merge(second.merge(third.merge(fourth))).merge(fifth)
+    assert left.summary() == right.summary() == merged.summary()
+
+
+def test_accumulator_merge_episodes_across_shards(get_episodes_array):
+    bg_array = get_episodes_array.astype(float).ravel()
+    for min_ct_per_ep in [1, 2, 3, 4, 6]:
+        expected = summary(bg_array, episodes_threshold=55, min_ct_per_ep=min_ct_per_ep)["episodes"]
+        for first in range(0, len(bg_array)):
+            for second in range(first, len(bg_array)):
+                shards = [bg_array[:first], bg_array[first:second], bg_array[second:]]
+                accumulators = [
+                    GlucoseAccumulator.from_values(shard, episodes_threshold=55, min_ct_per_ep=min_ct_per_ep)
+                    for shard in shards
+                ]
+                assert GlucoseAccumulator.merge_all(accumulators).episodes_count == expected
+
+
+def test_accumulator_merge_long_run():
+    shards = [[100, 40], [40], [40, 40], [40, 100, 40], [40]]
+    accumulators = [GlucoseAccumulator.from_values(shard, min_ct_per_ep=3) for shard in shards]
+    merged = GlucoseAccumulator.merge_all(accumulators)
+    assert merged.episodes_count == 1
+    assert merged.open_run_length == 2
+    assert GlucoseAccumulator.merge_all(accumulators[1:4]).leading_run_length == 4
+
+
+def test_accumulator_serialization(bg_array):
+    accumulator = GlucoseAccumulator.from_values(bg_array[:50])
+    state = json.loads(json.dumps(accumulator.to_dict()))
+    restored = GlucoseAccumulator.from_dict(state)
+    assert restored.summary() == accumulator.summary()
+    assert restored.update(bg_array[50:]).summary() == summary(bg_array)
+
+
+def test_accumulator_merge_different_settings():
+    with pytest.raises(Exception) as excinfo:
+        GlucoseAccumulator(episodes_threshold=54).merge(GlucoseAccumulator(episodes_threshold=70))
+    assert "Only accumulators with the same episodes_threshold, min_ct_per_ep and ignore_nan can be merged." in str(
+        excinfo.value
+    )
+
+
+def test_accumulator_integer_values_round_like_summary():
+    rng = np.random.default_rng(0)
+    for _ in range(200):
+        bg_values = rng.integers(40, 400, size=rng.integers(2, 300))
+        accumulator = GlucoseAccumulator()
+        for batch in np.array_split(bg_values, 3):
+            accumulator.update(batch)
+        assert accumulator.summary() == summary(bg_values)
+
+
+def test_accumulator_ignore_nan():
+    bg_values = np.random.default_rng(1).integers(40, 400, size=200).astype(np.float64)
+    bg_values[[3, 50, 51, 52]] = np.nan
+    bg_values[100:106] = [40, np.nan, 40, 40, np.nan, 40]
+    accumulator = GlucoseAccumulator(ignore_nan=True)
+    for batch in np.array_split(bg_values, 7):
+        accumulator.update(batch)
+    assert accumulator.summary() == summary(bg_values, ignore_nan=True)
+    restored = GlucoseAccumulator.from_dict(json.loads(json.dumps(accumulator.to_dict())))
+    assert restored.summary() == accumulator.summary()
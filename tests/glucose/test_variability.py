@@ -0,0 +1,118 @@
+import numpy as np
+import pytest
+from tidepool_data_science_metrics.glucose import glucose
+from tidepool_data_science_metrics.glucose.variability import (
+    mean_amplitude_of_glycemic_excursions,
+    continuous_overall_net_glycemic_action,
+    mean_of_daily_differences,
+    j_index,
+    average_daily_risk_range,
+    glycemic_risk_assessment_diabetes_equation,
+    variability_summary,
+)
+
+
+@pytest.fixture
+def three_days():
+    rng = np.random.default_rng(0)
+    n_values = 3 * 288
+    daily_cycle = 60 * np.sin(np.arange(n_values) / 288 * 2 * np.pi)
+    bg_matrix = 140 + daily_cycle[:, np.newaxis] + np.cumsum(rng.normal(0, 3, size=(n_values, 4)), axis=0)
+    return np.clip(np.round(bg_matrix), 40, 400)
+
+
+def _reference_mage(bg_values, short_window=5, long_window=32):
+    def moving_average(window):
+        return np.array([np.mean(bg_values[max(0, i - window + 1) : i + 1]) for i in range(len(bg_values))])
+
+    is_above = moving_average(short_window) > moving_average(long_window)
+    parts, part = [], [0]
+    for i in range(1, len(bg_values)):
+        if is_above[i] != is_above[i - 1]:
+            parts.append(part)
+            part = []
+        part.append(i)
+    parts.append(part)
+    extremes = [max(bg_values[part]) if is_above[part[0]] else min(bg_values[part]) for part in parts[1:-1]]
+    amplitudes = [abs(b - a) for a, b in zip(extremes, extremes[1:])]
+    return np.mean([amplitude for amplitude in amplitudes if amplitude > np.std(bg_values)])
+
+
+def _reference_adrr(bg_values):
+    daily_risk_ranges = []
+    for day in range(0, len(bg_values), 288):
+        transformed_bg = 1.509 * (np.log(bg_values[day : day + 288]) ** 1.084 - 5.381)
+        risk = 10 * transformed_bg ** 2
+        daily_risk_ranges.append(np.max(risk * (transformed_bg < 0)) + np.max(risk * (transformed_bg > 0)))
+    return np.mean(daily_risk_ranges)
+
+
+def test_indices_match_reference_definitions(three_days):
+    bg_values = three_days[:, 0]
+    assert mean_amplitude_of_glycemic_excursions(bg_values) == np.round(_reference_mage(bg_values), 2)
+    one_hour_differences = [bg_values[i] - bg_values[i - 12] for i in range(12, len(bg_values))]
+    assert continuous_overall_net_glycemic_action(bg_values) == np.round(np.std(one_hour_differences, ddof=1), 2)
+    daily_differences = [abs(bg_values[i] - bg_values[i - 288]) for i in range(288, len(bg_values))]
+    assert mean_of_daily_differences(bg_values) == np.round(np.mean(daily_differences), 2)
+    assert j_index(bg_values) == np.round(0.001 * (np.mean(bg_values) + np.std(bg_values)) ** 2, 2)
+    assert np.isclose(average_daily_risk_range(bg_values), _reference_adrr(bg_values), atol=0.011)
+    grade = [min(425 * (np.log10(np.log10(bg / 18)) + 0.16) ** 2, 50) for bg in bg_values]
+    assert glycemic_risk_assessment_diabetes_equation(bg_values) == np.round(np.mean(grade), 2)
+
+
+def test_grade_at_and_below_1_mmol_l(recwarn):
+    # readings at or below 18 mg/dL (1 mmol/L) take the cap of 50
+    bg_values = np.array([10, 18, 100, 200, 300] * 10)
+    grade = glycemic_risk_assessment_diabetes_equation(bg_values, validate=False)
+    expected = [50, 50] + [min(425 * (np.log10(np.log10(bg / 18)) + 0.16) ** 2, 50) for bg in [100, 200, 300]]
+    assert grade == np.round(np.mean(expected), 2)
+    assert len(recwarn) == 0
+
+
+def test_mage_of_a_known_trace():
+    # a 6 hour cycle between 90 and 190 mg/dL with sensor noise has excursions of about 100 mg/dL
+    noise = np.random.default_rng(1).normal(0, 2, size=3 * 288)
+    bg_values = 140 + 50 * np.sin(np.arange(3 * 288) / 72 * 2 * np.pi) + noise
+    assert 95 < mean_amplitude_of_glycemic_excursions(bg_values) < 110
+
+
+def test_indices_along_axis(three_days):
+    summary = variability_summary(three_days, axis=0)
+    functions = {
+        "mage": mean_amplitude_of_glycemic_excursions,
+        "conga": continuous_overall_net_glycemic_action,
+        "modd": mean_of_daily_differences,
+        "j_index": j_index,
+        "adrr": average_daily_risk_range,
+        "grade": glycemic_risk_assessment_diabetes_equation,
+    }
+    for name, function in functions.items():
+        expected = [function(three_days[:, col]) for col in range(three_days.shape[1])]
+        assert np.array_equal(function(three_days, axis=0), expected), name
+        assert np.array_equal(function(three_days.T, axis=1), expected), name
+        assert np.array_equal(summary[name], expected), name
+
+
+def test_adrr_days_from_timestamps(three_days):
+    bg_values = three_days[:, 0]
+    timestamps = np.arange("2020-01-01", "2020-01-04", np.timedelta64(5, "m"), dtype="datetime64[m]")
+    assert average_daily_risk_range(bg_values, timestamps=timestamps) == average_daily_risk_range(bg_values)
+    # starting at noon splits the values into 4 calendar days
+    shifted = timestamps + np.timedelta64(12, "h")
+    expected_days = [bg_values[:144], bg_values[144:432], bg_values[432:720], bg_values[720:]]
+    rl_rh = [glucose._risk_values(day) for day in expected_days]
+    expected = np.mean([np.max(rl) + np.max(rh) for rl, rh in rl_rh])
+    assert average_daily_risk_range(bg_values, timestamps=shifted) == np.round(expected, 2)
+
+
+def test_indices_ignore_nan(three_days):
+    with_missing = three_days.copy()
+    with_missing[100:130, 1] = np.nan
+    summary = variability_summary(with_missing, axis=0, ignore_nan=True)
+    valid = with_missing[~np.isnan(with_missing[:, 1]), 1]
+    assert not np.isnan(summary["mage"][1])
+    assert summary["j_index"][1] == j_index(valid)
+    assert summary["grade"][1] == glycemic_risk_assessment_diabetes_equation(valid)
+    assert not np.isnan(summary["modd"][1]) and not np.isnan(summary["conga"][1])
+    assert np.array_equal(summary["adrr"][[0, 2, 3]], average_daily_risk_range(three_days[:, [0, 2, 3]], axis=0))
+    assert np.isnan(variability_summary(with_missing, axis=0)["j_index"][1])
@@ -0,0 +1,55 @@
+import json
+import numpy as np
+import pytest
+from tidepool_data_science_metrics.glucose import glucose
+from tidepool_data_science_metrics.instrumentation import instrumentation
+
+
+@pytest.fixture(autouse=True)
+def clean_instrumentation():
+    instrumentation.disable()
+    instrumentation.reset()
+    yield
+    instrumentation.disable()
+    instrumentation.reset()
+
+
+def test_nothing_recorded_when_disabled():
+    glucose.percent_values_lt_70(np.array([60, 80, 100]))
+    assert instrumentation.snapshot() == {}
+
+
+def test_profile_records_calls_samples_and_time():
+    bg_array = np.array([60, 80, 100, 120])
+    with instrumentation.profile():
+        glucose.percent_values_lt_70(bg_array)
+        glucose.percent_values_lt_70(bg_array)
+    assert not instrumentation.is_enabled()
+    stats = instrumentation.snapshot()
+    assert stats["glucose.percent_values_lt_70"]["calls"] == 2
+    assert stats["glucose.percent_values_lt_70"]["samples"] == 8
+    assert stats["glucose.percent_values_lt_70"]["seconds"] > 0
+    # the hot path stages are recorded separately
+    assert stats["glucose.percent_values_by_range"]["calls"] == 2
+    assert stats["glucose._validate_bg"]["calls"] == 2
+
+
+def test_validation_warnings_are_counted_against_the_running_functions():
+    with instrumentation.profile():
+        with pytest.warns(UserWarning):
+            glucose.percent_values_lt_70(np.array([30, 100, 450]))
+        glucose.glucose_management_index(np.array([100, 150]))
+    stats = instrumentation.snapshot()
+    assert stats["glucose._validate_bg"]["validation_warnings"] == 2
+    assert stats["glucose.percent_values_lt_70"]["validation_warnings"] == 2
+    assert stats["glucose.glucose_management_index"]["validation_warnings"] == 0
+
+
+def test_exports():
+    with instrumentation.profile():
+        glucose.glucose_management_index(np.array([100, 150]))
+    assert json.loads(instrumentation.to_json()) == instrumentation.snapshot()
+    prometheus = instrumentation.to_prometheus()
+    assert "# TYPE tidepool_metrics_calls_total counter" in prometheus
+    assert 'tidepool_metrics_calls_total{function="glucose.glucose_management_index"} 1' in prometheus
+    assert 'tidepool_metrics_samples_total{function="glucose.glucose_management_index"} 2' in prometheus
@@ -2,8 +2,13 @@ import pytest
 import numpy as np
 from tidepool_data_science_metrics.insulin.insulin import (
     approximate_steady_state_iob_from_sbr,
+    delivered_insulin,
     dka_index,
     dka_risk_score,
+    dka_risk_score_counts,
+    exponential_insulin_remaining,
+    insulin_on_board,
+    steady_state_iob,
 )
 
 def test_dka_index_with_zero_iob():
@@ -29,3 +34,105 @@ def test_dkai_risk_scores():
     for dkai, dkai_score in zip(dkai_array, dkai_rs):
         dkai_risk_score_val = dka_risk_score(dkai)
         assert dkai_risk_score_val == dkai_score
+    assert np.array_equal(dka_risk_score(dkai_array), dkai_rs)
+    assert np.array_equal(dka_risk_score_counts(dkai_array), [2, 2, 2, 3, 2])
+
+
+def test_dka_index_with_basal_schedule():
+    # a day of 5 minute samples with a steady iob of 1 U, which is below 50% of the steady state iob of a
+    # 1.2 U/hr basal rate (from 06:00 to 22:00), but not of a 0.8 U/hr basal rate (the rest of the day)
+    iob_array = np.ones(288)
+    basal_schedule = [("06:00", 1.2), ("00:00", 0.8), ("22:00", 0.8)]
+    assert dka_index(iob_array, basal_schedule=basal_schedule) == 16
+
+
+def test_dka_index_with_irregular_timestamps():
+    timestamps = np.array(
+        ["2020-01-01T00:00", "2020-01-01T00:05", "2020-01-01T01:05", "2020-01-01T01:10"], dtype="datetime64"
+    )
+    iob_array = np.array([0, 0, 0, 5])
+    # each value counts for the time until the next value, at most max_gap minutes
+    assert dka_index(iob_array, 1.0, timestamps=timestamps) == round(25 / 60, 3)
+    assert dka_index(iob_array, 1.0, timestamps=timestamps, max_gap=60) == round(70 / 60, 3)
+
+
+def test_dka_index_schedule_wraps_around_midnight():
+    timestamps = np.arange("2020-01-01T20:00", "2020-01-02T04:00", np.timedelta64(5, "m"), dtype="datetime64[m]")
+    iob_array = np.ones(len(timestamps))
+    basal_schedule = [(2 * 60, 0.5), (21 * 60, 1.5)]
+    # 1.5 U/hr from 21:00 until 02:00 the next day
+    assert dka_index(iob_array, basal_schedule=basal_schedule, timestamps=timestamps) == 5
+
+
+def test_dka_index_patient_by_time_matrix():
+    rng = np.random.default_rng(0)
+    iob_matrix = rng.uniform(0, 3, size=(4, 288))
+    basal_rates = np.array([0.5, 1.0, 1.5, 2.0])
+    dka_indices = dka_index(iob_matrix, basal_rates, axis=1)
+    assert np.array_equal(dka_indices, [dka_index(iob, rate) for iob, rate in zip(iob_matrix, basal_rates)])
+    basal_schedule = [("00:00", 0.8), ("12:00", 1.6)]
+    dka_indices = dka_index(iob_matrix, basal_schedule=basal_schedule, axis=1)
+    assert np.array_equal(dka_indices, [dka_index(iob, basal_schedule=basal_schedule) for iob in iob_matrix])
+
+
+def test_dka_index_requires_a_basal_rate():
+    with pytest.raises(Exception):
+        dka_index(np.ones(12))
+
+
+def test_delivered_insulin():
+    start = np.datetime64("2020-01-01T00:00")
+    grid_times, units = delivered_insulin(
+        start,
+        start + np.timedelta64(30, "m"),
+        bolus_times=np.array(["2020-01-01T00:07", "2020-01-01T00:09", "2020-01-01T01:00"], dtype="datetime64"),
+        bolus_units=np.array([1.0, 2.0, 5.0]),
+        basal_start_times=np.array(["2019-12-31T23:00", "2020-01-01T00:12"], dtype="datetime64"),
+        basal_end_times=np.array(["2020-01-01T00:20", "2020-01-01T00:18"], dtype="datetime64"),
+        basal_rates=np.array([0.6, 1.2]),
+    )
+    assert len(grid_times) == 6
+    assert grid_times[1] == np.datetime64("2020-01-01T00:05")
+    # 0.6 U/hr is 0.05 U per 5 minutes, the 1.2 U/hr temp basal adds 0.1 U per 5 minutes from 00:12 to 00:18
+    expected = [0.05, 0.05 + 3, 0.05 + 0.06, 0.05 + 0.06, 0, 0]
+    assert np.allclose(units, expected)
+
+
+def test_insulin_on_board_matches_direct_convolution():
+    delivered = np.random.default_rng(0).exponential(0.2, size=500)
+    curve = exponential_insulin_remaining(np.arange(0, 360, 5))
+    expected = np.convolve(delivered, curve)[: len(delivered)]
+    assert np.allclose(insulin_on_board(delivered), expected)
+
+
+def test_insulin_on_board_reaches_steady_state():
+    delivered = np.full(24 * 12, 1.5 * 5 / 60)  # a day of 1.5 U/hr basal
+    iob = insulin_on_board(delivered, insulin_model="linear")
+    assert np.isclose(iob[-1], steady_state_iob(1.5, insulin_model="linear"))
+    # a linear curve over 6 hours leaves half of the insulin of those 6 hours on board
+    assert np.isclose(steady_state_iob(1.5, insulin_model="linear", sample_minutes=1 / 60), 1.5 * 3, rtol=1e-4)
+
+
+def test_insulin_on_board_patient_by_time_matrix():
+    delivered = np.random.default_rng(1).exponential(0.2, size=(3, 400))
+    iob = insulin_on_board(delivered, axis=1)
+    for patient in range(3):
+        assert np.allclose(iob[patient], insulin_on_board(delivered[patient]))
+
+
+def test_insulin_on_board_custom_and_unknown_models():
+    delivered = np.zeros(10)
+    delivered[0] = 1
+    iob = insulin_on_board(delivered, insulin_model=lambda minutes: np.exp(-minutes / 60), action_duration=30)
+    # the dose is on board for the 6 samples of the 30 minute action duration
+    assert np.allclose(iob, np.where(np.arange(10) < 6, np.exp(-np.arange(10) * 5 / 60), 0))
+    with pytest.raises(Exception):
+        insulin_on_board(delivered, insulin_model="walsh")
+
+
+def test_dka_index_with_steady_state_from_insulin_model():
+    delivered = np.full(2 * 24 * 12, 1.0 * 5 / 60)
+    delivered[24 * 12 : 24 * 12 + 36] = 0  # a 3 hour pump suspension on the second day
+    iob = insulin_on_board(delivered)[24 * 12 :]
+    assert dka_index(iob, 1.0, insulin_model="exponential") > 0
+    assert dka_index(iob[-12:], 1.0, insulin_model="exponential") == 0
@@ -0,0 +1,63 @@
+import numpy as np
+import pytest
+from tidepool_data_science_metrics.common import common
+from tidepool_data_science_metrics.glucose import glucose
+from tidepool_data_science_metrics.loaders.loaders import load, load_npy, iter_blocks
+
+
+def test_load_npy_is_memory_mapped(bg_matrix, tmp_path):
+    path = str(tmp_path / "bg_matrix.npy")
+    np.save(path, bg_matrix)
+    bg_map = load(path)
+    assert isinstance(bg_map, np.memmap)
+    assert not bg_map.flags.writeable
+    assert np.array_equal(glucose.percent_values_lt_70(bg_map, axis=0), glucose.percent_values_lt_70(bg_matrix, axis=0))
+    assert not isinstance(load_npy(path, mmap=False), np.memmap)
+
+
+def test_load_arrow_is_zero_copy(bg_matrix, tmp_path):
+    pa = pytest.importorskip("pyarrow")
+    path = str(tmp_path / "bg.arrow")
+    table = pa.table({"a": bg_matrix[:, 0], "b": bg_matrix[:, 1]})
+    with pa.ipc.new_file(path, table.schema) as writer:
+        writer.write_table(table)
+    columns = load(path, columns=["b"])
+    assert list(columns) == ["b"]
+    assert not columns["b"].flags.owndata
+    assert common.mean(columns["b"]) == common.mean(bg_matrix[:, 1])
+
+
+def test_load_arrow_with_missing_values(tmp_path):
+    pa = pytest.importorskip("pyarrow")
+    path = str(tmp_path / "bg.arrow")
+    table = pa.table({"bg": pa.array([100.0, None, 120.0])})
+    with pa.ipc.new_file(path, table.schema) as writer:
+        writer.write_table(table)
+    bg_array = load(path)["bg"]
+    assert np.isnan(bg_array[1])
+    assert bg_array[2] == 120
+
+
+def test_load_parquet(bg_matrix, tmp_path):
+    pa = pytest.importorskip("pyarrow")
+    pq = pytest.importorskip("pyarrow.parquet")
+    path = str(tmp_path / "bg.parquet")
+    pq.write_table(pa.table({"a": bg_matrix[:, 0], "b": bg_matrix[:, 1]}), path)
+    columns = load(path)
+    assert np.array_equal(columns["a"], bg_matrix[:, 0])
+    assert np.array_equal(columns["b"], bg_matrix[:, 1])
+
+
+def test_load_unsupported_file_type():
+    with pytest.raises(Exception) as excinfo:
+        load("bg.xlsx")
+    assert "Unsupported file type .xlsx" in str(excinfo.value)
+
+
+def test_iter_blocks(bg_matrix):
+    blocks = list(iter_blocks(bg_matrix, 30))
+    assert [block.shape[1] for block in blocks] == [30, 30, 30, 10]
+    assert all(np.shares_memory(block, bg_matrix) for block in blocks)
+    assert np.array_equal(
+        np.concatenate([common.mean(block, axis=0) for block in blocks]), common.mean(bg_matrix, axis=0)
+    )
@@ -0,0 +1,103 @@
+import numpy as np
+import pytest
+from tidepool_data_science_metrics.common import common
+from tidepool_data_science_metrics.glucose import glucose, variability
+from tidepool_data_science_metrics.insulin import insulin
+from tidepool_data_science_metrics.planner import planner
+
+
+@pytest.fixture
+def three_days():
+    rng = np.random.default_rng(0)
+    n_values = 3 * 288
+    daily_cycle = 60 * np.sin(np.arange(n_values) / 288 * 2 * np.pi)
+    bg_matrix = 140 + daily_cycle[:, np.newaxis] + np.cumsum(rng.normal(0, 8, size=(n_values, 4)), axis=0)
+    return np.clip(np.round(bg_matrix), 40, 400)
+
+
+def test_plan_computes_each_intermediate_once_and_releases_it_after_its_last_use():
+    steps = planner.plan(["coefficient_of_variation", "percent_values_lt_70", "j_index"])
+    names = [step.name for step in steps]
+    assert names.count("std") == 1
+    assert names.count("rows") == 1
+    released = {}
+    for i, step in enumerate(steps):
+        for name in step.release:
+            released[name] = i
+    # every intermediate is released exactly once, at its last use
+    assert set(released) == {step.name for step in steps if step.kind == "intermediate"}
+    assert released["sorted"] == names.index("threshold_counts")
+    assert released["std"] == names.index("j_index")
+    assert "risk" not in names
+
+
+def test_unknown_metric():
+    with pytest.raises(Exception):
+        planner.plan(["time_in_orbit"])
+
+
+def test_compute_matches_individual_functions(three_days):
+    results = planner.compute(three_days, axis=0)
+    np.testing.assert_array_equal(results["mean"], common.mean(three_days, axis=0))
+    np.testing.assert_array_equal(results["std_deviation"], common.std_deviation(three_days, axis=0))
+    np.testing.assert_array_equal(
+        results["coefficient_of_variation"], common.coefficient_of_variation(three_days, axis=0)
+    )
+    np.testing.assert_array_equal(
+        results["glucose_management_index"], glucose.glucose_management_index(three_days, axis=0)
+    )
+    for name in planner.registered_metrics():
+        if name.startswith("percent_values"):
+            np.testing.assert_array_equal(results[name], getattr(glucose, name)(three_days, axis=0))
+    lbgi, hbgi, bgri = glucose.blood_glucose_risk_index(three_days, axis=0)
+    np.testing.assert_array_equal(results["lbgi"], lbgi)
+    np.testing.assert_array_equal(results["hbgi"], hbgi)
+    np.testing.assert_array_equal(results["bgri"], bgri)
+    np.testing.assert_array_equal(results["lbgi_risk_score"], glucose.lbgi_risk_score(lbgi))
+    np.testing.assert_array_equal(results["episodes"], glucose.episodes(three_days, 54, axis=0))
+    for name, value in variability.variability_summary(three_days, axis=0).items():
+        np.testing.assert_array_equal(results[name], value)
+    assert "dka_index" not in results
+
+
+@pytest.mark.parametrize("ignore_nan", [False, True])
+def test_compute_ranges_match_summary(three_days, ignore_nan):
+    bg_matrix = three_days.copy()
+    bg_matrix[:, 1] += 0.4
+    bg_matrix[5, 2] = 69.6
+    if ignore_nan:
+        bg_matrix[10:20, 0] = np.nan
+    names = list(glucose._PERCENT_RANGES) + list(glucose._COUNT_RANGES)
+    results = planner.compute(bg_matrix, names, axis=0, ignore_nan=ignore_nan)
+    summary = glucose.summary(bg_matrix, axis=0, ignore_nan=ignore_nan)
+    for name in names:
+        np.testing.assert_array_equal(results[name], summary[name])
+
+
+def test_compute_insulin_metrics(three_days):
+    iob_matrix = np.abs(np.sin(np.arange(three_days.size) / 50)).reshape(three_days.shape) * 2
+    results = planner.compute(three_days, axis=0, iob_array=iob_matrix, scheduled_basal_rate=1.0)
+    dka_index = insulin.dka_index(iob_matrix, 1.0, axis=0)
+    np.testing.assert_array_equal(results["dka_index"], dka_index)
+    np.testing.assert_array_equal(results["dka_risk_score"], insulin.dka_risk_score(dka_index))
+    with pytest.raises(Exception):
+        planner.compute(three_days, ["dka_index"], axis=0)
+
+
+def test_compute_selected_metrics_of_one_series(three_days):
+    bg_values = three_days[:, 0].copy()
+    bg_values[10:20] = np.nan
+    results = planner.compute(bg_values, ["percent_values_lt_70", "count"], ignore_nan=True)
+    assert set(results) == {"percent_values_lt_70", "count"}
+    assert results["count"] == len(bg_values) - 10
+    assert results["percent_values_lt_70"] == glucose.percent_values_lt_70(bg_values, ignore_nan=True)
+
+
+def test_register_metric():
+    planner.register_metric("median", requires=("sorted", "n_values"))(
+        lambda context, sorted_rows, n_values: sorted_rows[np.arange(len(sorted_rows)), n_values // 2]
+    )
+    try:
+        assert planner.compute(np.array([120, 80, 100]), ["median"])["median"] == 100
+    finally:
+        del planner._METRICS["median"]
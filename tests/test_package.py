@@ -0,0 +1,56 @@
+import json
+import subprocess
+import sys
+from pathlib import Path
+
+
+def _run(script):
+    # a fresh interpreter, so the modules imported by the other tests do not count
+    output = subprocess.run(
+        [sys.executable, "-c", script],
+        check=True,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        universal_newlines=True,
+        cwd=Path(__file__).parent.parent,
+    ).stdout
+    return json.loads(output)
+
+
+def test_package_import_loads_no_submodules():
+    loaded = _run(
+        "import json, sys; import tidepool_data_science_metrics; "
+        "print(json.dumps([name for name in sys.modules if name.startswith('tidepool_data_science_metrics.')]))"
+    )
+    assert loaded == []
+
+
+def test_core_metrics_do_not_import_optional_dependencies():
+    loaded = _run(
+        "import json, sys; import tidepool_data_science_metrics.insulin.insulin; "  # also imports glucose and common
+        "print(json.dumps(sorted({'pandas', 'pyarrow', 'numba'} & set(sys.modules))))"
+    )
+    assert loaded == []
+
+
+def test_calling_core_metrics_does_not_import_optional_dependencies():
+    loaded = _run(
+        "import json, sys; import numpy as np; import tidepool_data_science_metrics as metrics; "
+        "bg_array = np.array([100, 120]); metrics.glucose.summary(bg_array); metrics.common.mean(bg_array); "
+        "metrics.insulin.dka_index(np.array([1.0]), 1.0); "
+        "print(json.dumps(sorted({'pandas', 'pyarrow', 'numba'} & set(sys.modules))))"
+    )
+    assert loaded == []
+
+
+def test_attributes_are_the_metric_modules():
+    names = _run(
+        "import json; import tidepool_data_science_metrics as metrics; "
+        "import tidepool_data_science_metrics.insulin.insulin; "  # also imports the glucose subpackage
+        "print(json.dumps([metrics.glucose.__name__, metrics.insulin.__name__, metrics.planner.__name__]))"
+    )
+    assert names == [
+        "tidepool_data_science_metrics.glucose.glucose",
+        "tidepool_data_science_metrics.insulin.insulin",
+        "tidepool_data_science_metrics.planner.planner",
+    ]
@@ -1,3 +1,48 @@
-from tidepool_data_science_metrics.glucose import glucose
-from tidepool_data_science_metrics.common import common
-from tidepool_data_science_metrics.insulin import insulin
+"""
+The metric modules are loaded lazily, so importing the package costs little until a module is used:
+tidepool_data_science_metrics.glucose imports glucose.glucose on first access. Optional dependencies (pandas for
+cohort.run_cohort, pyarrow for the Arrow and Parquet loaders, numba for the numba backend) are only imported by the
+functions that need them, never by the core metrics.
+"""
+import importlib
+import sys
+import types
+
+# the module each package attribute loads on first access
+_SUBMODULES = {
+    "glucose": "tidepool_data_science_metrics.glucose.glucose",
+    "common": "tidepool_data_science_metrics.common.common",
+    "insulin": "tidepool_data_science_metrics.insulin.insulin",
+    "cohort": "tidepool_data_science_metrics.cohort.cohort",
+    "loaders": "tidepool_data_science_metrics.loaders.loaders",
+    "instrumentation": "tidepool_data_science_metrics.instrumentation.instrumentation",
+    "planner": "tidepool_data_science_metrics.planner.planner",
+    "backends": "tidepool_data_science_metrics.backends.backends",
+    "cache": "tidepool_data_science_metrics.cache.cache",
+}
+
+__all__ = list(_SUBMODULES)
+
+
+# The lazy attributes are on the class of the package module rather than module level __getattr__ and __dir__
+# functions (PEP 562), which need python 3.7.
+class _Package(types.ModuleType):
+    def __getattr__(self, name: str) -> types.ModuleType:
+        if name not in _SUBMODULES:
+            raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+        module = importlib.import_module(_SUBMODULES[name])
+        self.__dict__[name] = module  # later lookups skip __getattr__
+        return module
+
+    def __dir__(self):
+        return sorted(set(self.__dict__) | set(_SUBMODULES))
+
+    def __setattr__(self, name, value):
+        # Importing a subpackage (e.g. tidepool_data_science_metrics.glucose, imported by every module that uses
+        # glucose.glucose) binds it to the package, which would hide the module of the same name from __getattr__.
+        if name in _SUBMODULES and getattr(value, "__name__", None) == f"{__name__}.{name}":
+            return
+        super().__setattr__(name, value)
+
+
+sys.modules[__name__].__class__ = _Package
@@ -0,0 +1,103 @@
+import contextlib
+import functools
+import importlib.util
+from typing import Callable, Iterator, List
+
+# "auto" uses numba when it is installed, and numpy otherwise. numba is opt in, since importing it and compiling the
+# kernels makes the first call of a metric take a large fraction of a second.
+_BACKENDS = ("auto", "numpy", "numba")
+_backend = "numpy"
+_numba_available = None
+
+
+def kernel(function: Callable) -> Callable:
+    """
+    Decorate the numpy implementation of a loop shaped kernel (e.g. the run lengths of the episodes), so that calls
+    use the compiled implementation of the same name in backends.numba_kernels while the numba backend is active.
+    The numpy implementation is the fallback, and both implementations return identical results.
+
+    Parameters
+    ----------
+    function : callable
+        The numpy implementation of the kernel.
+
+    Returns
+    -------
+    callable
+        The kernel, dispatching to the active backend.
+    """
+    name = function.__name__
+
+    @functools.wraps(function)
+    def wrapper(*args):
+        if get_backend() == "numba":
+            return getattr(_numba_kernels(), name)(*args)
+        return function(*args)
+
+    wrapper.numpy = function
+    return wrapper
+
+
+def set_backend(backend: str):
+    """
+    Choose the implementation of the loop shaped kernels.
+
+    Parameters
+    ----------
+    backend : str
+        "numpy", "numba" (JIT compiled, which requires numba: pip install numba), or "auto" to use numba when it
+        is installed. DEFAULT (before any call) = "numpy"
+    """
+    global _backend
+    if backend not in _BACKENDS:
+        raise Exception(f"Unknown backend {backend}, expected one of {', '.join(_BACKENDS)}.")
+    if backend == "numba" and not _has_numba():
+        raise ImportError("numba is required for the numba backend, install it with: pip install numba")
+    _backend = backend
+
+
+def get_backend() -> str:
+    """The backend the kernels run on, "numpy" or "numba"."""
+    if _backend == "auto":
+        return "numba" if _has_numba() else "numpy"
+    return _backend
+
+
+def available_backends() -> List[str]:
+    """The backends that can be used in this environment."""
+    return ["numpy", "numba"] if _has_numba() else ["numpy"]
+
+
+@contextlib.contextmanager
+def use_backend(backend: str) -> Iterator[None]:
+    """
+    Run the kernels on a backend within a with block, e.g.
+
+        with backends.use_backend("numpy"):
+            glucose.episodes(bg_array, 54)
+
+    Parameters
+    ----------
+    backend : str
+        "numpy", "numba" or "auto", see set_backend.
+    """
+    previous = _backend
+    set_backend(backend)
+    try:
+        yield
+    finally:
+        set_backend(previous)
+
+
+def _has_numba() -> bool:
+    global _numba_available
+    if _numba_available is None:
+        _numba_available = importlib.util.find_spec("numba") is not None
+    return _numba_available
+
+
+def _numba_kernels():
+    # compiled on first use, so numba is only imported when the numba backend runs
+    from tidepool_data_science_metrics.backends import numba_kernels
+
+    return numba_kernels
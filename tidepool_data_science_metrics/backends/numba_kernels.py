@@ -0,0 +1,123 @@
+"""
+JIT compiled implementations of the loop shaped kernels, used by backends.kernel while the numba backend is active.
+Each kernel takes the same arguments as its numpy implementation and returns identical results: the arithmetic is
+done in the same order, so even the floating point rounding matches, and error_model="numpy" makes 0 / 0 NaN as in
+numpy. Every kernel is a plain single threaded loop over the values of each series, so it is safe to call from the
+forked worker processes of cohort.run_cohort. The kernels are compiled on their first call in each process and not
+cached on disk, which would write into the installed package.
+"""
+import numba
+import numpy as np
+
+
+@numba.njit(error_model="numpy")
+def _run_counts(mask_rows, min_length):
+    n_series, n_values = mask_rows.shape
+    counts = np.zeros(n_series, dtype=np.int64)
+    for row in range(n_series):
+        length = 0
+        for i in range(n_values + 1):
+            if i < n_values and mask_rows[row, i]:
+                length += 1
+            else:
+                if length > 0 and length >= min_length:
+                    counts[row] += 1
+                length = 0
+    return counts
+
+
+@numba.njit(error_model="numpy")
+def _timed_run_counts(mask_rows, minute_rows, max_gap, min_duration):
+    n_series, n_values = mask_rows.shape
+    counts = np.zeros(n_series, dtype=np.int64)
+    for row in range(n_series):
+        minutes_between = np.empty(max(n_values - 1, 0))
+        for i in range(1, n_values):
+            minutes_between[i - 1] = minute_rows[row, i] - minute_rows[row, i - 1]
+        # the minutes of dropped missing values are NaN, see glucose._episode_rows
+        typical_interval = np.nanmedian(minutes_between) if n_values > 1 else 0.0
+        if np.isnan(typical_interval):
+            typical_interval = 0.0
+        run_start = -1
+        for i in range(n_values + 1):
+            continues_run = (
+                i < n_values
+                and mask_rows[row, i]
+                and run_start >= 0
+                and not minute_rows[row, i] - minute_rows[row, i - 1] > max_gap
+            )
+            if continues_run:
+                continue
+            if run_start >= 0:
+                duration = minute_rows[row, i - 1] - minute_rows[row, run_start] + typical_interval
+                if duration >= min_duration:
+                    counts[row] += 1
+                run_start = -1
+            if i < n_values and mask_rows[row, i]:
+                run_start = i
+    return counts
+
+
+@numba.njit(error_model="numpy")
+def _moving_average(row, window, ignore_nan):
+    n_values = len(row)
+    sums = np.empty(n_values)
+    counts = np.empty(n_values, dtype=np.int64)
+    total = 0.0
+    count = 0
+    for i in range(n_values):
+        if not (ignore_nan and np.isnan(row[i])):
+            total += row[i]
+            count += 1
+        sums[i] = total
+        counts[i] = count
+    averages = np.empty(n_values)
+    for i in range(n_values):
+        if i >= window:
+            averages[i] = (sums[i] - sums[i - window]) / (counts[i] - counts[i - window])
+        else:
+            averages[i] = sums[i] / counts[i]
+    return averages
+
+
+@numba.njit(error_model="numpy")
+def _extreme(values, is_peak, ignore_nan):
+    # the max (peak) or min (nadir) of the values, NaN if any value is NaN (or, ignoring NaN, if every value is)
+    extreme = np.nan
+    for value in values:
+        if np.isnan(value):
+            if not ignore_nan:
+                return np.nan
+        elif np.isnan(extreme) or (value > extreme if is_peak else value < extreme):
+            extreme = value
+    return extreme
+
+
+@numba.njit(error_model="numpy")
+def _mage(bg_rows, std_bg, short_window, long_window, ignore_nan):
+    n_series, n_values = bg_rows.shape
+    mage = np.empty(n_series)
+    for row in range(n_series):
+        values = bg_rows[row]
+        short_average = _moving_average(values, short_window, ignore_nan)
+        long_average = _moving_average(values, long_window, ignore_nan)
+        # the extreme of every part between crossings of the moving averages
+        extremes = np.empty(n_values)
+        n_parts = 0
+        part_start = 0
+        for i in range(1, n_values + 1):
+            if i == n_values or (short_average[i] > long_average[i]) != (short_average[i - 1] > long_average[i - 1]):
+                is_peak = short_average[part_start] > long_average[part_start]
+                extremes[n_parts] = _extreme(values[part_start:i], is_peak, ignore_nan)
+                n_parts += 1
+                part_start = i
+        # the first and last part are incomplete excursions
+        amplitude_sum = 0.0
+        n_excursions = 0
+        for part in range(2, n_parts - 1):
+            amplitude = abs(extremes[part] - extremes[part - 1])
+            if amplitude > std_bg[row]:
+                amplitude_sum += amplitude
+                n_excursions += 1
+        mage[row] = amplitude_sum / n_excursions if n_excursions else np.nan
+    return mage
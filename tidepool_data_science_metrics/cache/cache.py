@@ -0,0 +1,318 @@
+import numpy as np
+import collections
+import contextlib
+import copy
+import functools
+import inspect
+import os
+import pickle
+import threading
+from typing import Callable, Dict, Iterator
+
+# Caching is off by default. While it is off, a cached function only checks this flag before calling the function it
+# wraps, so the overhead is one attribute lookup per call.
+_enabled = False
+
+_lock = threading.Lock()
+# the cached results, least recently used first, each with its size in bytes
+_entries = collections.OrderedDict()
+_n_bytes = 0
+_max_entries = 128
+_max_bytes = None
+_directory = None
+_stats = {"hits": 0, "disk_hits": 0, "misses": 0, "evictions": 0}
+# whether this thread is calculating the result of a cached call, whose inner cached calls (e.g. std_deviation and
+# avg within coefficient_of_variation) are then not keyed, since hashing the values again would cost more than it saves
+_calculating = threading.local()
+
+
+class _Uncacheable(Exception):
+    # raised while building a key for an argument the cache can not hash, e.g. an array of python objects
+    pass
+
+
+def cached(function: Callable) -> Callable:
+    """
+    Decorate a function so that, while caching is enabled, its results are kept and returned again for calls with
+    the same arguments instead of being recalculated.
+
+    Calls are keyed on the name of the function and all of its arguments (after defaults are applied, so passing an
+    argument by position or by keyword makes no difference), and on a hash of the source code of the package, so the
+    results kept on disk by another version of the package are never returned. Arrays are keyed on a hash of their
+    buffer together with their dtype and shape, so equal values hit the cache even when they are different arrays,
+    and a changed value never does. Calls with an argument that can not be hashed (e.g. an object array) are not
+    cached.
+
+    A hit returns a copy of the cached result, so changing it does not change the cache. A hit does not validate the
+    values again, so the validation warnings of a set of glucose values are only raised by the first call. The
+    cached functions called while calculating a result are not cached themselves.
+
+    Parameters
+    ----------
+    function : callable
+        The function to cache. It is keyed as "<module>.<function name>", e.g. "glucose.summary".
+
+    Returns
+    -------
+    callable
+        The cached function.
+    """
+    name = f"{function.__module__.rsplit('.', 1)[-1]}.{function.__name__}"
+
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        if not _enabled or getattr(_calculating, "active", False):
+            return function(*args, **kwargs)
+        try:
+            key = _key(name, _signature(function), args, kwargs)
+        except _Uncacheable:
+            return function(*args, **kwargs)
+        found, result = _get(key)
+        if not found:
+            _calculating.active = True
+            try:
+                result = function(*args, **kwargs)
+            finally:
+                _calculating.active = False
+            _put(key, result)
+        return copy.deepcopy(result)
+
+    return wrapper
+
+
+def enable(max_entries: int = 128, max_bytes: int = None, directory: str = None):
+    """
+    Start caching the results of the cached functions.
+
+    Parameters
+    ----------
+    max_entries : int, optional
+        The number of results kept in memory. The least recently used result is evicted first. DEFAULT = 128
+    max_bytes : int, optional
+        The total size of the arrays of the results kept in memory. DEFAULT = None, only max_entries applies.
+    directory : str, optional
+        A directory to also keep every result in (as a pickle file per result), which is read when a result is not in
+        memory, so results survive the process and are shared between processes. Only use a directory that no one
+        else can write to, since the files are unpickled. DEFAULT = None, results are only kept in memory.
+    """
+    global _enabled, _max_entries, _max_bytes, _directory
+    if max_entries < 1:
+        raise Exception("max_entries must be at least 1.")
+    with _lock:
+        _max_entries = max_entries
+        _max_bytes = max_bytes
+        _directory = directory
+        _evict()
+    if directory is not None:
+        os.makedirs(directory, exist_ok=True)
+    _enabled = True
+
+
+def disable():
+    """Stop caching. The cached results are kept until clear, and are used again if caching is enabled again."""
+    global _enabled
+    _enabled = False
+
+
+def is_enabled() -> bool:
+    """Whether the results of the cached functions are being cached."""
+    return _enabled
+
+
+def clear(disk: bool = False):
+    """
+    Remove the cached results from memory and reset the statistics.
+
+    Parameters
+    ----------
+    disk : bool, optional
+        Whether to also remove the results in the directory of the disk tier. DEFAULT = False
+    """
+    global _n_bytes
+    with _lock:
+        _entries.clear()
+        _n_bytes = 0
+        for stat in _stats:
+            _stats[stat] = 0
+        if disk and _directory is not None and os.path.isdir(_directory):
+            for file_name in os.listdir(_directory):
+                if file_name.endswith(".pkl"):
+                    os.remove(os.path.join(_directory, file_name))
+
+
+@contextlib.contextmanager
+def caching(max_entries: int = 128, max_bytes: int = None, directory: str = None) -> Iterator[None]:
+    """
+    Cache the results of the cached functions within a with block, e.g.
+
+        with cache.caching():
+            for threshold in thresholds:
+                glucose.episodes(bg_array, threshold)
+            glucose.summary(bg_array)
+        print(cache.stats())
+
+    Parameters
+    ----------
+    max_entries, max_bytes, directory
+        See enable.
+    """
+    global _enabled
+    was_enabled = _enabled
+    enable(max_entries, max_bytes, directory)
+    try:
+        yield
+    finally:
+        _enabled = was_enabled
+
+
+def stats() -> Dict[str, int]:
+    """
+    Get the cache statistics since the last clear.
+
+    Returns
+    -------
+    dict
+        "hits" (results found in memory), "disk_hits" (results found in the directory of the disk tier), "misses"
+        (results calculated), "evictions" (results evicted from memory), "entries" (results in memory) and "bytes"
+        (the size of the arrays of the results in memory).
+    """
+    with _lock:
+        return dict(_stats, entries=len(_entries), bytes=_n_bytes)
+
+
+def _get(key: str):
+    with _lock:
+        if key in _entries:
+            _entries.move_to_end(key)
+            _stats["hits"] += 1
+            return True, _entries[key][0]
+        directory = _directory
+    if directory is not None:
+        try:
+            with open(_path(directory, key), "rb") as file:
+                result = pickle.load(file)
+        except (OSError, pickle.UnpicklingError, EOFError):
+            pass
+        else:
+            with _lock:
+                _stats["disk_hits"] += 1
+                _insert(key, result)
+            return True, result
+    with _lock:
+        _stats["misses"] += 1
+    return False, None
+
+
+def _put(key: str, result: object):
+    with _lock:
+        _insert(key, result)
+        directory = _directory
+    if directory is not None:
+        # write to a temporary file first, so another process never reads a partly written result
+        path = _path(directory, key)
+        temporary_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(temporary_path, "wb") as file:
+            pickle.dump(result, file, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(temporary_path, path)
+
+
+def _insert(key: str, result: object):
+    global _n_bytes
+    if key in _entries:
+        _n_bytes -= _entries.pop(key)[1]
+    n_bytes = _size(result)
+    _entries[key] = (result, n_bytes)
+    _n_bytes += n_bytes
+    _evict()
+
+
+def _evict():
+    global _n_bytes
+    while len(_entries) > _max_entries or (_max_bytes is not None and _n_bytes > _max_bytes and _entries):
+        _, (_, n_bytes) = _entries.popitem(last=False)
+        _n_bytes -= n_bytes
+        _stats["evictions"] += 1
+
+
+def _path(directory: str, key: str) -> str:
+    return os.path.join(directory, f"{key}.pkl")
+
+
+def _size(result: object) -> int:
+    # the size of the arrays in a result, the rest of a result (a scalar or a dict of them) is small
+    if isinstance(result, np.ndarray):
+        return result.nbytes
+    if isinstance(result, (tuple, list)):
+        return sum(_size(value) for value in result)
+    if isinstance(result, dict):
+        return sum(_size(value) for value in result.values())
+    return 0
+
+
+@functools.lru_cache(maxsize=None)
+def _signature(function: Callable) -> inspect.Signature:
+    # looked up on the first cached call rather than when decorating, which would slow down importing the metrics
+    return inspect.signature(function)
+
+
+def _key(name: str, signature: inspect.Signature, args: tuple, kwargs: dict) -> str:
+    # hashlib is only imported when caching is used, since it is slow to import
+    import hashlib
+
+    try:
+        bound = signature.bind(*args, **kwargs)
+    except TypeError:
+        raise _Uncacheable()
+    bound.apply_defaults()
+    digest = hashlib.blake2b(digest_size=20)
+    digest.update(_code_digest())
+    digest.update(name.encode())
+    for argument_name, value in bound.arguments.items():
+        digest.update(argument_name.encode())
+        _update(digest, value)
+    return digest.hexdigest()
+
+
+@functools.lru_cache(maxsize=None)
+def _code_digest() -> bytes:
+    # a hash of every source file of the package, read once on the first cached call, so that a result is keyed on
+    # the code that calculated it (including the helpers the cached function calls)
+    import hashlib
+
+    package_directory = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    digest = hashlib.blake2b(digest_size=20)
+    for directory, subdirectories, file_names in sorted(os.walk(package_directory)):
+        subdirectories.sort()
+        for file_name in sorted(file_names):
+            if file_name.endswith(".py"):
+                path = os.path.join(directory, file_name)
+                digest.update(os.path.relpath(path, package_directory).encode())
+                with open(path, "rb") as source_file:
+                    digest.update(source_file.read())
+    return digest.digest()
+
+
+def _update(digest, value: object):
+    # add a tagged representation of value to the digest, so e.g. 1, 1.0, "1" and [1] are all different keys
+    if isinstance(value, np.ndarray):
+        if value.dtype.hasobject:
+            raise _Uncacheable()
+        digest.update(f"ndarray{value.dtype.str}{value.shape}".encode())
+        digest.update(np.ascontiguousarray(value).reshape(-1).view(np.uint8))
+    elif isinstance(value, (list, tuple)):
+        digest.update(f"{type(value).__name__}{len(value)}".encode())
+        for item in value:
+            _update(digest, item)
+    elif isinstance(value, dict):
+        digest.update(f"dict{len(value)}".encode())
+        for item_key, item in sorted(value.items(), key=lambda item: repr(item[0])):
+            _update(digest, item_key)
+            _update(digest, item)
+    elif value is None or isinstance(value, (bool, int, float, str, np.generic)):
+        digest.update(f"{type(value).__name__}{value!r}".encode())
+    elif callable(value) and "<" not in getattr(value, "__qualname__", "<"):
+        # a module level function (e.g. operator.ge), keyed on its name so that the key is the same in every process.
+        # Lambdas and nested functions have no unique name.
+        digest.update(f"callable{getattr(value, '__module__', '')}.{value.__qualname__}".encode())
+    else:
+        raise _Uncacheable()
@@ -0,0 +1,188 @@
+import numpy as np
+import functools
+import inspect
+import multiprocessing
+import os
+from typing import Callable, Dict, Iterable, List, Union
+from tidepool_data_science_metrics.glucose import glucose
+from tidepool_data_science_metrics.loaders import loaders
+
+try:
+    from multiprocessing import shared_memory
+except ImportError:  # python < 3.8, the arrays are copied to each worker once instead
+    shared_memory = None
+
+# the state of each worker process, set once per worker by _init_worker
+_worker_state = {}
+
+
+def run_cohort(
+    patients: Iterable[Union["np.ndarray[np.float64]", str]],
+    metrics: Union[List[Callable], Dict[str, Callable]],
+    patient_ids: List[str] = None,
+    n_workers: int = None,
+    chunk_size: int = None,
+    validate: bool = True,
+):
+    """
+    Calculate a set of metrics on every patient of a cohort across a pool of worker processes, and collect the
+    results into one table with a row per patient.
+
+    Arrays are copied once into a shared memory buffer that every worker reads from, so no glucose or insulin values
+    are pickled per task; only patient indices are sent to the workers, in chunks of chunk_size patients. File paths
+    are read by the workers themselves.
+
+    When validate is True, the values of each patient are checked once with glucose.validation_report, the number
+    of values outside of the expected CGM range and the number of missing (NaN) values are added to the table
+    ("n_values_lt_38", "n_values_gt_402" and "n_values_missing"), and every metric that accepts a validate argument
+    is called with validate=False, so the metrics do not re-check the values or warn about them for every patient.
+    Missing values are not invalid; pass metrics with ignore_nan=True (e.g. as a functools.partial) to calculate
+    them over the valid values only.
+
+    Parameters
+    ----------
+    patients : iterable of ndarray or str
+        The values of each patient, or the path of a file with the values of each patient (any file type that
+        loaders.load reads; the columns of an Arrow or Parquet file are the time series of the patient).
+    metrics : list of callables or dict
+        The metrics to calculate, each a module level function (or functools.partial of one) that takes the values of
+        a patient, e.g. glucose.percent_values_lt_70 or functools.partial(glucose.episodes, episodes_threshold=54).
+        A dict maps the column name of each metric to the function, otherwise the function name is used.
+        Metrics that return a dict (e.g. glucose.summary) get a column per key, named "<metric name>.<key>"
+        (e.g. "summary.episodes").
+    patient_ids : list, optional
+        The row label of each patient. DEFAULT = the file paths, or the position of each array.
+    n_workers : int, optional
+        The number of worker processes. DEFAULT = the number of CPUs. With 1 the metrics run in this process.
+    chunk_size : int, optional
+        The number of patients sent to a worker at a time. DEFAULT = spreads the patients evenly, about four
+        chunks per worker.
+    validate : bool, optional
+        Whether the values of each patient are glucose values to validate. Set to False for other values, such as
+        insulin-on-board. DEFAULT = True
+
+    Returns
+    -------
+    pandas.DataFrame
+        The metrics with a row per patient and a column per metric.
+    """
+    import pandas as pd
+
+    patients = list(patients)
+    if not isinstance(metrics, dict):
+        names = [_metric_name(metric) for metric in metrics]
+        if len(set(names)) < len(names):
+            raise Exception("Metrics with the same function name must be passed as a dict of column names.")
+        metrics = dict(zip(names, metrics))
+    if validate:
+        metrics = {
+            name: functools.partial(metric, validate=False) if _accepts_validate(metric) else metric
+            for name, metric in metrics.items()
+        }
+    if patient_ids is None:
+        patient_ids = [patient if isinstance(patient, str) else i for i, patient in enumerate(patients)]
+    if len(patient_ids) != len(patients):
+        raise Exception("patient_ids must have one id per patient.")
+    if n_workers is None:
+        n_workers = os.cpu_count() or 1
+    if chunk_size is None:
+        chunk_size = max(1, len(patients) // (n_workers * 4))
+
+    paths = {i: patient for i, patient in enumerate(patients) if isinstance(patient, str)}
+    arrays = [np.asarray(patient) for patient in patients if not isinstance(patient, str)]
+    layout = _layout(patients)
+    values = np.concatenate([array.ravel() for array in arrays]).astype(np.float64) if arrays else np.zeros(0)
+
+    if n_workers == 1 or len(patients) <= 1:
+        _init_worker(None, values, layout, paths, metrics, validate)
+        rows = [_evaluate_patient(i) for i in range(len(patients))]
+    else:
+        shared = None
+        if shared_memory is not None and values.size:
+            shared = shared_memory.SharedMemory(create=True, size=values.nbytes)
+            np.ndarray(values.shape, dtype=values.dtype, buffer=shared.buf)[:] = values
+        try:
+            init_args = (shared.name if shared else None, None if shared else values, layout, paths, metrics, validate)
+            with multiprocessing.Pool(n_workers, initializer=_init_worker, initargs=init_args) as pool:
+                rows = pool.map(_evaluate_patient, range(len(patients)), chunksize=chunk_size)
+        finally:
+            if shared is not None:
+                shared.close()
+                shared.unlink()
+
+    return pd.DataFrame(rows, index=patient_ids)
+
+
+def _metric_name(metric: Callable) -> str:
+    # functools.partial objects have no __name__, so use the name of the function they wrap
+    return getattr(metric, "__name__", None) or getattr(metric, "func").__name__
+
+
+def _layout(patients: List[Union["np.ndarray[np.float64]", str]]) -> Dict[int, tuple]:
+    # the offset and shape of each patient array within the concatenated values
+    layout = {}
+    offset = 0
+    for i, patient in enumerate(patients):
+        if isinstance(patient, str):
+            continue
+        shape = np.shape(patient)
+        layout[i] = (offset, shape)
+        offset += int(np.prod(shape))
+    return layout
+
+
+def _accepts_validate(metric: Callable) -> bool:
+    try:
+        return "validate" in inspect.signature(metric).parameters
+    except (TypeError, ValueError):
+        return False
+
+
+def _init_worker(
+    shared_name: str, values: "np.ndarray[np.float64]", layout: Dict[int, tuple], paths, metrics, validate: bool
+):
+    if shared_name is not None:
+        shared = shared_memory.SharedMemory(name=shared_name)
+        values = np.ndarray((shared.size // 8,), dtype=np.float64, buffer=shared.buf)
+        values.setflags(write=False)  # the buffer is shared by every worker, so a metric must not write into it
+        _worker_state["shared"] = shared
+    _worker_state.update(values=values, layout=layout, paths=paths, metrics=metrics, validate=validate)
+
+
+def _patient_values(i: int) -> "np.ndarray[np.float64]":
+    if i in _worker_state["paths"]:
+        return _load(_worker_state["paths"][i])
+    offset, shape = _worker_state["layout"][i]
+    return _worker_state["values"][offset : offset + int(np.prod(shape))].reshape(shape)
+
+
+def _load(path: str) -> "np.ndarray[np.float64]":
+    values = loaders.load(path)
+    if isinstance(values, dict):
+        # the columns of an Arrow or Parquet file are the time series of the patient
+        columns = list(values.values())
+        values = columns[0] if len(columns) == 1 else np.column_stack(columns)
+    return values
+
+
+def _evaluate_patient(i: int) -> Dict[str, object]:
+    values = _patient_values(i)
+    row = {}
+    if _worker_state["validate"]:
+        # missing values are reported as such, the metrics decide what to do with them
+        report = glucose.validation_report(values, ignore_nan=True)
+        report["n_values_missing"] = np.count_nonzero(np.isnan(values))
+        if not report["valid"]:
+            raise Exception(f"Patient {i} had glucose values less than 1 or greater than 1000.")
+    for name, metric in _worker_state["metrics"].items():
+        result = metric(values)
+        if isinstance(result, dict):
+            row.update((f"{name}.{key}", value) for key, value in result.items())
+        else:
+            row[name] = result
+    if _worker_state["validate"]:
+        for column in ["n_values_lt_38", "n_values_gt_402", "n_values_missing"]:
+            if column in row:
+                raise Exception(f"The metric {column} has the name of a validation column, give it another name.")
+            row[column] = report[column]
+    return row
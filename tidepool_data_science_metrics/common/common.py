@@ -1,8 +1,12 @@
 import numpy as np
-from typing import List
+from typing import List, Tuple
+from tidepool_data_science_metrics.cache import cache
+from tidepool_data_science_metrics.instrumentation import instrumentation
 
 
-def mean(bg_array: "np.ndarray[np.int64]", round_to_ndigits: int = 2):
+@instrumentation.instrumented
+@cache.cached
+def mean(bg_array: "np.ndarray[np.int64]", round_to_ndigits: int = 2, axis: int = None, ignore_nan: bool = False):
     """
     Calculate the mean within a set of glucose values
 
@@ -12,20 +16,31 @@ def mean(bg_array: "np.ndarray[np.int64]", round_to_ndigits: int = 2):
         1D array containing data with `int` type.
     round_to_ndigits : int, optional
         The number of digits to round the result to.
+    axis : int, optional
+        The axis along which each time series runs (e.g. 0 for a matrix where each column is a time series).
+        DEFAULT = None, the mean of all of the values.
+    ignore_nan : bool, optional
+        Whether NaN values are missing readings to leave out, so the result is over the valid values only.
+        DEFAULT = False
 
     Returns
     -------
-    int
-        The calculated Means
+    int or ndarray
+        The calculated Means, one per time series when axis is given
     """
-    return round(np.mean(bg_array), round_to_ndigits)
+    mean_bg = np.nanmean(bg_array, axis=axis) if ignore_nan else np.mean(bg_array, axis=axis)
+    return np.round(mean_bg, round_to_ndigits)
 
 
+@instrumentation.instrumented
+@cache.cached
 def avg(
     bg_array: "np.ndarray[np.int64]",
     weights: List[int] = None,
     returned: bool = False,
     round_to_ndigits: int = 2,
+    axis: int = None,
+    ignore_nan: bool = False,
 ):
     """
     Calculate the average within a set of glucose values
@@ -45,17 +60,31 @@ def avg(
         is taken.
     round_to_ndigits : int, optional
         The number of digits to round the result to.
+    axis : int, optional
+        The axis along which each time series runs. DEFAULT = None, the average of all of the values.
+    ignore_nan : bool, optional
+        Whether NaN values are missing readings to leave out, so the result is over the valid values only.
+        DEFAULT = False
 
     Returns
     -------
-    int
-        The calculated Average
+    int or ndarray
+        The calculated Average, one per time series when axis is given
     """
-    val = np.average(bg_array, weights=weights, returned=returned)
+    if ignore_nan:
+        # a masked average leaves the NaN values (and their weights) out without copying the valid values
+        val = np.ma.average(np.ma.masked_invalid(bg_array), weights=weights, returned=returned, axis=axis)
+        val = tuple(np.ma.filled(v, np.nan) for v in val) if returned else np.ma.filled(val, np.nan)
+    else:
+        val = np.average(bg_array, weights=weights, returned=returned, axis=axis)
     return np.round(val, round_to_ndigits)
 
 
-def std_deviation(bg_array: "np.ndarray[np.int64]", round_to_ndigits: int = 2):
+@instrumentation.instrumented
+@cache.cached
+def std_deviation(
+    bg_array: "np.ndarray[np.int64]", round_to_ndigits: int = 2, axis: int = None, ignore_nan: bool = False
+):
     """
     Calculate the standard deviation within a set of glucose values
 
@@ -65,18 +94,26 @@ def std_deviation(bg_array: "np.ndarray[np.int64]", round_to_ndigits: int = 2):
         1D array containing data with `int` type.
     round_to_ndigits : int, optional
         The number of digits to round the result to.
+    axis : int, optional
+        The axis along which each time series runs. DEFAULT = None, the standard deviation of all of the values.
+    ignore_nan : bool, optional
+        Whether NaN values are missing readings to leave out, so the result is over the valid values only.
+        DEFAULT = False
 
     Returns
     -------
-    int
-        Calculated standard deviation
+    int or ndarray
+        Calculated standard deviation, one per time series when axis is given
     """
 
-    return round(np.std(bg_array), round_to_ndigits)
+    std_bg = np.nanstd(bg_array, axis=axis) if ignore_nan else np.std(bg_array, axis=axis)
+    return np.round(std_bg, round_to_ndigits)
 
 
+@instrumentation.instrumented
+@cache.cached
 def coefficient_of_variation(
-    bg_array: "np.ndarray[np.int64]", round_to_ndigits: int = 2
+    bg_array: "np.ndarray[np.int64]", round_to_ndigits: int = 2, axis: int = None, ignore_nan: bool = False
 ):
     """
     Calculate the coefficient of variation on set of glucose values
@@ -87,12 +124,36 @@ def coefficient_of_variation(
         1D array containing data with `int` type.
     round_to_ndigits : int, optional
         The number of digits to round the result to.
+    axis : int, optional
+        The axis along which each time series runs. DEFAULT = None, the coefficient of variation of all of the values.
+    ignore_nan : bool, optional
+        Whether NaN values are missing readings to leave out, so the result is over the valid values only.
+        DEFAULT = False
 
     Returns
     -------
-    int
-        The calculated Coefficient of variation
+    int or ndarray
+        The calculated Coefficient of variation, one per time series when axis is given
     """
-    std_dev = std_deviation(bg_array, round_to_ndigits=round_to_ndigits)
-    avg_glu = avg(bg_array, round_to_ndigits=round_to_ndigits)
-    return round(std_dev / avg_glu * 100, round_to_ndigits)
+    std_dev = std_deviation(bg_array, round_to_ndigits=round_to_ndigits, axis=axis, ignore_nan=ignore_nan)
+    avg_glu = avg(bg_array, round_to_ndigits=round_to_ndigits, axis=axis, ignore_nan=ignore_nan)
+    return _coefficient_of_variation(avg_glu, std_dev, round_to_ndigits)
+
+
+def _coefficient_of_variation(mean_bg: np.float64, std_bg: np.float64, round_to_ndigits: int = 2) -> np.float64:
+    # the coefficient of variation of the mean and standard deviation, each rounded first like coefficient_of_variation
+    return np.round(np.round(std_bg, round_to_ndigits) / np.round(mean_bg, round_to_ndigits) * 100, round_to_ndigits)
+
+
+def _combine_moments(
+    n_a: int, mean_a: np.float64, m2_a: np.float64, n_b: int, mean_b: np.float64, m2_b: np.float64
+) -> Tuple[int, np.float64, np.float64]:
+    # Combine the count, mean and sum of squared differences from the mean (M2) of two sets of values with the
+    # parallel form of Welford's algorithm (Chan et al.), which stays numerically stable for large counts.
+    n = n_a + n_b
+    if n == 0:
+        return 0, 0.0, 0.0
+    delta = mean_b - mean_a
+    mean_ab = mean_a + delta * n_b / n
+    m2_ab = m2_a + m2_b + delta ** 2 * n_a * n_b / n
+    return n, mean_ab, m2_ab
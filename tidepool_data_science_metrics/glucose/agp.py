@@ -0,0 +1,146 @@
+import numpy as np
+from typing import Sequence
+from tidepool_data_science_metrics.glucose import glucose
+from tidepool_data_science_metrics.cache import cache
+from tidepool_data_science_metrics.instrumentation import instrumentation
+
+_MINUTES_PER_DAY = 24 * 60
+
+
+@instrumentation.instrumented
+@cache.cached
+def ambulatory_glucose_profile(
+    bg_array: "np.ndarray[np.float64]",
+    timestamps: "np.ndarray[np.datetime64]" = None,
+    percentiles: Sequence[float] = (5, 25, 50, 75, 95),
+    slot_minutes: int = 5,
+    smoothing_slots: int = 1,
+    round_to_n_digits: int = 1,
+    axis: int = None,
+    validate: bool = True,
+    ignore_nan: bool = False,
+) -> "np.ndarray[np.float64]":
+    """
+    Calculate the Ambulatory Glucose Profile (AGP), the percentiles of the glucose values at each time of day
+    over all of the days of data (typically 14 or more).
+
+    The values are placed on a days x slots grid, where each slot is slot_minutes of the day (288 slots of 5 minutes
+    by default) and a slot with more than one value in a day takes the mean of them. The grid is sorted over the days
+    once, and every percentile band of every slot is then read from the sorted grid in a single vectorized step
+    (the same linear interpolation as np.nanpercentile), so slots without a value on some days only use the days
+    with data.
+
+    Parameters
+    ----------
+    bg_array : ndarray
+        1D array containing data with float or int type.
+    timestamps : ndarray, optional
+        Array of datetime64 (or values convertible to datetime64) with the local time of each bg value. Either the
+        same shape as bg_array, or 1D with one timestamp per value along axis when every time series shares the
+        same times. DEFAULT = None, the values are consecutive slot_minutes apart and start at midnight.
+    percentiles : sequence of float, optional
+        The percentiles to calculate, from 0 to 100. DEFAULT = (5, 25, 50, 75, 95)
+    slot_minutes : int, optional
+        The number of minutes of the day in each slot, which must divide a day evenly. DEFAULT = 5
+    smoothing_slots : int, optional
+        The number of slots in a centered moving average applied to each percentile band, wrapping around midnight.
+        Must be odd. DEFAULT = 1, no smoothing.
+    round_to_n_digits : int, optional
+        The number of digits to round the result to. DEFAULT = 1
+    axis : int, optional
+        The axis along which each time series runs (e.g. 0 for a matrix where each column is a time series).
+        DEFAULT = None, all of the values are one time series.
+    validate : bool, optional
+        Whether to check the glucose values before the calculation. DEFAULT = True
+    ignore_nan : bool, optional
+        Whether NaN values are missing readings to leave out, so a slot with more than one value in a day takes the
+        mean of its valid values. Otherwise a NaN value makes its slot missing for that day. Either way, the days
+        where a slot is missing are left out of the percentiles of that slot. DEFAULT = False
+
+    Returns
+    -------
+    ndarray
+        The percentiles with shape (len(percentiles), n_slots) for a single time series. When axis is given, the slots
+        take the place of axis, e.g. (len(percentiles), n_slots, n_patients) for a matrix with a column per patient.
+        A slot without any values is NaN.
+    """
+    if validate:
+        glucose._validate_bg(bg_array)
+    if _MINUTES_PER_DAY % slot_minutes != 0:
+        raise Exception("slot_minutes must divide a day evenly.")
+    if smoothing_slots < 1 or smoothing_slots % 2 == 0:
+        raise Exception("smoothing_slots must be a positive odd number.")
+    bg_array = np.asarray(bg_array)
+    n_slots = _MINUTES_PER_DAY // slot_minutes
+    grid = _day_slot_grid(bg_array, timestamps, slot_minutes, n_slots, axis, ignore_nan)
+    bands = _nan_percentiles(grid, percentiles)
+    if smoothing_slots > 1:
+        bands = _smooth(bands, smoothing_slots)
+    bands = np.round(bands, round_to_n_digits)
+    return np.stack([glucose._from_series_rows(band, bg_array, axis) for band in bands])
+
+
+def _day_slot_grid(
+    bg_array: "np.ndarray[np.float64]",
+    timestamps: "np.ndarray[np.datetime64]",
+    slot_minutes: int,
+    n_slots: int,
+    axis: int = None,
+    ignore_nan: bool = False,
+) -> "np.ndarray[np.float64]":
+    # the glucose values of each series on a (n_series, n_days, n_slots) grid, NaN where a slot has no values
+    bg_rows = glucose._as_series_rows(bg_array, axis).astype(np.float64)
+    n_series, n_values = bg_rows.shape
+    if timestamps is None:
+        n_days = -(-n_values // n_slots)
+        grid = np.full((n_series, n_days * n_slots), np.nan)
+        grid[:, :n_values] = bg_rows
+        return grid.reshape(n_series, n_days, n_slots)
+
+    minute_rows = glucose._minute_rows(timestamps, bg_array, axis) + glucose._minutes_after_midnight(timestamps)
+    cells = (minute_rows // slot_minutes).astype(np.int64)
+    n_cells = (int(cells.max()) // n_slots + 1) * n_slots if cells.size else n_slots
+    # offset the cells of each series, so one bincount sums the values of every cell of every series
+    cells += np.arange(n_series)[:, np.newaxis] * n_cells
+    if ignore_nan:
+        # leave the NaN values out of the sums and counts of their cells
+        is_valid = ~np.isnan(bg_rows)
+        sums = np.bincount(cells.ravel(), weights=np.where(is_valid, bg_rows, 0).ravel(), minlength=n_series * n_cells)
+        counts = np.bincount(cells.ravel(), weights=is_valid.ravel(), minlength=n_series * n_cells)
+    else:
+        sums = np.bincount(cells.ravel(), weights=bg_rows.ravel(), minlength=n_series * n_cells)
+        counts = np.bincount(cells.ravel(), minlength=n_series * n_cells)
+    with np.errstate(invalid="ignore"):
+        grid = sums / counts
+    return grid.reshape(n_series, -1, n_slots)
+
+
+def _nan_percentiles(grid: "np.ndarray[np.float64]", percentiles: Sequence[float]) -> "np.ndarray[np.float64]":
+    # np.nanpercentile over the days (axis 1) of the grid, without its per slot python loop over grids with NaN
+    sorted_grid = np.sort(grid, axis=1)  # NaN sorts to the end
+    n_days = np.sum(~np.isnan(grid), axis=1)[np.newaxis, :, np.newaxis, :]
+    ranks = np.asarray(percentiles, dtype=np.float64).reshape(-1, 1, 1, 1) / 100 * (n_days - 1)
+    lower = np.clip(np.floor(ranks).astype(np.int64), 0, None)
+    upper = np.clip(np.ceil(ranks).astype(np.int64), 0, None)
+    sorted_grid = sorted_grid[np.newaxis]
+    lower_values = np.take_along_axis(sorted_grid, lower, axis=2)
+    upper_values = np.take_along_axis(sorted_grid, upper, axis=2)
+    bands = lower_values + (upper_values - lower_values) * (ranks - np.floor(ranks))
+    # slots without any values are NaN
+    return np.where(n_days > 0, bands, np.nan)[:, :, 0, :]
+
+
+def _smooth(bands: "np.ndarray[np.float64]", smoothing_slots: int) -> "np.ndarray[np.float64]":
+    # centered moving average over the slots (last axis), wrapping around midnight and skipping empty slots
+    half = smoothing_slots // 2
+    padded = np.concatenate([bands[..., -half:], bands, bands[..., :half]], axis=-1)
+    has_value = ~np.isnan(padded)
+    sums = np.cumsum(np.where(has_value, padded, 0), axis=-1)
+    counts = np.cumsum(has_value, axis=-1)
+    sums = np.concatenate([np.zeros_like(sums[..., :1]), sums], axis=-1)
+    counts = np.concatenate([np.zeros_like(counts[..., :1]), counts], axis=-1)
+    n_slots = bands.shape[-1]
+    window_sums = sums[..., smoothing_slots : smoothing_slots + n_slots] - sums[..., :n_slots]
+    window_counts = counts[..., smoothing_slots : smoothing_slots + n_slots] - counts[..., :n_slots]
+    with np.errstate(invalid="ignore"):
+        return window_sums / window_counts
@@ -1,14 +1,48 @@
 import numpy as np
-from typing import Tuple
+from typing import Dict, Tuple
 import warnings
 import operator
-import tidepool_data_science_metrics.common.common as common
+from tidepool_data_science_metrics.common import common
+from tidepool_data_science_metrics.backends import backends
+from tidepool_data_science_metrics.cache import cache
+from tidepool_data_science_metrics.instrumentation import instrumentation
 
 # TODO: allow these functions to take in a mmol/L in addition to mg/dL
-# TODO: allow these functions to operate on a matrix of glucose column arrays
 
+# the thresholds used by summary, as values less than (lt) and less than or equal to (le) each threshold
+_LT_THRESHOLDS = (38, 40, 54, 70, 1000)
+_LE_THRESHOLDS = (180, 250, 300, 400, 402, 1000)
+# the ranges of the summary percentages and counts, each as the number of values below (lt) or at or below (le) the
+# upper threshold minus the number below or at or below the lower threshold (None when there is no lower threshold)
+_PERCENT_RANGES = {
+    "percent_values_lt_40": (None, ("lt", 40)),
+    "percent_values_lt_54": (None, ("lt", 54)),
+    "percent_values_lt_70": (None, ("lt", 70)),
+    "percent_values_ge_70_le_180": (("lt", 70), ("le", 180)),
+    "percent_values_gt_180": (("le", 180), ("lt", 1000)),
+    "percent_values_gt_250": (("le", 250), ("lt", 1000)),
+    "percent_values_gt_300": (("le", 300), ("lt", 1000)),
+    "percent_values_gt_400": (("le", 400), ("lt", 1000)),
+}
+_COUNT_RANGES = {
+    "n_values_lt_38": (None, ("lt", 38)),
+    "n_values_gt_402": (("le", 402), ("le", 1000)),
+}
+# the longest series rows that _sorted_counts searches all at once rather than one at a time
+_FLAT_SEARCH_MAX_VALUES = 512
+# the LBGI above which each LBGI risk score starts
+_LBGI_RISK_THRESHOLDS = (0, 2.5, 5, 10)
 
-def glucose_management_index(bg_array: "np.ndarray[np.float64]", round_to_n_digits: int = 3) -> np.float64:
+
+@instrumentation.instrumented
+@cache.cached
+def glucose_management_index(
+    bg_array: "np.ndarray[np.float64]",
+    round_to_n_digits: int = 3,
+    axis: int = None,
+    validate: bool = True,
+    ignore_nan: bool = False,
+) -> np.float64:
     """
     Calculate the Glucose Management Indicator on set of glucose values. GMI indicates the average
     A1C level that would be expected based on mean glucose measured
@@ -20,17 +54,33 @@ def glucose_management_index(bg_array: "np.ndarray[np.float64]", round_to_n_digi
         1D array containing data with float or int type.
     round_to_n_digits : int, optional
         The number of digits to round the result to.
+    axis : int, optional
+        The axis along which each time series runs (e.g. 0 for a matrix where each column is a time series).
+        DEFAULT = None, the result over all of the values.
+    validate : bool, optional
+        Whether to check the glucose values before the calculation. DEFAULT = True
+    ignore_nan : bool, optional
+        Whether NaN values are missing readings to leave out, so the result is over the valid values only.
+        DEFAULT = False
 
     Returns
     -------
     float
         The calculated Glucose Management Indicator
     """
-    _validate_bg(bg_array)
-    gmi = 3.31 + (0.02392 * common.mean(bg_array))
-    return round(gmi, round_to_n_digits)
+    if validate:
+        _validate_bg(bg_array)
+    gmi = _gmi(common.mean(bg_array, axis=axis, ignore_nan=ignore_nan))
+    return np.round(gmi, round_to_n_digits)
+
+
+def _gmi(mean_bg: np.float64) -> np.float64:
+    # the GMI of the mean glucose, which glucose_management_index rounds to 2 digits first (see common.mean)
+    return 3.31 + (0.02392 * mean_bg)
 
 
+@instrumentation.instrumented
+@cache.cached
 def percent_values_by_range(
     bg_array: "np.ndarray[np.float64]",
     lower_bound: int == 1,
@@ -38,6 +88,9 @@ def percent_values_by_range(
     lower_bound_operator: object = operator.ge,
     upper_bound_operator: object = operator.lt,
     round_to_n_digits: int = 3,
+    axis: int = None,
+    validate: bool = True,
+    ignore_nan: bool = False,
 ) -> np.float64:
     """
     Calculate the percent of bg values are within the specified range.
@@ -60,6 +113,15 @@ def percent_values_by_range(
         The the upper bound in the calculation range.
     round_to_n_digits : int
         The number of digits to round the result to. DEFAULT = 3
+    axis : int, optional
+        The axis along which each time series runs (e.g. 0 for a matrix where each column is a time series).
+        DEFAULT = None, the result over all of the values.
+    validate : bool, optional
+        Whether to check that the glucose values are within the expected range. Set to False for values that were
+        already validated upstream (e.g. with validation_report) to skip re-checking them. DEFAULT = True
+    ignore_nan : bool, optional
+        Whether NaN values are missing readings to leave out, so the result is over the valid values only.
+        DEFAULT = False
 
     Returns
     -------
@@ -67,16 +129,107 @@ def percent_values_by_range(
         The percentage of values in the specified range.
     """
 
-    _validate_bg(bg_array)
+    if validate:
+        _validate_bg(bg_array)
     _validate_input(lower_bound, upper_bound)
-    n_meet_criteria = sum(lower_bound_operator(bg_array, lower_bound) & upper_bound_operator(bg_array, upper_bound))
-    percent_meet_criteria = n_meet_criteria / len(bg_array) * 100
-    rounded_percent = np.round(percent_meet_criteria, round_to_n_digits)
+    meet_criteria = lower_bound_operator(bg_array, lower_bound) & upper_bound_operator(bg_array, upper_bound)
+    n_meet_criteria = np.count_nonzero(meet_criteria, axis=axis)
+    return _percent(n_meet_criteria, _n_values(bg_array, axis, ignore_nan), round_to_n_digits)
+
+
+@instrumentation.instrumented
+@cache.cached
+def percent_values_by_range_sweep(
+    bg_array: "np.ndarray[np.float64]",
+    lower_bounds: "np.ndarray[np.float64]",
+    upper_bounds: "np.ndarray[np.float64]",
+    lower_bound_operators: object = operator.ge,
+    upper_bound_operators: object = operator.lt,
+    round_to_n_digits: int = 3,
+    axis: int = None,
+    validate: bool = True,
+    ignore_nan: bool = False,
+) -> "np.ndarray[np.float64]":
+    """
+    Calculate the percent of bg values within each of many ranges, e.g. for a sensitivity analysis of time in range.
+    Equal to calling percent_values_by_range for every range, but the values of each time series are validated and
+    sorted once, and every bound is then answered with a binary search, in O(n log n + n_ranges log n) instead of
+    O(n * n_ranges).
+
+    The bounds and operators broadcast together, so a range per pair of bounds is e.g.
+    percent_values_by_range_sweep(bg_array, [54, 70], [180, 250]), and the grid of every lower bound with every upper
+    bound is percent_values_by_range_sweep(bg_array, lower_bounds[:, np.newaxis], upper_bounds).
+
+    Parameters
+    ----------
+    bg_array : ndarray
+        1D array containing data with float or int type.
+    lower_bounds : array_like
+        The lower bound of each range.
+    upper_bounds : array_like
+        The upper bound of each range.
+    lower_bound_operators : operator object or array_like of them, optional
+        operator.ge (greater than or equal to) DEFAULT or operator.gt (greater than), for all of the ranges or for
+        each range.
+    upper_bound_operators : operator object or array_like of them, optional
+        operator.lt (less than) DEFAULT or operator.le (less than or equal to), for all of the ranges or for each
+        range.
+    round_to_n_digits : int
+        The number of digits to round the result to. DEFAULT = 3
+    axis : int, optional
+        The axis along which each time series runs (e.g. 0 for a matrix where each column is a time series).
+        DEFAULT = None, the result over all of the values.
+    validate : bool, optional
+        Whether to check the glucose values before the calculation. DEFAULT = True
+    ignore_nan : bool, optional
+        Whether NaN values are missing readings to leave out, so the result is over the valid values only.
+        DEFAULT = False
+
+    Returns
+    -------
+    ndarray
+        The percentage of values in each range, with the broadcast shape of the bounds and operators. When axis is
+        given, the time series follow on the remaining axes, e.g. (n_ranges, n_patients) for a matrix with a column
+        per patient.
+    """
+    if validate:
+        _validate_bg(bg_array)
+    lower_bounds, upper_bounds, lower_operators, upper_operators = np.broadcast_arrays(
+        np.asarray(lower_bounds, dtype=np.float64),
+        np.asarray(upper_bounds, dtype=np.float64),
+        _as_operator_array(lower_bound_operators),
+        _as_operator_array(upper_bound_operators),
+    )
+    _validate_input(lower_bounds, upper_bounds)
+    lower_inclusive = _is_operator(lower_operators, operator.ge, operator.gt, "lower_bound_operators")
+    upper_inclusive = _is_operator(upper_operators, operator.le, operator.lt, "upper_bound_operators")
+
+    # The values of a range are the values counted below (or at) its upper bound that are not counted below (or at)
+    # its lower bound. NaN sorts after every bound, so it is in no range.
+    bg_array = np.asarray(bg_array)
+    bounds = np.concatenate([lower_bounds.ravel(), upper_bounds.ravel()])
+    inclusive = np.concatenate([~lower_inclusive.ravel(), upper_inclusive.ravel()])
+    counts = _sorted_counts(np.sort(_as_series_rows(bg_array, axis), axis=1), bounds, inclusive)
+    n_lower, n_upper = np.split(counts, 2, axis=1)
+    # a lower bound equal to the upper bound with gt and lt would count a negative number of values
+    n_meet_criteria = np.maximum(n_upper - n_lower, 0)
 
-    return rounded_percent
+    n_values = np.reshape(_n_values(bg_array, axis, ignore_nan), (-1, 1))
+    percent_meet_criteria = _percent(n_meet_criteria, n_values, round_to_n_digits)
+    if axis is None:
+        return percent_meet_criteria[0].reshape(lower_bounds.shape)
+    return np.moveaxis(percent_meet_criteria, 0, -1).reshape(lower_bounds.shape + _series_shape(bg_array, axis))
 
 
-def percent_values_ge_70_le_180(bg_array: "np.ndarray[np.float64]", round_to_n_digits: int = 3) -> np.float64:
+@instrumentation.instrumented
+@cache.cached
+def percent_values_ge_70_le_180(
+    bg_array: "np.ndarray[np.float64]",
+    round_to_n_digits: int = 3,
+    axis: int = None,
+    validate: bool = True,
+    ignore_nan: bool = False,
+) -> np.float64:
     """
     Calculate the percent of values with a glucose values that are
     greater-than-or-equal-to (ge) 70 and less-than-or-equal-to (le) 180 mg/dL.
@@ -87,6 +240,14 @@ def percent_values_ge_70_le_180(bg_array: "np.ndarray[np.float64]", round_to_n_d
         1D array containing data with float or int type.
     round_to_n_digits : int
         The number of digits to round the result to. DEFAULT = 3
+    axis : int, optional
+        The axis along which each time series runs (e.g. 0 for a matrix where each column is a time series).
+        DEFAULT = None, the result over all of the values.
+    validate : bool, optional
+        Whether to check the glucose values before the calculation. DEFAULT = True
+    ignore_nan : bool, optional
+        Whether NaN values are missing readings to leave out, so the result is over the valid values only.
+        DEFAULT = False
 
     Returns
     -------
@@ -100,10 +261,21 @@ def percent_values_ge_70_le_180(bg_array: "np.ndarray[np.float64]", round_to_n_d
         upper_bound_operator=operator.le,
         upper_bound=180,
         round_to_n_digits=round_to_n_digits,
+        axis=axis,
+        validate=validate,
+        ignore_nan=ignore_nan,
     )
 
 
-def percent_values_lt_70(bg_array: "np.ndarray[np.float64]", round_to_n_digits: int = 3) -> np.float64:
+@instrumentation.instrumented
+@cache.cached
+def percent_values_lt_70(
+    bg_array: "np.ndarray[np.float64]",
+    round_to_n_digits: int = 3,
+    axis: int = None,
+    validate: bool = True,
+    ignore_nan: bool = False,
+) -> np.float64:
     """
     Calculate the percent of values less than (lt) 70 mg/dL.
 
@@ -113,6 +285,14 @@ def percent_values_lt_70(bg_array: "np.ndarray[np.float64]", round_to_n_digits:
         1D array containing data with  float or int type.
     round_to_n_digits : int, optional
         The number of digits to round the result to.
+    axis : int, optional
+        The axis along which each time series runs (e.g. 0 for a matrix where each column is a time series).
+        DEFAULT = None, the result over all of the values.
+    validate : bool, optional
+        Whether to check the glucose values before the calculation. DEFAULT = True
+    ignore_nan : bool, optional
+        Whether NaN values are missing readings to leave out, so the result is over the valid values only.
+        DEFAULT = False
 
     Returns
     -------
@@ -120,11 +300,26 @@ def percent_values_lt_70(bg_array: "np.ndarray[np.float64]", round_to_n_digits:
         The percent values below 70.
     """
     return percent_values_by_range(
-        bg_array, lower_bound=1, upper_bound=70, upper_bound_operator=operator.lt, round_to_n_digits=round_to_n_digits,
+        bg_array,
+        lower_bound=1,
+        upper_bound=70,
+        upper_bound_operator=operator.lt,
+        round_to_n_digits=round_to_n_digits,
+        axis=axis,
+        validate=validate,
+        ignore_nan=ignore_nan,
     )
 
 
-def percent_values_lt_54(bg_array: "np.ndarray[np.float64]", round_to_n_digits: int = 3) -> np.float64:
+@instrumentation.instrumented
+@cache.cached
+def percent_values_lt_54(
+    bg_array: "np.ndarray[np.float64]",
+    round_to_n_digits: int = 3,
+    axis: int = None,
+    validate: bool = True,
+    ignore_nan: bool = False,
+) -> np.float64:
     """
     Calculate the percent of values less than (lt) 54 mg/dL.
 
@@ -134,19 +329,41 @@ def percent_values_lt_54(bg_array: "np.ndarray[np.float64]", round_to_n_digits:
         1D array containing data with  float or int type.
     round_to_n_digits : int, optional
         The number of digits to round the result to.
+    axis : int, optional
+        The axis along which each time series runs (e.g. 0 for a matrix where each column is a time series).
+        DEFAULT = None, the result over all of the values.
+    validate : bool, optional
+        Whether to check the glucose values before the calculation. DEFAULT = True
+    ignore_nan : bool, optional
+        Whether NaN values are missing readings to leave out, so the result is over the valid values only.
+        DEFAULT = False
 
     Returns
     -------
     float
         The percent values less than 54 mg/dL.
     """
-    _validate_bg(bg_array)
     return percent_values_by_range(
-        bg_array, lower_bound=1, upper_bound=54, upper_bound_operator=operator.lt, round_to_n_digits=round_to_n_digits,
+        bg_array,
+        lower_bound=1,
+        upper_bound=54,
+        upper_bound_operator=operator.lt,
+        round_to_n_digits=round_to_n_digits,
+        axis=axis,
+        validate=validate,
+        ignore_nan=ignore_nan,
     )
 
 
-def percent_values_lt_40(bg_array: "np.ndarray[np.float64]", round_to_n_digits: int = 3) -> np.float64:
+@instrumentation.instrumented
+@cache.cached
+def percent_values_lt_40(
+    bg_array: "np.ndarray[np.float64]",
+    round_to_n_digits: int = 3,
+    axis: int = None,
+    validate: bool = True,
+    ignore_nan: bool = False,
+) -> np.float64:
     """
     Calculate the percent of values less than (lt) 40 mg/dL.
 
@@ -156,19 +373,41 @@ def percent_values_lt_40(bg_array: "np.ndarray[np.float64]", round_to_n_digits:
         1D array containing data with  float or int type.
     round_to_n_digits : int, optional
         The number of digits to round the result to.
+    axis : int, optional
+        The axis along which each time series runs (e.g. 0 for a matrix where each column is a time series).
+        DEFAULT = None, the result over all of the values.
+    validate : bool, optional
+        Whether to check the glucose values before the calculation. DEFAULT = True
+    ignore_nan : bool, optional
+        Whether NaN values are missing readings to leave out, so the result is over the valid values only.
+        DEFAULT = False
 
     Returns
     -------
     float
         The percent values less than 54 mg/dL.
     """
-    _validate_bg(bg_array)
     return percent_values_by_range(
-        bg_array, lower_bound=1, upper_bound=40, upper_bound_operator=operator.lt, round_to_n_digits=round_to_n_digits,
+        bg_array,
+        lower_bound=1,
+        upper_bound=40,
+        upper_bound_operator=operator.lt,
+        round_to_n_digits=round_to_n_digits,
+        axis=axis,
+        validate=validate,
+        ignore_nan=ignore_nan,
     )
 
 
-def percent_values_gt_180(bg_array: "np.ndarray[np.float64]", round_to_n_digits: int = 3) -> np.float64:
+@instrumentation.instrumented
+@cache.cached
+def percent_values_gt_180(
+    bg_array: "np.ndarray[np.float64]",
+    round_to_n_digits: int = 3,
+    axis: int = None,
+    validate: bool = True,
+    ignore_nan: bool = False,
+) -> np.float64:
     """
     Calculate the percent of values greater than (gt) 180 mg/dL.
 
@@ -178,6 +417,14 @@ def percent_values_gt_180(bg_array: "np.ndarray[np.float64]", round_to_n_digits:
         1D array containing data with  float or int type.
     round_to_n_digits : int, optional
         The number of digits to round the result to.
+    axis : int, optional
+        The axis along which each time series runs (e.g. 0 for a matrix where each column is a time series).
+        DEFAULT = None, the result over all of the values.
+    validate : bool, optional
+        Whether to check the glucose values before the calculation. DEFAULT = True
+    ignore_nan : bool, optional
+        Whether NaN values are missing readings to leave out, so the result is over the valid values only.
+        DEFAULT = False
 
     Returns
     -------
@@ -190,10 +437,21 @@ def percent_values_gt_180(bg_array: "np.ndarray[np.float64]", round_to_n_digits:
         upper_bound=1000,
         lower_bound_operator=operator.gt,
         round_to_n_digits=round_to_n_digits,
+        axis=axis,
+        validate=validate,
+        ignore_nan=ignore_nan,
     )
 
 
-def percent_values_gt_250(bg_array: "np.ndarray[np.float64]", round_to_n_digits: int = 3) -> np.float64:
+@instrumentation.instrumented
+@cache.cached
+def percent_values_gt_250(
+    bg_array: "np.ndarray[np.float64]",
+    round_to_n_digits: int = 3,
+    axis: int = None,
+    validate: bool = True,
+    ignore_nan: bool = False,
+) -> np.float64:
     """
     Calculate the percent of values greater than (gt) 250 mg/dL.
 
@@ -203,6 +461,14 @@ def percent_values_gt_250(bg_array: "np.ndarray[np.float64]", round_to_n_digits:
         1D array containing data with  float or int type.
     round_to_n_digits : int, optional
         The number of digits to round the result to.
+    axis : int, optional
+        The axis along which each time series runs (e.g. 0 for a matrix where each column is a time series).
+        DEFAULT = None, the result over all of the values.
+    validate : bool, optional
+        Whether to check the glucose values before the calculation. DEFAULT = True
+    ignore_nan : bool, optional
+        Whether NaN values are missing readings to leave out, so the result is over the valid values only.
+        DEFAULT = False
 
     Returns
     -------
@@ -215,10 +481,21 @@ def percent_values_gt_250(bg_array: "np.ndarray[np.float64]", round_to_n_digits:
         upper_bound=1000,
         lower_bound_operator=operator.gt,
         round_to_n_digits=round_to_n_digits,
+        axis=axis,
+        validate=validate,
+        ignore_nan=ignore_nan,
     )
 
 
-def percent_values_gt_300(bg_array: "np.ndarray[np.float64]", round_to_n_digits: int = 3) -> np.float64:
+@instrumentation.instrumented
+@cache.cached
+def percent_values_gt_300(
+    bg_array: "np.ndarray[np.float64]",
+    round_to_n_digits: int = 3,
+    axis: int = None,
+    validate: bool = True,
+    ignore_nan: bool = False,
+) -> np.float64:
     """
     Calculate the percent of values greater than (gt) 300 mg/dL.
 
@@ -228,6 +505,14 @@ def percent_values_gt_300(bg_array: "np.ndarray[np.float64]", round_to_n_digits:
         1D array containing data with  float or int type.
     round_to_n_digits : int, optional
         The number of digits to round the result to.
+    axis : int, optional
+        The axis along which each time series runs (e.g. 0 for a matrix where each column is a time series).
+        DEFAULT = None, the result over all of the values.
+    validate : bool, optional
+        Whether to check the glucose values before the calculation. DEFAULT = True
+    ignore_nan : bool, optional
+        Whether NaN values are missing readings to leave out, so the result is over the valid values only.
+        DEFAULT = False
 
     Returns
     -------
@@ -240,10 +525,21 @@ def percent_values_gt_300(bg_array: "np.ndarray[np.float64]", round_to_n_digits:
         upper_bound=1000,
         lower_bound_operator=operator.gt,
         round_to_n_digits=round_to_n_digits,
+        axis=axis,
+        validate=validate,
+        ignore_nan=ignore_nan,
     )
 
 
-def percent_values_gt_400(bg_array: "np.ndarray[np.float64]", round_to_n_digits: int = 3) -> np.float64:
+@instrumentation.instrumented
+@cache.cached
+def percent_values_gt_400(
+    bg_array: "np.ndarray[np.float64]",
+    round_to_n_digits: int = 3,
+    axis: int = None,
+    validate: bool = True,
+    ignore_nan: bool = False,
+) -> np.float64:
     """
     Calculate the percent of values greater than (gt) 400 mg/dL.
 
@@ -253,6 +549,14 @@ def percent_values_gt_400(bg_array: "np.ndarray[np.float64]", round_to_n_digits:
         1D array containing data with  float or int type.
     round_to_n_digits : int, optional
         The number of digits to round the result to.
+    axis : int, optional
+        The axis along which each time series runs (e.g. 0 for a matrix where each column is a time series).
+        DEFAULT = None, the result over all of the values.
+    validate : bool, optional
+        Whether to check the glucose values before the calculation. DEFAULT = True
+    ignore_nan : bool, optional
+        Whether NaN values are missing readings to leave out, so the result is over the valid values only.
+        DEFAULT = False
 
     Returns
     -------
@@ -265,20 +569,36 @@ def percent_values_gt_400(bg_array: "np.ndarray[np.float64]", round_to_n_digits:
         upper_bound=1000,
         lower_bound_operator=operator.gt,
         round_to_n_digits=round_to_n_digits,
+        axis=axis,
+        validate=validate,
+        ignore_nan=ignore_nan,
     )
 
 
+@instrumentation.instrumented
+@cache.cached
 def episodes(
-    bg_array: "np.ndarray[np.float64]", episodes_threshold: int, min_ct_per_ep: int = 3, min_duration: int = 5,
+    bg_array: "np.ndarray[np.float64]",
+    episodes_threshold: int,
+    min_ct_per_ep: int = 3,
+    min_duration: int = 15,
+    axis: int = None,
+    timestamps: "np.ndarray[np.datetime64]" = None,
+    max_gap: int = 15,
+    validate: bool = True,
+    ignore_nan: bool = False,
 ) -> np.float64:
     """
     Calculate the number of episodes for a given set of glucose values based on provided thresholds.
     How the episode count it calculated.
     1. Identify all bg values that are within episode range.
-    2. Find the array value that is in range and its next value after it is not in range.  This gives the index of the
-    last bg in an potential episode.
-    3. The next check looks at the value at the array index number based on min_ct_per_ep before the value from step 2.
-    If that value is a 1 then we count this range as an "episode".
+    2. Find the start and end of every run of consecutive in range values from the changes between neighboring values.
+    The array is not treated as circular, so a run at the end of the array never joins a run at the start.
+    3. Count the runs that are at least min_ct_per_ep values long as an "episode".
+    When timestamps are provided, a run is also split wherever the time between two consecutive values is more than
+    max_gap minutes, and a run counts as an "episode" when it lasts at least min_duration minutes. The duration of a
+    run is the time from its first to its last value plus the typical (median) time between values, so that three
+    values at a 5 minute interval last 15 minutes.
 
     Parameters
     ----------
@@ -288,31 +608,55 @@ def episodes(
         Any bg values below this value will be considered as within the episode.
     min_ct_per_ep : int, optional
         The number of consecutive bg values required in the threshold range to be considered an episode.
-    min_duration : int, optional (Not Implemented at this time.)
-        The number of minutes expected between each bg value in the array. If there are gaps the code will .....
+        Only used when timestamps are not provided.
+    min_duration : int, optional
+        The number of minutes a run of bg values in the threshold range must last to be considered an episode.
+        Only used when timestamps are provided. DEFAULT = 15
+    axis : int, optional
+        The axis along which each time series runs (e.g. 0 for a matrix where each column is a time series).
+        DEFAULT = None, the episodes over all of the values.
+    timestamps : ndarray, optional
+        Array of datetime64 (or values convertible to datetime64) with the time of each bg value. Either the same
+        shape as bg_array, or 1D with one timestamp per value along axis when every time series shares the same times.
+    max_gap : int, optional
+        The maximum number of minutes between consecutive bg values within one episode. A longer gap in the data
+        ends the episode. Only used when timestamps are provided. DEFAULT = 15
+    validate : bool, optional
+        Whether to check the glucose values before the calculation. DEFAULT = True
+    ignore_nan : bool, optional
+        Whether NaN values are missing readings to leave out, so the episodes are over the valid values only: a run
+        continues across missing values, and min_ct_per_ep counts the valid values. With timestamps a run still ends
+        where the time between two valid values is more than max_gap minutes, so pass timestamps for data with long
+        gaps. Otherwise a NaN value is not below the threshold, so it ends a run. DEFAULT = False
 
     Returns
     -------
-    int
-        The number of episodes matching input specifications.
+    int or ndarray
+        The number of episodes matching input specifications, one per time series when axis is given.
     """
-    _validate_bg(bg_array)
-    check_string = "(in_range == 1) & (np.roll(in_range, -1) == 0) "
-    i = min_ct_per_ep - 1
-    while i > 0:
-        check_string = check_string + f" & (np.roll(in_range, {i}) == 1) "
-        i -= 1
-    in_range = np.where(bg_array < episodes_threshold, 1, 0)
-    episodes_count = np.count_nonzero(in_range[eval(check_string)])
-
-    return episodes_count
+    if validate:
+        _validate_bg(bg_array)
+    if timestamps is not None:
+        return _count_timed_episodes(
+            bg_array, timestamps, episodes_threshold, min_duration, max_gap, axis=axis, ignore_nan=ignore_nan
+        )
+    return _count_episodes(bg_array, episodes_threshold, min_ct_per_ep, axis=axis, ignore_nan=ignore_nan)
 
 
+@instrumentation.instrumented
+@cache.cached
 def blood_glucose_risk_index(
-    bg_array: "np.ndarray[np.float64]", round_to_n_digits: int = 2
+    bg_array: "np.ndarray[np.float64]",
+    round_to_n_digits: int = 2,
+    axis: int = None,
+    validate: bool = True,
+    return_risk_values: bool = False,
+    ignore_nan: bool = False,
 ) -> Tuple[float, float, float]:
     """
     Calculate the LBGI, HBGI and BRGI within a set of glucose values from Clarke, W., & Kovatchev, B. (2009)
+    The risk of each value is looked up in a precomputed table of the risk function (every 0.1 mg/dL from 1 to
+    1000 mg/dL), exact for integer values and linearly interpolated otherwise. The input array is never modified.
 
     Parameters
     ----------
@@ -320,6 +664,17 @@ def blood_glucose_risk_index(
         1D array containing data with  float or int type.
     round_to_n_digits : int, optional
         The number of digits to round the result to.
+    axis : int, optional
+        The axis along which each time series runs (e.g. 0 for a matrix where each column is a time series).
+        DEFAULT = None, the result over all of the values.
+    validate : bool, optional
+        Whether to check the glucose values before the calculation. DEFAULT = True
+    return_risk_values : bool, optional
+        Whether to also return the low (rL) and high (rH) risk of every glucose value, so other risk metrics can
+        reuse them. DEFAULT = False
+    ignore_nan : bool, optional
+        Whether NaN values are missing readings to leave out, so the result is over the valid values only.
+        DEFAULT = False
 
     Returns
     -------
@@ -329,25 +684,29 @@ def blood_glucose_risk_index(
         The number HBGI results.
     int
         The number BRGI results.
+    ndarray
+        The rL risk of every glucose value, the same shape as bg_array. Only returned when return_risk_values is True.
+    ndarray
+        The rH risk of every glucose value, the same shape as bg_array. Only returned when return_risk_values is True.
     """
-    _validate_bg(bg_array)
-    bg_array[bg_array < 1] = 1  # this is added to take care of edge case BG <= 0
-    transformed_bg = 1.509 * ((np.log(bg_array) ** 1.084) - 5.381)
-    risk_power = 10 * (transformed_bg ** 2)
-    low_risk_bool = transformed_bg < 0
-    high_risk_bool = transformed_bg > 0
-    rlBG = risk_power * low_risk_bool
-    rhBG = risk_power * high_risk_bool
-    lbgi = np.mean(rlBG)
-    hbgi = np.mean(rhBG)
-    bgri = round(lbgi + hbgi, round_to_n_digits)
-    return (
-        round(lbgi, round_to_n_digits),
-        round(hbgi, round_to_n_digits),
+    if validate:
+        _validate_bg(bg_array)
+    rlBG, rhBG = _risk_values(bg_array)
+    mean = np.nanmean if ignore_nan else np.mean
+    lbgi = mean(rlBG, axis=axis)
+    hbgi = mean(rhBG, axis=axis)
+    bgri = np.round(lbgi + hbgi, round_to_n_digits)
+    indices = (
+        np.round(lbgi, round_to_n_digits),
+        np.round(hbgi, round_to_n_digits),
         bgri,
     )
+    if return_risk_values:
+        return indices + (rlBG, rhBG)
+    return indices
 
 
+@instrumentation.instrumented
 def lbgi_risk_score(lbgi: np.float64) -> int:
     """
     Calculate the Tidepool Risk Score associated with the LBGI
@@ -355,44 +714,551 @@ def lbgi_risk_score(lbgi: np.float64) -> int:
 
     Parameters
     ----------
-    lbgi : float
-        LBGI value calculated from BGRI
+    lbgi : float or ndarray
+        LBGI value calculated from BGRI, or an array of LBGI values (e.g. per patient or per rolling window)
 
     Returns
     -------
-    int
-        The Tidepool LBGI Risk Score.
+    int or ndarray
+        The Tidepool LBGI Risk Score, with the same shape as lbgi for an array.
+    """
+    # scores 1 to 4 start above 0, 2.5, 5 and 10, and NaN scores 0
+    lbgi = np.asarray(lbgi)
+    risk_score = np.where(np.isnan(lbgi), 0, np.digitize(lbgi, _LBGI_RISK_THRESHOLDS, right=True))
+    return int(risk_score) if risk_score.ndim == 0 else risk_score
+
+
+@instrumentation.instrumented
+def lbgi_risk_score_counts(lbgi: "np.ndarray[np.float64]", axis: int = None) -> "np.ndarray[np.int64]":
+    """
+    Count the LBGI values at each Tidepool LBGI Risk Score, see lbgi_risk_score.
+
+    Parameters
+    ----------
+    lbgi : ndarray
+        Array of LBGI values.
+    axis : int, optional
+        The axis to count along (e.g. 1 for a patient x window matrix to count per patient).
+        DEFAULT = None, the counts over all of the values.
+
+    Returns
+    -------
+    ndarray
+        The number of values with each risk score from 0 to 4, on the last axis when axis is given.
+    """
+    return _risk_score_counts(lbgi_risk_score(lbgi), len(_LBGI_RISK_THRESHOLDS) + 1, axis)
+
+
+@instrumentation.instrumented
+@cache.cached
+def summary(
+    bg_array: "np.ndarray[np.float64]",
+    episodes_threshold: int = 54,
+    min_ct_per_ep: int = 3,
+    round_to_n_digits: int = 3,
+    axis: int = None,
+    validate: bool = True,
+    ignore_nan: bool = False,
+) -> Dict[str, np.float64]:
     """
-    if lbgi > 10:
-        risk_score = 4
-    elif lbgi > 5:
-        risk_score = 3
-    elif lbgi > 2.5:
-        risk_score = 2
-    elif lbgi > 0:
-        risk_score = 1
-    else:
-        risk_score = 0
-    return risk_score
+    Calculate the standard set of CGM metrics on a set of glucose values in a single validated pass.
+    The array is validated once and the shared intermediates (mean, standard deviation, range counts and
+    risk values) are computed once, instead of once per metric as happens when calling each function.
+    Every value matches the value returned by the corresponding individual function.
+
+    Parameters
+    ----------
+    bg_array : ndarray
+        1D array containing data with float or int type.
+    episodes_threshold : int, optional
+        Any bg values below this value will be considered as within an episode. DEFAULT = 54
+    min_ct_per_ep : int, optional
+        The number of consecutive bg values required in the threshold range to be considered an episode.
+    round_to_n_digits : int, optional
+        The number of digits to round the glucose management index and the percentages to. DEFAULT = 3
+    axis : int, optional
+        The axis along which each time series runs (e.g. 0 for a matrix where each column is a time series).
+        DEFAULT = None, the metrics over all of the values.
+    validate : bool, optional
+        Whether to check that the glucose values are within the expected range. Set to False for values that were
+        already validated upstream (e.g. with validation_report) to skip re-checking them. DEFAULT = True
+    ignore_nan : bool, optional
+        Whether NaN values are missing readings to leave out, so the result is over the valid values only.
+        DEFAULT = False
+
+    Returns
+    -------
+    dict
+        The calculated metrics keyed by the name of the function that calculates each one individually
+        (e.g. "percent_values_lt_70", "glucose_management_index"), plus "count", "mean", "std_deviation",
+        "coefficient_of_variation", "lbgi", "hbgi", "bgri" and "episodes". Instead of a warning, the number of
+        values less than 38 and greater than 402 mg/dL are returned as "n_values_lt_38" and "n_values_gt_402".
+        Each value is an array with one entry per time series when axis is given.
+    """
+    if validate:
+        _raise_if_invalid(*_min_max(bg_array))
+    n_values = _n_values(bg_array, axis, ignore_nan)
+    mean, std = (np.nanmean, np.nanstd) if ignore_nan else (np.mean, np.std)
+
+    # values are known to be within [1, 1000] after validation (and NaN is in no range), so every range is a
+    # difference of two counts
+    n_lt = {threshold: np.count_nonzero(bg_array < threshold, axis=axis) for threshold in _LT_THRESHOLDS}
+    n_le = {threshold: np.count_nonzero(bg_array <= threshold, axis=axis) for threshold in _LE_THRESHOLDS}
+    rlBG, rhBG = _risk_values(bg_array)
+
+    return _summary_from_statistics(
+        n_values=n_values,
+        mean_bg=mean(bg_array, axis=axis),
+        std_bg=std(bg_array, axis=axis),
+        n_lt=n_lt,
+        n_le=n_le,
+        lbgi=mean(rlBG, axis=axis),
+        hbgi=mean(rhBG, axis=axis),
+        episodes_count=_count_episodes(bg_array, episodes_threshold, min_ct_per_ep, axis=axis, ignore_nan=ignore_nan),
+        round_to_n_digits=round_to_n_digits,
+    )
+
+
+def _summary_from_statistics(
+    n_values: int,
+    mean_bg: np.float64,
+    std_bg: np.float64,
+    n_lt: Dict[int, int],
+    n_le: Dict[int, int],
+    lbgi: np.float64,
+    hbgi: np.float64,
+    episodes_count: int,
+    round_to_n_digits: int = 3,
+) -> Dict[str, np.float64]:
+    # The summary metrics from their sufficient statistics: the count, mean and standard deviation of the values,
+    # the number of values below (n_lt) and at or below (n_le) each of the summary thresholds, the LBGI and HBGI,
+    # and the number of episodes.
+    mean_bg = np.round(mean_bg, 2)
+    std_bg = np.round(std_bg, 2)
+    return {
+        "count": n_values,
+        "mean": mean_bg,
+        "std_deviation": std_bg,
+        "coefficient_of_variation": common._coefficient_of_variation(mean_bg, std_bg),
+        "glucose_management_index": np.round(_gmi(mean_bg), round_to_n_digits),
+        **{
+            name: _percent(_range_count(n_lt, n_le, *bounds), n_values, round_to_n_digits)
+            for name, bounds in _PERCENT_RANGES.items()
+        },
+        "lbgi": np.round(lbgi, 2),
+        "hbgi": np.round(hbgi, 2),
+        "bgri": np.round(lbgi + hbgi, 2),
+        "episodes": episodes_count,
+        **{name: _range_count(n_lt, n_le, *bounds) for name, bounds in _COUNT_RANGES.items()},
+    }
+
+
+def _range_count(n_lt: Dict[int, int], n_le: Dict[int, int], lower: Tuple[str, int], upper: Tuple[str, int]) -> int:
+    # the number of values in one of _PERCENT_RANGES or _COUNT_RANGES, from the counts below and at or below each
+    # threshold
+    counts = {"lt": n_lt, "le": n_le}
+    n_upper = counts[upper[0]][upper[1]]
+    return n_upper if lower is None else n_upper - counts[lower[0]][lower[1]]
+
+
+def _percent(n_meet_criteria: int, n_values: int, round_to_n_digits: int = 3) -> np.float64:
+    return np.round(n_meet_criteria / n_values * 100, round_to_n_digits)
 
 
 def _validate_input(lower_threshold: int, upper_threshold: int) -> Tuple[int, int]:
-    if any(num < 0 for num in [lower_threshold, upper_threshold]):
+    # also checks every pair of arrays of thresholds
+    if any(np.any(np.asarray(num) < 0) for num in [lower_threshold, upper_threshold]):
         raise Exception("lower and upper thresholds must be a non-negative number")
-    if lower_threshold > upper_threshold:
+    if np.any(np.asarray(lower_threshold) > np.asarray(upper_threshold)):
         raise Exception("lower threshold is higher than the upper threshold.")
     return
 
 
+def _as_operator_array(operators: object) -> "np.ndarray[np.object_]":
+    if callable(operators):
+        return np.array(operators, dtype=object)
+    operator_array = np.empty(np.shape(operators), dtype=object)
+    operator_array[...] = operators
+    return operator_array
+
+
+def _is_operator(
+    operators: "np.ndarray[np.object_]", operator_true: object, operator_false: object, name: str
+) -> "np.ndarray[np.bool_]":
+    is_true = operators == operator_true
+    if not np.all(is_true | (operators == operator_false)):
+        raise Exception(f"{name} must be operator.{operator_true.__name__} or operator.{operator_false.__name__}.")
+    return np.asarray(is_true, dtype=bool)
+
+
+def _sorted_counts(
+    sorted_rows: "np.ndarray[np.float64]", bounds: "np.ndarray[np.float64]", inclusive: "np.ndarray[np.bool_]"
+) -> "np.ndarray[np.int64]":
+    # The number of values of each sorted series row below each bound (or at or below it, where inclusive), by binary
+    # search. Rows shorter than _FLAT_SEARCH_MAX_VALUES are offset past the end of the previous row (as in
+    # rolling._window_bounds), so one search of the flattened rows counts every bound of every series. Longer rows
+    # are searched one at a time, since there the O(n) pass to offset the values costs more than the loop.
+    n_series, n_values = sorted_rows.shape
+    counts = np.zeros((n_series, len(bounds)), dtype=np.int64)
+    if sorted_rows.size == 0 or len(bounds) == 0:
+        return counts
+    if n_values > _FLAT_SEARCH_MAX_VALUES:
+        for i, row in enumerate(sorted_rows):
+            counts[i, inclusive] = np.searchsorted(row, bounds[inclusive], side="right")
+            counts[i, ~inclusive] = np.searchsorted(row, bounds[~inclusive], side="left")
+        return counts
+
+    # NaN sorts last, and is moved to just past the largest value and bound, so the flattened rows stay sorted and
+    # NaN is counted below no bound
+    lowest = np.fmin(np.fmin.reduce(sorted_rows[:, 0]), np.min(bounds))
+    highest = np.fmax(np.fmax.reduce(sorted_rows, axis=None), np.max(bounds))
+    offsets = np.arange(n_series)[:, np.newaxis] * (highest - lowest + 1)
+    shifted = np.where(np.isnan(sorted_rows), highest - lowest + 0.5, sorted_rows - lowest) + offsets
+    for side, columns in [("right", inclusive), ("left", ~inclusive)]:
+        # searching for the bounds in increasing order keeps the search of each row within its cached values
+        columns = np.flatnonzero(columns)
+        columns = columns[np.argsort(bounds[columns])]
+        counts[:, columns] = np.searchsorted(shifted.ravel(), bounds[columns] - lowest + offsets, side=side)
+    return counts - np.arange(n_series)[:, np.newaxis] * n_values
+
+
+@instrumentation.instrumented
+@cache.cached
+def validation_report(
+    bg_array: "np.ndarray[np.float64]", axis: int = None, ignore_nan: bool = False
+) -> Dict[str, "np.ndarray[np.int64]"]:
+    """
+    Check a set of glucose values against the expected range of CGM values (38 to 402 mg/dL) and the valid range of
+    glucose values (1 to 1000 mg/dL), and report the findings for each time series instead of warning about them.
+
+    Parameters
+    ----------
+    bg_array : ndarray
+        1D array containing data with float or int type.
+    axis : int, optional
+        The axis along which each time series runs (e.g. 0 for a matrix where each column is a time series).
+        DEFAULT = None, one report over all of the values.
+    ignore_nan : bool, optional
+        Whether NaN values are missing readings to leave out of the report. Otherwise NaN values are not valid.
+        DEFAULT = False
+
+    Returns
+    -------
+    dict
+        "n_values_lt_38", "n_values_gt_402", "n_values_lt_1" and "n_values_gt_1000": the number of values beyond
+        each limit, and "valid": whether there are no values less than 1 or greater than 1000, which the metrics
+        reject. Each value is an array with one entry per time series when axis is given.
+    """
+    # NaN compares False, so it is counted beyond no limit
+    report = {
+        "n_values_lt_38": np.count_nonzero(bg_array < 38, axis=axis),
+        "n_values_gt_402": np.count_nonzero(bg_array > 402, axis=axis),
+        "n_values_lt_1": np.count_nonzero(bg_array < 1, axis=axis),
+        "n_values_gt_1000": np.count_nonzero(bg_array > 1000, axis=axis),
+    }
+    is_valid = (report["n_values_lt_1"] == 0) & (report["n_values_gt_1000"] == 0)
+    if not ignore_nan:
+        is_valid &= ~np.any(np.isnan(bg_array), axis=axis)
+    report["valid"] = is_valid
+    return report
+
+
+@instrumentation.instrumented
+@cache.cached
+def data_sufficiency(
+    bg_array: "np.ndarray[np.float64]",
+    expected_n_values: int = None,
+    timestamps: "np.ndarray[np.datetime64]" = None,
+    sample_minutes: float = 5,
+    round_to_n_digits: int = 3,
+    axis: int = None,
+) -> np.float64:
+    """
+    Calculate the percent of the expected glucose readings that are present (not NaN), e.g. to decide whether
+    there is enough data for the metrics calculated with ignore_nan=True to be meaningful.
+
+    Parameters
+    ----------
+    bg_array : ndarray
+        1D array containing data with float or int type, with NaN for missing readings.
+    expected_n_values : int, optional
+        The number of readings expected, e.g. 14 * 288 for 14 days of 5 minute readings.
+        DEFAULT = the number of values, or the readings expected between the first and last timestamp.
+    timestamps : ndarray, optional
+        Array of datetime64 with the time of each bg value, either the same shape as bg_array or 1D with one
+        timestamp per value along axis. When provided, a reading is expected every sample_minutes from the first to
+        the last timestamp, so readings dropped from the data also count as missing.
+    sample_minutes : float, optional
+        The minutes between expected readings when timestamps are provided. DEFAULT = 5
+    round_to_n_digits : int, optional
+        The number of digits to round the result to. DEFAULT = 3
+    axis : int, optional
+        The axis along which each time series runs (e.g. 0 for a matrix where each column is a time series).
+        DEFAULT = None, the result over all of the values.
+
+    Returns
+    -------
+    float or ndarray
+        The percentage of expected readings present, one per time series when axis is given.
+    """
+    bg_array = np.asarray(bg_array)
+    n_present = _n_values(bg_array, axis, ignore_nan=True)
+    if expected_n_values is None and timestamps is not None:
+        minute_rows = _minute_rows(timestamps, bg_array, axis)
+        time_span = np.max(minute_rows, axis=1) - np.min(minute_rows, axis=1)
+        expected_n_values = np.round(time_span / sample_minutes) + 1
+        expected_n_values = expected_n_values[0] if axis is None else expected_n_values.reshape(np.shape(n_present))
+    elif expected_n_values is None:
+        expected_n_values = _n_values(bg_array, axis)
+    return np.round(n_present / expected_n_values * 100, round_to_n_digits)
+
+
+@instrumentation.instrumented
 def _validate_bg(bg_array: "np.ndarray[np.float64]"):
-    if (bg_array < 38).any():
+    min_bg, max_bg = _min_max(bg_array)
+
+    if min_bg < 38:
         warnings.warn("Some values in the passed in array had glucose values less than 38.")
+        instrumentation.record_validation_warning()
 
-    if (bg_array > 402).any():
+    if max_bg > 402:
         warnings.warn("Some values in the passed in array had glucose values greater than 402.")
+        instrumentation.record_validation_warning()
+
+    _raise_if_invalid(min_bg, max_bg)
+
 
-    if (bg_array < 1).any():
+def _min_max(bg_array: "np.ndarray[np.float64]", axis: int = None) -> Tuple[np.float64, np.float64]:
+    if np.size(bg_array) == 0:
+        series_shape = () if axis is None else _series_shape(bg_array, axis)
+        return np.full(series_shape, np.inf), np.full(series_shape, -np.inf)
+    # fmin and fmax skip NaN (without the all-NaN warning of nanmin), so a NaN value never hides an out of range
+    # value, and only all-NaN series are NaN (which is in no range)
+    return np.fmin.reduce(bg_array, axis=axis), np.fmax.reduce(bg_array, axis=axis)
+
+
+def _raise_if_invalid(min_bg: np.float64, max_bg: np.float64):
+    if np.any(min_bg < 1):
         raise Exception("Some values in the passed in array had glucose values less than 1.")
 
-    if (bg_array > 1000).any():
+    if np.any(max_bg > 1000):
         raise Exception("Some values in the passed in array had glucose values greater than 1000.")
+
+
+def _n_values(bg_array: "np.ndarray[np.float64]", axis: int = None, ignore_nan: bool = False) -> int:
+    if ignore_nan:
+        return np.count_nonzero(~np.isnan(bg_array), axis=axis)
+    return bg_array.size if axis is None else bg_array.shape[axis]
+
+
+def _count_episodes(
+    bg_array: "np.ndarray[np.float64]",
+    episodes_threshold: int,
+    min_ct_per_ep: int,
+    axis: int = None,
+    ignore_nan: bool = False,
+) -> int:
+    in_range_rows, _ = _episode_rows(_as_series_rows(np.asarray(bg_array), axis), episodes_threshold, ignore_nan)
+    episodes_count = _run_counts(in_range_rows, min_ct_per_ep)
+    return episodes_count[0] if axis is None else episodes_count.reshape(_series_shape(bg_array, axis))
+
+
+@backends.kernel
+def _run_counts(mask_rows: "np.ndarray[np.bool_]", min_length: int) -> "np.ndarray[np.int64]":
+    # the number of runs of True values at least min_length long in each row
+    series, _, lengths = _runs(mask_rows, axis=-1)
+    return np.bincount(series[lengths >= min_length], minlength=len(mask_rows))
+
+
+def _count_timed_episodes(
+    bg_array: "np.ndarray[np.float64]",
+    timestamps: "np.ndarray[np.datetime64]",
+    episodes_threshold: int,
+    min_duration: int,
+    max_gap: int,
+    axis: int = None,
+    ignore_nan: bool = False,
+) -> int:
+    bg_rows = _as_series_rows(np.asarray(bg_array), axis)
+    minute_rows = _minute_rows(timestamps, bg_array, axis)
+    in_range_rows, minute_rows = _episode_rows(bg_rows, episodes_threshold, ignore_nan, minute_rows)
+    episodes_count = _timed_run_counts(in_range_rows, minute_rows, max_gap, min_duration)
+    return episodes_count[0] if axis is None else episodes_count.reshape(_series_shape(bg_array, axis))
+
+
+@backends.kernel
+def _timed_run_counts(
+    mask_rows: "np.ndarray[np.bool_]", minute_rows: "np.ndarray[np.float64]", max_gap: float, min_duration: float
+) -> "np.ndarray[np.int64]":
+    # the number of runs of True values in each row, split at gaps of more than max_gap minutes, that last at least
+    # min_duration minutes
+    minutes_between = np.diff(minute_rows, axis=1)
+    gaps = np.zeros(minute_rows.shape, dtype=bool)
+    gaps[:, 1:] = minutes_between > max_gap
+    series, run_starts, lengths = _runs(mask_rows, axis=-1, breaks=gaps)
+
+    # the minutes of dropped missing values are NaN (see _episode_rows), and a row without two valid values has no
+    # typical interval
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", RuntimeWarning)
+        typical_interval = np.nanmedian(minutes_between, axis=1) if minutes_between.shape[1] else np.nan
+    typical_interval = np.nan_to_num(np.broadcast_to(typical_interval, len(minute_rows)))
+    run_ends = run_starts + lengths - 1
+    durations = minute_rows[series, run_ends] - minute_rows[series, run_starts] + typical_interval[series]
+    return np.bincount(series[durations >= min_duration], minlength=len(mask_rows))
+
+
+def _episode_rows(
+    bg_rows: "np.ndarray[np.float64]",
+    episodes_threshold: int,
+    ignore_nan: bool = False,
+    minute_rows: "np.ndarray[np.float64]" = None,
+) -> Tuple["np.ndarray[np.bool_]", "np.ndarray[np.float64]"]:
+    # The rows of the mask of the values below the episodes threshold, and the minute rows of the values. With
+    # ignore_nan the missing values are dropped: the valid values of each row move to the front, followed by False
+    # (and NaN minutes), so that a run continues across missing values instead of ending at them.
+    in_range_rows = bg_rows < episodes_threshold
+    if ignore_nan:
+        is_valid_rows = ~np.isnan(bg_rows)
+        if not np.all(is_valid_rows):
+            in_range_rows = _valid_first(in_range_rows, is_valid_rows, False)
+            if minute_rows is not None:
+                minute_rows = _valid_first(minute_rows, is_valid_rows, np.nan)
+    return in_range_rows, minute_rows
+
+
+def _valid_first(
+    value_rows: "np.ndarray[np.float64]", is_valid_rows: "np.ndarray[np.bool_]", fill: object
+) -> "np.ndarray[np.float64]":
+    # the valid values of each row in order at the start of the row, followed by fill, in O(n)
+    rows, columns = np.nonzero(is_valid_rows)
+    positions = np.cumsum(is_valid_rows, axis=1)[rows, columns] - 1
+    compacted = np.full(value_rows.shape, fill, dtype=value_rows.dtype)
+    compacted[rows, positions] = value_rows[rows, columns]
+    return compacted
+
+
+def _minute_rows(
+    timestamps: "np.ndarray[np.datetime64]", bg_array: "np.ndarray[np.float64]", axis: int = None
+) -> "np.ndarray[np.float64]":
+    # the timestamps as minutes since the first timestamp, laid out in the same series rows as the glucose values
+    minutes = _minutes_since_start(timestamps)
+    if minutes.ndim == 1 and bg_array.ndim > 1 and axis is not None:
+        minutes = np.broadcast_to(minutes, _series_shape(bg_array, axis) + minutes.shape)
+        minutes = np.moveaxis(minutes, -1, axis)
+    minute_rows = _as_series_rows(minutes, axis)
+    if minute_rows.shape != _as_series_rows(bg_array, axis).shape:
+        raise Exception("timestamps must have one value per glucose value.")
+    return minute_rows
+
+
+def _minutes_since_start(timestamps: "np.ndarray[np.datetime64]") -> "np.ndarray[np.float64]":
+    timestamps = np.asarray(timestamps)
+    if not np.issubdtype(timestamps.dtype, np.datetime64):
+        timestamps = timestamps.astype("datetime64[ns]")
+    return (timestamps - timestamps.min()) / np.timedelta64(1, "m")
+
+
+def _minutes_after_midnight(timestamps: "np.ndarray[np.datetime64]") -> np.float64:
+    # the time of day of the first timestamp, so the minutes since the first timestamp line up with the day
+    timestamps = np.asarray(timestamps)
+    if not np.issubdtype(timestamps.dtype, np.datetime64):
+        timestamps = timestamps.astype("datetime64[ns]")
+    first = timestamps.min()
+    return (first - first.astype("datetime64[D]")) / np.timedelta64(1, "m")
+
+
+def _series_shape(bg_array: "np.ndarray[np.float64]", axis: int = None) -> Tuple[int, ...]:
+    if axis is None:
+        return (1,)
+    return tuple(np.delete(bg_array.shape, axis).tolist())
+
+
+def _as_series_rows(bg_array: "np.ndarray[np.float64]", axis: int = None) -> "np.ndarray[np.float64]":
+    # every time series becomes a row of a 2D array, so the values of a series are contiguous
+    if axis is None:
+        return np.reshape(bg_array, (1, -1))
+    bg_array = np.moveaxis(bg_array, axis, -1)
+    return bg_array.reshape(-1, bg_array.shape[-1])
+
+
+def _from_series_rows(
+    rows: "np.ndarray[np.float64]", bg_array: "np.ndarray[np.float64]", axis: int = None
+) -> "np.ndarray[np.float64]":
+    # the inverse of _as_series_rows for a per series result with a new last dimension, which takes the place of axis
+    if axis is None:
+        return rows[0]
+    rows = rows.reshape(_series_shape(bg_array, axis) + rows.shape[-1:])
+    return np.moveaxis(rows, -1, axis)
+
+
+@instrumentation.instrumented
+def _runs(
+    mask: "np.ndarray[np.bool_]", axis: int = None, breaks: "np.ndarray[np.bool_]" = None
+) -> Tuple["np.ndarray[np.int64]", "np.ndarray[np.int64]", "np.ndarray[np.int64]"]:
+    # Run length encoding of the True values in the mask, in O(n) with no wrap around between the end of one series
+    # and the start of the next. breaks (already in series rows) marks values that must start a new run even when the
+    # previous value is True. Returns the series (row) index, the start index within the series and the length of
+    # every run, in order.
+    rows = _as_series_rows(np.asarray(mask, dtype=bool), axis)
+    n_series, n_values = rows.shape
+    starts_run = rows.copy()
+    starts_run[:, 1:] &= ~rows[:, :-1]
+    ends_run = rows.copy()
+    ends_run[:, :-1] &= ~rows[:, 1:]
+    if breaks is not None:
+        starts_run |= rows & breaks
+        ends_run[:, :-1] |= rows[:, :-1] & breaks[:, 1:]
+    starts = np.flatnonzero(starts_run)
+    ends = np.flatnonzero(ends_run)
+    series, run_starts = np.divmod(starts, n_values)
+    return series, run_starts, ends - starts + 1
+
+
+def _risk(bg_array: "np.ndarray[np.float64]") -> Tuple["np.ndarray[np.float64]", "np.ndarray[np.float64]"]:
+    # the low and high risk of each glucose value, from the closed form of the risk transform
+    transformed_bg = 1.509 * ((np.log(bg_array) ** 1.084) - 5.381)
+    risk_power = 10 * (transformed_bg ** 2)
+    return risk_power * (transformed_bg < 0), risk_power * (transformed_bg > 0)
+
+
+def _risk_table() -> Tuple["np.ndarray[np.float64]", "np.ndarray[np.float64]", "np.ndarray[np.float64]"]:
+    # the low and high risk of every 0.1 mg/dL from 1 to 1000 mg/dL, with every integer value exactly on the grid
+    table_bg = np.arange(10, 10001) / 10
+    return (table_bg, *_risk(table_bg))
+
+
+_RISK_TABLE_BG, _LOW_RISK_TABLE, _HIGH_RISK_TABLE = _risk_table()
+# Below this value the low risk curves too sharply for the table (interpolating it is off by up to 0.33 per value
+# below 2 mg/dL), so float values below it are calculated from the closed form. Above it the table is within 1e-4.
+_EXACT_RISK_BELOW = 38
+
+
+@instrumentation.instrumented
+def _risk_values(bg_array: "np.ndarray[np.float64]") -> Tuple["np.ndarray[np.float64]", "np.ndarray[np.float64]"]:
+    # values below 1 take the risk of 1 to take care of edge case BG <= 0 (and values above 1000 the risk of 1000)
+    bg_array = np.asarray(bg_array)
+    if np.issubdtype(bg_array.dtype, np.integer):
+        # in intp, since the table index overflows small integer dtypes (e.g. 250 as uint8)
+        table_index = (np.clip(bg_array.astype(np.intp, copy=False), 1, 1000) - 1) * 10
+        return _LOW_RISK_TABLE[table_index], _HIGH_RISK_TABLE[table_index]
+    bg_array = bg_array.astype(np.float64, copy=False)
+    rlBG = np.interp(bg_array, _RISK_TABLE_BG, _LOW_RISK_TABLE)
+    rhBG = np.interp(bg_array, _RISK_TABLE_BG, _HIGH_RISK_TABLE)
+    is_low = bg_array < _EXACT_RISK_BELOW
+    if np.any(is_low):
+        # the high risk is 0 at these values, [()] turns the risk of a single value back into a scalar
+        rlBG = np.asarray(rlBG)
+        rlBG[is_low] = _risk(np.maximum(bg_array[is_low], 1))[0]
+        rlBG = rlBG[()]
+    return rlBG, rhBG
+
+
+def _risk_score_counts(
+    risk_scores: "np.ndarray[np.int64]", n_scores: int, axis: int = None
+) -> "np.ndarray[np.int64]":
+    # the number of values at each risk score, from one comparison per score instead of a loop over the values
+    is_score = np.expand_dims(risk_scores, -1) == np.arange(n_scores)
+    if axis is None:
+        return np.count_nonzero(is_score.reshape(-1, n_scores), axis=0)
+    return np.count_nonzero(is_score, axis=axis if axis >= 0 else axis - 1)
@@ -0,0 +1,250 @@
+import numpy as np
+import operator
+from typing import Iterable, Tuple
+from tidepool_data_science_metrics.common import common
+from tidepool_data_science_metrics.glucose import glucose
+
+# every integer glucose value from 0 to 1000 mg/dL has its own bin
+_BG_BINS = np.arange(1001)
+
+
+class GlucoseHistogram:
+    """
+    The number of glucose values at each integer mg/dL value from 0 to 1000. Built in one O(n) np.bincount pass,
+    after which every range percentage, the mean, the standard deviation, the coefficient of variation, the GMI
+    and the LBGI/HBGI are evaluated in O(1000) without going back to the glucose values.
+
+    Histograms add together (hist_a + hist_b, or GlucoseHistogram.merge), so for example per-day histograms can be
+    kept and combined for any range of dates. Float glucose values are rounded to the nearest integer mg/dL, so the
+    metrics are exact for integer CGM values and approximate to 1 mg/dL otherwise. Missing (NaN) values have no
+    bin; they are counted separately in n_missing and every metric is over the valid values.
+
+    Parameters
+    ----------
+    counts : ndarray
+        The number of values in each bin, with 1001 bins on the last axis. Any leading axes are separate time series
+        (e.g. a histogram per patient), and every metric returns one result per time series.
+    n_missing : int or ndarray, optional
+        The number of missing values, one per time series. DEFAULT = 0
+    """
+
+    def __init__(self, counts: "np.ndarray[np.int64]", n_missing: "np.ndarray[np.int64]" = 0):
+        counts = np.asarray(counts, dtype=np.int64)
+        if counts.shape[-1:] != _BG_BINS.shape:
+            raise Exception("counts must have one bin for every integer glucose value from 0 to 1000.")
+        self.counts = counts
+        self.n_missing = np.broadcast_to(np.asarray(n_missing, dtype=np.int64), counts.shape[:-1]).copy()
+
+    @classmethod
+    def from_values(
+        cls, bg_array: "np.ndarray[np.float64]", axis: int = None, validate: bool = True, ignore_nan: bool = False
+    ) -> "GlucoseHistogram":
+        """
+        Build the histogram of a set of glucose values.
+
+        Parameters
+        ----------
+        bg_array : ndarray
+            1D array containing data with float or int type.
+        axis : int, optional
+            The axis along which each time series runs (e.g. 0 for a matrix where each column is a time series).
+            DEFAULT = None, one histogram of all of the values.
+        validate : bool, optional
+            Whether to check the glucose values before building the histogram. DEFAULT = True
+        ignore_nan : bool, optional
+            Whether NaN values are missing readings to leave out of the histogram (counted in n_missing). A NaN value
+            raises an Exception otherwise, since it has no bin. DEFAULT = False
+
+        Returns
+        -------
+        GlucoseHistogram
+            The histogram, with a leading axis for the time series when axis is given.
+        """
+        if validate:
+            glucose._validate_bg(bg_array)
+        bg_rows = glucose._as_series_rows(bg_array, axis).astype(np.float64)
+        bins = np.clip(np.rint(bg_rows), 0, 1000)
+        is_missing = np.isnan(bg_rows)
+        if np.any(is_missing):
+            if not ignore_nan:
+                raise Exception("Some values in the passed in array are NaN, set ignore_nan to leave them out.")
+            # the missing values go to one more bin after the glucose bins
+            bins[is_missing] = len(_BG_BINS)
+        n_bins = len(_BG_BINS) + 1
+        # offset the bins of each series, so one bincount builds the histogram of every series
+        bins = bins.astype(np.int64) + np.arange(bg_rows.shape[0])[:, np.newaxis] * n_bins
+        counts = np.bincount(bins.ravel(), minlength=bg_rows.shape[0] * n_bins).reshape(bg_rows.shape[0], n_bins)
+        counts, n_missing = counts[:, :-1], counts[:, -1]
+        if axis is None:
+            return cls(counts[0], n_missing[0])
+        series_shape = glucose._series_shape(bg_array, axis)
+        return cls(counts.reshape(series_shape + _BG_BINS.shape), n_missing.reshape(series_shape))
+
+    @staticmethod
+    def merge(histograms: Iterable["GlucoseHistogram"]) -> "GlucoseHistogram":
+        """
+        Combine histograms (e.g. of different days) into the histogram of all of their glucose values.
+
+        Parameters
+        ----------
+        histograms : iterable of GlucoseHistogram
+            The histograms to combine.
+
+        Returns
+        -------
+        GlucoseHistogram
+            The combined histogram.
+        """
+        histograms = list(histograms)
+        return GlucoseHistogram(
+            np.sum([histogram.counts for histogram in histograms], axis=0),
+            np.sum([histogram.n_missing for histogram in histograms], axis=0),
+        )
+
+    def __add__(self, other: "GlucoseHistogram") -> "GlucoseHistogram":
+        return GlucoseHistogram(self.counts + other.counts, self.n_missing + other.n_missing)
+
+    def __eq__(self, other: object) -> bool:
+        return (
+            isinstance(other, GlucoseHistogram)
+            and np.array_equal(self.counts, other.counts)
+            and np.array_equal(self.n_missing, other.n_missing)
+        )
+
+    @property
+    def count(self) -> "np.ndarray[np.int64]":
+        """The number of (valid) glucose values in the histogram."""
+        return np.sum(self.counts, axis=-1)
+
+    def percent_values_by_range(
+        self,
+        lower_bound: int,
+        upper_bound: int,
+        lower_bound_operator: object = operator.ge,
+        upper_bound_operator: object = operator.lt,
+        round_to_n_digits: int = 3,
+    ) -> np.float64:
+        """
+        Calculate the percent of bg values that are within the specified range. See glucose.percent_values_by_range.
+
+        Parameters
+        ----------
+        lower_bound : int
+            The the lower bound in the calculation range.
+        upper_bound : int
+            The the upper bound in the calculation range.
+        lower_bound_operator : operator object
+            operator.ge (greater than or equal to) DEFAULT or operator.gt (greater than)
+        upper_bound_operator : operator object
+            operator.lt (less than) DEFAULT or operator.le (less than or equal to)
+        round_to_n_digits : int
+            The number of digits to round the result to. DEFAULT = 3
+
+        Returns
+        -------
+        float
+            The percentage of values in the specified range.
+        """
+        glucose._validate_input(lower_bound, upper_bound)
+        in_range = lower_bound_operator(_BG_BINS, lower_bound) & upper_bound_operator(_BG_BINS, upper_bound)
+        return glucose._percent(self.counts @ in_range, self.count, round_to_n_digits)
+
+    def mean(self, round_to_ndigits: int = 2) -> np.float64:
+        """
+        Calculate the mean of the glucose values.
+
+        Parameters
+        ----------
+        round_to_ndigits : int, optional
+            The number of digits to round the result to.
+
+        Returns
+        -------
+        float
+            The calculated mean
+        """
+        return np.round(self._moments()[0], round_to_ndigits)
+
+    def std_deviation(self, round_to_ndigits: int = 2) -> np.float64:
+        """
+        Calculate the standard deviation of the glucose values.
+
+        Parameters
+        ----------
+        round_to_ndigits : int, optional
+            The number of digits to round the result to.
+
+        Returns
+        -------
+        float
+            The calculated standard deviation
+        """
+        return np.round(np.sqrt(self._moments()[1]), round_to_ndigits)
+
+    def coefficient_of_variation(self, round_to_ndigits: int = 2) -> np.float64:
+        """
+        Calculate the coefficient of variation of the glucose values. See common.coefficient_of_variation.
+
+        Parameters
+        ----------
+        round_to_ndigits : int, optional
+            The number of digits to round the result to.
+
+        Returns
+        -------
+        float
+            The calculated coefficient of variation
+        """
+        mean_bg, variance = self._moments()
+        return common._coefficient_of_variation(mean_bg, np.sqrt(variance), round_to_ndigits)
+
+    def glucose_management_index(self, round_to_n_digits: int = 3) -> np.float64:
+        """
+        Calculate the Glucose Management Indicator of the glucose values. See glucose.glucose_management_index.
+
+        Parameters
+        ----------
+        round_to_n_digits : int, optional
+            The number of digits to round the result to.
+
+        Returns
+        -------
+        float
+            The calculated Glucose Management Indicator
+        """
+        return np.round(glucose._gmi(self.mean()), round_to_n_digits)
+
+    def blood_glucose_risk_index(self, round_to_n_digits: int = 2) -> Tuple[float, float, float]:
+        """
+        Calculate the LBGI, HBGI and BGRI of the glucose values. See glucose.blood_glucose_risk_index.
+
+        Parameters
+        ----------
+        round_to_n_digits : int, optional
+            The number of digits to round the result to.
+
+        Returns
+        -------
+        float
+            The LBGI.
+        float
+            The HBGI.
+        float
+            The BGRI.
+        """
+        rlBG, rhBG = glucose._risk_values(_BG_BINS)
+        lbgi = self.counts @ rlBG / self.count
+        hbgi = self.counts @ rhBG / self.count
+        return (
+            np.round(lbgi, round_to_n_digits),
+            np.round(hbgi, round_to_n_digits),
+            np.round(lbgi + hbgi, round_to_n_digits),
+        )
+
+    def _moments(self) -> Tuple[np.float64, np.float64]:
+        # the mean and (population) variance of the glucose values
+        n_values = self.count
+        mean_bg = self.counts @ _BG_BINS / n_values
+        deviation = _BG_BINS - np.expand_dims(mean_bg, -1)
+        variance = np.sum(self.counts * deviation ** 2, axis=-1) / n_values
+        return mean_bg, variance
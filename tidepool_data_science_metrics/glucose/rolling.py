@@ -0,0 +1,336 @@
+import numpy as np
+import operator
+from typing import Tuple
+from tidepool_data_science_metrics.common import common
+from tidepool_data_science_metrics.glucose import glucose
+from tidepool_data_science_metrics.cache import cache
+from tidepool_data_science_metrics.instrumentation import instrumentation
+
+
+@instrumentation.instrumented
+@cache.cached
+def rolling_percent_values_by_range(
+    bg_array: "np.ndarray[np.float64]",
+    window: int,
+    lower_bound: int,
+    upper_bound: int,
+    lower_bound_operator: object = operator.ge,
+    upper_bound_operator: object = operator.lt,
+    step: int = 1,
+    timestamps: "np.ndarray[np.datetime64]" = None,
+    round_to_n_digits: int = 3,
+    axis: int = None,
+    validate: bool = True,
+    ignore_nan: bool = False,
+) -> "np.ndarray[np.float64]":
+    """
+    Calculate the percent of bg values within the specified range over every sliding window of the glucose values.
+    The cost does not depend on the window length, as every window is the difference of two cumulative counts.
+
+    Parameters
+    ----------
+    bg_array : ndarray
+        1D array containing data with float or int type.
+    window : int
+        The number of values in each window, or the number of minutes in each window when timestamps are provided.
+    lower_bound : int
+        The the lower bound in the calculation range.
+    upper_bound : int
+        The the upper bound in the calculation range.
+    lower_bound_operator : operator object
+        operator.ge (greater than or equal to) DEFAULT or operator.gt (greater than)
+    upper_bound_operator : operator object
+        operator.lt (less than) DEFAULT or operator.le (less than or equal to)
+    step : int, optional
+        The number of values between the ends of consecutive windows. DEFAULT = 1, a window ending at every value.
+    timestamps : ndarray, optional
+        Array of datetime64 with the time of each bg value, either the same shape as bg_array or 1D with one
+        timestamp per value along axis. When provided, each window covers the window minutes up to and including
+        the value it ends at.
+    round_to_n_digits : int
+        The number of digits to round the result to. DEFAULT = 3
+    axis : int, optional
+        The axis along which each time series runs (e.g. 0 for a matrix where each column is a time series).
+        DEFAULT = None, all of the values are one time series.
+    validate : bool, optional
+        Whether to check the glucose values before the calculation. DEFAULT = True
+    ignore_nan : bool, optional
+        Whether to leave NaN values out of the number of values in each window, so the percent is of the valid
+        values only (and NaN for a window without any). Otherwise a NaN value counts as a value outside of the range,
+        as in glucose.percent_values_by_range. DEFAULT = False
+
+    Returns
+    -------
+    ndarray
+        The percentage of values in the specified range for every window, in the order the windows end. Without
+        timestamps the first window ends at value window - 1; with timestamps it ends at the first value. When axis
+        is given the windows run along axis.
+    """
+    if validate:
+        glucose._validate_bg(bg_array)
+    glucose._validate_input(lower_bound, upper_bound)
+    in_range = lower_bound_operator(bg_array, lower_bound) & upper_bound_operator(bg_array, upper_bound)
+    starts, ends = _window_bounds(bg_array, window, step, timestamps, axis)
+    n_in_range = _window_sums(glucose._as_series_rows(in_range, axis), starts, ends)
+    if ignore_nan:
+        n_values = _window_sums(~np.isnan(glucose._as_series_rows(bg_array, axis).astype(np.float64)), starts, ends)
+    else:
+        # as in glucose.percent_values_by_range, a NaN value counts as a value outside of the range
+        n_values = ends - starts + 1
+    with np.errstate(invalid="ignore"):
+        percent_in_range = glucose._percent(n_in_range, n_values, round_to_n_digits)
+    return glucose._from_series_rows(percent_in_range, bg_array, axis)
+
+
+@instrumentation.instrumented
+@cache.cached
+def rolling_mean(
+    bg_array: "np.ndarray[np.float64]",
+    window: int,
+    step: int = 1,
+    timestamps: "np.ndarray[np.datetime64]" = None,
+    round_to_ndigits: int = 2,
+    axis: int = None,
+    validate: bool = True,
+    ignore_nan: bool = False,
+) -> "np.ndarray[np.float64]":
+    """
+    Calculate the mean of the glucose values over every sliding window.
+
+    Parameters
+    ----------
+    bg_array : ndarray
+        1D array containing data with float or int type.
+    window : int
+        The number of values in each window, or the number of minutes in each window when timestamps are provided.
+    step : int, optional
+        The number of values between the ends of consecutive windows. DEFAULT = 1
+    timestamps : ndarray, optional
+        Array of datetime64 with the time of each bg value. See rolling_percent_values_by_range.
+    round_to_ndigits : int, optional
+        The number of digits to round the result to.
+    axis : int, optional
+        The axis along which each time series runs. DEFAULT = None, all of the values are one time series.
+    validate : bool, optional
+        Whether to check the glucose values before the calculation. DEFAULT = True
+    ignore_nan : bool, optional
+        Whether NaN values are missing readings to leave out, so each window is over its valid values only (and NaN
+        when it has none). Otherwise a window with a NaN value is NaN. DEFAULT = False
+
+    Returns
+    -------
+    ndarray
+        The mean of every window, in the order the windows end.
+    """
+    if validate:
+        glucose._validate_bg(bg_array)
+    mean_bg, _ = _window_moments(bg_array, window, step, timestamps, axis, ignore_nan)
+    return glucose._from_series_rows(np.round(mean_bg, round_to_ndigits), bg_array, axis)
+
+
+@instrumentation.instrumented
+@cache.cached
+def rolling_std_deviation(
+    bg_array: "np.ndarray[np.float64]",
+    window: int,
+    step: int = 1,
+    timestamps: "np.ndarray[np.datetime64]" = None,
+    round_to_ndigits: int = 2,
+    axis: int = None,
+    validate: bool = True,
+    ignore_nan: bool = False,
+) -> "np.ndarray[np.float64]":
+    """
+    Calculate the standard deviation of the glucose values over every sliding window.
+
+    Parameters
+    ----------
+    bg_array : ndarray
+        1D array containing data with float or int type.
+    window : int
+        The number of values in each window, or the number of minutes in each window when timestamps are provided.
+    step : int, optional
+        The number of values between the ends of consecutive windows. DEFAULT = 1
+    timestamps : ndarray, optional
+        Array of datetime64 with the time of each bg value. See rolling_percent_values_by_range.
+    round_to_ndigits : int, optional
+        The number of digits to round the result to.
+    axis : int, optional
+        The axis along which each time series runs. DEFAULT = None, all of the values are one time series.
+    validate : bool, optional
+        Whether to check the glucose values before the calculation. DEFAULT = True
+    ignore_nan : bool, optional
+        Whether NaN values are missing readings to leave out, so each window is over its valid values only (and NaN
+        when it has none). Otherwise a window with a NaN value is NaN. DEFAULT = False
+
+    Returns
+    -------
+    ndarray
+        The standard deviation of every window, in the order the windows end.
+    """
+    if validate:
+        glucose._validate_bg(bg_array)
+    _, std_bg = _window_moments(bg_array, window, step, timestamps, axis, ignore_nan)
+    return glucose._from_series_rows(np.round(std_bg, round_to_ndigits), bg_array, axis)
+
+
+@instrumentation.instrumented
+@cache.cached
+def rolling_coefficient_of_variation(
+    bg_array: "np.ndarray[np.float64]",
+    window: int,
+    step: int = 1,
+    timestamps: "np.ndarray[np.datetime64]" = None,
+    round_to_ndigits: int = 2,
+    axis: int = None,
+    validate: bool = True,
+    ignore_nan: bool = False,
+) -> "np.ndarray[np.float64]":
+    """
+    Calculate the coefficient of variation of the glucose values over every sliding window. Each value matches
+    common.coefficient_of_variation on the values in that window.
+
+    Parameters
+    ----------
+    bg_array : ndarray
+        1D array containing data with float or int type.
+    window : int
+        The number of values in each window, or the number of minutes in each window when timestamps are provided.
+    step : int, optional
+        The number of values between the ends of consecutive windows. DEFAULT = 1
+    timestamps : ndarray, optional
+        Array of datetime64 with the time of each bg value. See rolling_percent_values_by_range.
+    round_to_ndigits : int, optional
+        The number of digits to round the result to.
+    axis : int, optional
+        The axis along which each time series runs. DEFAULT = None, all of the values are one time series.
+    validate : bool, optional
+        Whether to check the glucose values before the calculation. DEFAULT = True
+    ignore_nan : bool, optional
+        Whether NaN values are missing readings to leave out, so each window is over its valid values only (and NaN
+        when it has none). Otherwise a window with a NaN value is NaN. DEFAULT = False
+
+    Returns
+    -------
+    ndarray
+        The coefficient of variation of every window, in the order the windows end.
+    """
+    if validate:
+        glucose._validate_bg(bg_array)
+    mean_bg, std_bg = _window_moments(bg_array, window, step, timestamps, axis, ignore_nan)
+    cv = common._coefficient_of_variation(mean_bg, std_bg, round_to_ndigits)
+    return glucose._from_series_rows(cv, bg_array, axis)
+
+
+@instrumentation.instrumented
+@cache.cached
+def rolling_glucose_management_index(
+    bg_array: "np.ndarray[np.float64]",
+    window: int,
+    step: int = 1,
+    timestamps: "np.ndarray[np.datetime64]" = None,
+    round_to_n_digits: int = 3,
+    axis: int = None,
+    validate: bool = True,
+    ignore_nan: bool = False,
+) -> "np.ndarray[np.float64]":
+    """
+    Calculate the Glucose Management Indicator over every sliding window. Each value matches
+    glucose.glucose_management_index on the values in that window.
+
+    Parameters
+    ----------
+    bg_array : ndarray
+        1D array containing data with float or int type.
+    window : int
+        The number of values in each window, or the number of minutes in each window when timestamps are provided.
+    step : int, optional
+        The number of values between the ends of consecutive windows. DEFAULT = 1
+    timestamps : ndarray, optional
+        Array of datetime64 with the time of each bg value. See rolling_percent_values_by_range.
+    round_to_n_digits : int, optional
+        The number of digits to round the result to.
+    axis : int, optional
+        The axis along which each time series runs. DEFAULT = None, all of the values are one time series.
+    validate : bool, optional
+        Whether to check the glucose values before the calculation. DEFAULT = True
+    ignore_nan : bool, optional
+        Whether NaN values are missing readings to leave out, so each window is over its valid values only (and NaN
+        when it has none). Otherwise a window with a NaN value is NaN. DEFAULT = False
+
+    Returns
+    -------
+    ndarray
+        The Glucose Management Indicator of every window, in the order the windows end.
+    """
+    if validate:
+        glucose._validate_bg(bg_array)
+    mean_bg, _ = _window_moments(bg_array, window, step, timestamps, axis, ignore_nan)
+    gmi = glucose._gmi(np.round(mean_bg, 2))
+    return glucose._from_series_rows(np.round(gmi, round_to_n_digits), bg_array, axis)
+
+
+def _window_bounds(
+    bg_array: "np.ndarray[np.float64]",
+    window: int,
+    step: int,
+    timestamps: "np.ndarray[np.datetime64]" = None,
+    axis: int = None,
+) -> Tuple["np.ndarray[np.int64]", "np.ndarray[np.int64]"]:
+    # The index of the first value of every window for every series, shape (n_series, n_windows), and the index of
+    # the last value of every window, shape (n_windows,), which is the same for every series.
+    if window < 1 or step < 1:
+        raise Exception("window and step must be positive.")
+    n_series, n_values = glucose._as_series_rows(bg_array, axis).shape
+    if timestamps is None:
+        ends = np.arange(window - 1, n_values, step)
+        return np.broadcast_to(ends - window + 1, (n_series, len(ends))), ends
+
+    minute_rows = glucose._minute_rows(timestamps, bg_array, axis)
+    ends = np.arange(0, n_values, step)
+    # offset every series past the end of the previous one, so a single searchsorted finds the window starts of all
+    # of the series at once
+    offsets = np.arange(n_series)[:, np.newaxis] * (np.max(minute_rows, initial=0) + window + 1)
+    shifted = minute_rows + offsets
+    starts = np.searchsorted(shifted.ravel(), shifted[:, ends] - window, side="right")
+    return starts - np.arange(n_series)[:, np.newaxis] * n_values, ends
+
+
+def _window_sums(
+    value_rows: "np.ndarray[np.float64]", starts: "np.ndarray[np.int64]", ends: "np.ndarray[np.int64]"
+) -> "np.ndarray[np.float64]":
+    # the sum of the values in every window, from the difference of the cumulative sums at the ends of the window
+    cumulative = np.zeros((value_rows.shape[0], value_rows.shape[1] + 1))
+    np.cumsum(value_rows, axis=1, out=cumulative[:, 1:])
+    return cumulative[:, ends + 1] - np.take_along_axis(cumulative, starts, axis=1)
+
+
+def _window_moments(
+    bg_array: "np.ndarray[np.float64]",
+    window: int,
+    step: int,
+    timestamps: "np.ndarray[np.datetime64]" = None,
+    axis: int = None,
+    ignore_nan: bool = False,
+) -> Tuple["np.ndarray[np.float64]", "np.ndarray[np.float64]"]:
+    # The mean and (population) standard deviation of every window, from cumulative sums of the values and of the
+    # squared values, shifted by the mean of each series to keep the difference of the sums accurate. NaN values are
+    # zero in the sums, so they only affect the windows they are in: those windows are NaN, or with ignore_nan are
+    # divided by the number of valid values instead of the window length.
+    starts, ends = _window_bounds(bg_array, window, step, timestamps, axis)
+    bg_rows = glucose._as_series_rows(bg_array, axis).astype(np.float64)
+    is_valid = ~np.isnan(bg_rows)
+    n_values = ends - starts + 1
+    if np.all(is_valid):
+        series_mean = np.mean(bg_rows, axis=1, keepdims=True)
+        centered_rows = bg_rows - series_mean
+    else:
+        n_valid = _window_sums(is_valid, starts, ends)
+        n_values = n_valid if ignore_nan else np.where(n_valid == n_values, n_values, np.nan)
+        series_sum = np.sum(bg_rows, axis=1, keepdims=True, where=is_valid)
+        series_mean = series_sum / np.maximum(np.sum(is_valid, axis=1, keepdims=True), 1)
+        centered_rows = np.where(is_valid, bg_rows - series_mean, 0)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        centered_mean = _window_sums(centered_rows, starts, ends) / n_values
+        variance = _window_sums(centered_rows ** 2, starts, ends) / n_values - centered_mean ** 2
+    return series_mean + centered_mean, np.sqrt(np.maximum(variance, 0))
@@ -0,0 +1,321 @@
+import functools
+import numpy as np
+from typing import Dict, Iterable
+from tidepool_data_science_metrics.common import common
+from tidepool_data_science_metrics.glucose import glucose
+
+# the largest whole values kept in the exact integer sums
+_MAX_EXACT_VALUE = 2 ** 20
+
+
+class GlucoseAccumulator:
+    """
+    Keep the running state of the glucose summary metrics for a live stream of glucose values, so that each new value
+    (or batch of values) is added in time proportional to its own size instead of recomputing over the full history.
+
+    The state is the count, the running mean and sum of squared differences from the mean (Welford), the number of
+    values in each of the summary ranges, the LBGI/HBGI risk sums and the length of the run of values currently
+    below the episode threshold. While every value is a whole number (as CGM values are), the exact integer sum and
+    sum of squares are kept too, so the mean and standard deviation round exactly like glucose.summary instead of
+    carrying the rounding error of the running mean. summary() returns the same values as glucose.summary on all of
+    the values added, including the number of values outside of the expected CGM range, so updates do not warn
+    about them.
+
+    Accumulators are also mergeable partial aggregates: each worker can summarize a shard of consecutive values,
+    share the state with to_dict, and a reducer can merge the states into the exact summary of all of the values.
+    The moments are merged with the numerically stable parallel variance algorithm.
+
+    Parameters
+    ----------
+    episodes_threshold : int, optional
+        Any bg values below this value will be considered as within an episode. DEFAULT = 54
+    min_ct_per_ep : int, optional
+        The number of consecutive bg values required in the threshold range to be considered an episode.
+    validate : bool, optional
+        Whether to check that each update is within the valid range of glucose values. DEFAULT = True
+    ignore_nan : bool, optional
+        Whether NaN values are missing readings to leave out, so the summary is over the valid values only (as
+        glucose.summary with ignore_nan). DEFAULT = False
+    """
+
+    def __init__(
+        self, episodes_threshold: int = 54, min_ct_per_ep: int = 3, validate: bool = True, ignore_nan: bool = False
+    ):
+        self.episodes_threshold = episodes_threshold
+        self.min_ct_per_ep = min_ct_per_ep
+        self.validate = validate
+        self.ignore_nan = ignore_nan
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.is_integer = True
+        self.integer_sum = 0
+        self.integer_sum_of_squares = 0
+        self.n_lt = {threshold: 0 for threshold in glucose._LT_THRESHOLDS}
+        self.n_le = {threshold: 0 for threshold in glucose._LE_THRESHOLDS}
+        self.rl_sum = 0.0
+        self.rh_sum = 0.0
+        self.episodes_count = 0
+        self.leading_run_length = 0
+        self.open_run_length = 0
+
+    @classmethod
+    def from_values(
+        cls,
+        bg_values: "np.ndarray[np.float64]",
+        episodes_threshold: int = 54,
+        min_ct_per_ep: int = 3,
+        ignore_nan: bool = False,
+    ) -> "GlucoseAccumulator":
+        """
+        Summarize a shard of consecutive glucose values.
+
+        Parameters
+        ----------
+        bg_values : ndarray
+            1D array of consecutive glucose values, oldest first.
+        episodes_threshold : int, optional
+            Any bg values below this value will be considered as within an episode. DEFAULT = 54
+        min_ct_per_ep : int, optional
+            The number of consecutive bg values required in the threshold range to be considered an episode.
+        ignore_nan : bool, optional
+            Whether NaN values are missing readings to leave out. DEFAULT = False
+
+        Returns
+        -------
+        GlucoseAccumulator
+            The accumulator of the values.
+        """
+        return cls(episodes_threshold=episodes_threshold, min_ct_per_ep=min_ct_per_ep, ignore_nan=ignore_nan).update(
+            bg_values
+        )
+
+    def update(self, bg_values: "np.ndarray[np.float64]") -> "GlucoseAccumulator":
+        """
+        Add a new glucose value, or a batch of consecutive glucose values, to the running state.
+
+        Parameters
+        ----------
+        bg_values : float or ndarray
+            A single glucose value or a 1D array of consecutive glucose values, oldest first.
+
+        Returns
+        -------
+        GlucoseAccumulator
+            This accumulator, so updates can be chained.
+        """
+        bg_values = np.ravel(np.asarray(bg_values, dtype=np.float64))
+        if self.ignore_nan:
+            # the episodes are bridged over the missing values, as in glucose.episodes
+            bg_values = bg_values[~np.isnan(bg_values)]
+        if bg_values.size == 0:
+            return self
+        if self.validate:
+            glucose._raise_if_invalid(*glucose._min_max(bg_values))
+
+        self._update_episodes(bg_values)
+        if self.is_integer:
+            # NaN is not a whole number, and the bound keeps the squares within int64
+            is_whole = np.all((bg_values == np.rint(bg_values)) & (np.abs(bg_values) <= _MAX_EXACT_VALUE))
+            if is_whole:
+                integer_values = bg_values.astype(np.int64)
+                self.integer_sum += int(np.sum(integer_values))
+                self.integer_sum_of_squares += int(np.sum(integer_values * integer_values))
+            self.is_integer = bool(is_whole)
+        self.count, self.mean, self.m2 = common._combine_moments(
+            self.count,
+            self.mean,
+            self.m2,
+            bg_values.size,
+            np.mean(bg_values),
+            np.sum((bg_values - np.mean(bg_values)) ** 2),
+        )
+        for threshold in self.n_lt:
+            self.n_lt[threshold] += np.count_nonzero(bg_values < threshold)
+        for threshold in self.n_le:
+            self.n_le[threshold] += np.count_nonzero(bg_values <= threshold)
+        rlBG, rhBG = glucose._risk_values(bg_values)
+        self.rl_sum += np.sum(rlBG)
+        self.rh_sum += np.sum(rhBG)
+        return self
+
+    def merge(self, other: "GlucoseAccumulator") -> "GlucoseAccumulator":
+        """
+        Combine this accumulator with the accumulator of the glucose values that immediately follow its values. The
+        merge is associative, so shards can be merged in any grouping as long as they stay in time order (the order
+        only matters for episodes that span the boundary between two shards).
+
+        Parameters
+        ----------
+        other : GlucoseAccumulator
+            The accumulator of the following glucose values, with the same episode settings.
+
+        Returns
+        -------
+        GlucoseAccumulator
+            A new accumulator of all of the glucose values of both accumulators.
+        """
+        settings = (self.episodes_threshold, self.min_ct_per_ep, self.ignore_nan)
+        if settings != (other.episodes_threshold, other.min_ct_per_ep, other.ignore_nan):
+            raise Exception(
+                "Only accumulators with the same episodes_threshold, min_ct_per_ep and ignore_nan can be merged."
+            )
+        merged = GlucoseAccumulator(self.episodes_threshold, self.min_ct_per_ep, self.validate, self.ignore_nan)
+        merged.count, merged.mean, merged.m2 = common._combine_moments(
+            self.count, self.mean, self.m2, other.count, other.mean, other.m2
+        )
+        merged.is_integer = self.is_integer and other.is_integer
+        merged.integer_sum = self.integer_sum + other.integer_sum
+        merged.integer_sum_of_squares = self.integer_sum_of_squares + other.integer_sum_of_squares
+        merged.n_lt = {threshold: self.n_lt[threshold] + other.n_lt[threshold] for threshold in self.n_lt}
+        merged.n_le = {threshold: self.n_le[threshold] + other.n_le[threshold] for threshold in self.n_le}
+        merged.rl_sum = self.rl_sum + other.rl_sum
+        merged.rh_sum = self.rh_sum + other.rh_sum
+
+        merged.episodes_count = self.episodes_count + other.episodes_count
+        merged.leading_run_length = self.leading_run_length if self.count else other.leading_run_length
+        merged.open_run_length = other.open_run_length if other.count else self.open_run_length
+        if self.open_run_length and other.leading_run_length:
+            # the run at the end of this shard and the run at the start of the other shard are one run
+            joined_run_length = self.open_run_length + other.leading_run_length
+            merged.episodes_count += (
+                int(joined_run_length >= self.min_ct_per_ep)
+                - int(self.open_run_length >= self.min_ct_per_ep)
+                - int(other.leading_run_length >= self.min_ct_per_ep)
+            )
+            if self.leading_run_length == self.count:
+                merged.leading_run_length = self.count + other.leading_run_length
+            if other.open_run_length == other.count:
+                merged.open_run_length = self.open_run_length + other.count
+        return merged
+
+    @staticmethod
+    def merge_all(accumulators: Iterable["GlucoseAccumulator"]) -> "GlucoseAccumulator":
+        """
+        Merge the accumulators of consecutive shards of glucose values, in time order.
+
+        Parameters
+        ----------
+        accumulators : iterable of GlucoseAccumulator
+            The accumulators to merge, oldest shard first.
+
+        Returns
+        -------
+        GlucoseAccumulator
+            The accumulator of all of the glucose values.
+        """
+        return functools.reduce(GlucoseAccumulator.merge, accumulators)
+
+    def to_dict(self) -> Dict[str, object]:
+        """
+        Serialize the state of the accumulator into a dict of plain python values that can be written as JSON.
+
+        Returns
+        -------
+        dict
+            The state of the accumulator, which from_dict turns back into an accumulator.
+        """
+        return {
+            "episodes_threshold": self.episodes_threshold,
+            "min_ct_per_ep": self.min_ct_per_ep,
+            "validate": self.validate,
+            "ignore_nan": self.ignore_nan,
+            "count": int(self.count),
+            "mean": float(self.mean),
+            "m2": float(self.m2),
+            "is_integer": self.is_integer,
+            "integer_sum": int(self.integer_sum),
+            "integer_sum_of_squares": int(self.integer_sum_of_squares),
+            "n_lt": {str(threshold): int(n) for threshold, n in self.n_lt.items()},
+            "n_le": {str(threshold): int(n) for threshold, n in self.n_le.items()},
+            "rl_sum": float(self.rl_sum),
+            "rh_sum": float(self.rh_sum),
+            "episodes_count": int(self.episodes_count),
+            "leading_run_length": int(self.leading_run_length),
+            "open_run_length": int(self.open_run_length),
+        }
+
+    @classmethod
+    def from_dict(cls, state: Dict[str, object]) -> "GlucoseAccumulator":
+        """
+        Restore an accumulator from the state returned by to_dict.
+
+        Parameters
+        ----------
+        state : dict
+            The state of an accumulator.
+
+        Returns
+        -------
+        GlucoseAccumulator
+            The restored accumulator.
+        """
+        accumulator = cls(state["episodes_threshold"], state["min_ct_per_ep"], state["validate"], state["ignore_nan"])
+        for name in [
+            "count",
+            "mean",
+            "m2",
+            "is_integer",
+            "integer_sum",
+            "integer_sum_of_squares",
+            "rl_sum",
+            "rh_sum",
+            "episodes_count",
+            "leading_run_length",
+            "open_run_length",
+        ]:
+            setattr(accumulator, name, state[name])
+        accumulator.n_lt = {int(threshold): n for threshold, n in state["n_lt"].items()}
+        accumulator.n_le = {int(threshold): n for threshold, n in state["n_le"].items()}
+        return accumulator
+
+    def summary(self, round_to_n_digits: int = 3) -> Dict[str, np.float64]:
+        """
+        Calculate the summary metrics on all of the glucose values added so far.
+
+        Parameters
+        ----------
+        round_to_n_digits : int, optional
+            The number of digits to round the glucose management index and the percentages to. DEFAULT = 3
+
+        Returns
+        -------
+        dict
+            The same metrics, with the same keys, as glucose.summary.
+        """
+        if self.count == 0:
+            raise Exception("No glucose values have been added to the accumulator.")
+        if self.is_integer:
+            # the exact sums divided once, which rounds like the mean of the values
+            mean_bg = self.integer_sum / self.count
+            std_bg = np.sqrt((self.count * self.integer_sum_of_squares - self.integer_sum ** 2) / self.count ** 2)
+        else:
+            mean_bg, std_bg = self.mean, np.sqrt(self.m2 / self.count)
+        return glucose._summary_from_statistics(
+            n_values=self.count,
+            mean_bg=mean_bg,
+            std_bg=std_bg,
+            n_lt=self.n_lt,
+            n_le=self.n_le,
+            lbgi=self.rl_sum / self.count,
+            hbgi=self.rh_sum / self.count,
+            episodes_count=self.episodes_count,
+            round_to_n_digits=round_to_n_digits,
+        )
+
+    def _update_episodes(self, bg_values: "np.ndarray[np.float64]"):
+        _, run_starts, lengths = glucose._runs(bg_values < self.episodes_threshold)
+        if len(lengths) == 0:
+            self.open_run_length = 0
+            return
+        ends_open = run_starts[-1] + lengths[-1] == bg_values.size
+        if run_starts[0] == 0 and self.leading_run_length == self.count:
+            # every value so far is in the run at the start of the values
+            self.leading_run_length += int(lengths[0])
+        already_counted = 0
+        if run_starts[0] == 0 and self.open_run_length:
+            # the first run continues the run that was still open at the end of the previous update
+            already_counted = int(self.open_run_length >= self.min_ct_per_ep)
+            lengths[0] += self.open_run_length
+        self.episodes_count += np.count_nonzero(lengths >= self.min_ct_per_ep) - already_counted
+        self.open_run_length = int(lengths[-1]) if ends_open else 0
@@ -0,0 +1,443 @@
+import numpy as np
+from typing import Dict
+from tidepool_data_science_metrics.glucose import glucose
+from tidepool_data_science_metrics.backends import backends
+from tidepool_data_science_metrics.cache import cache
+from tidepool_data_science_metrics.instrumentation import instrumentation
+
+# mg/dL per mmol/L, for the indices that are defined on mmol/L values
+_MG_DL_PER_MMOL_L = 18
+
+
+@instrumentation.instrumented
+@cache.cached
+def mean_amplitude_of_glycemic_excursions(
+    bg_array: "np.ndarray[np.float64]",
+    short_window: int = 5,
+    long_window: int = 32,
+    round_to_n_digits: int = 2,
+    axis: int = None,
+    validate: bool = True,
+    ignore_nan: bool = False,
+) -> np.float64:
+    """
+    Calculate the Mean Amplitude of Glycemic Excursions (MAGE) from Service, F. J., et al. (1970), the mean
+    amplitude of the rises and falls between consecutive peaks and nadirs that are larger than one standard
+    deviation of the glucose values.
+
+    Peaks and nadirs are found with the moving average algorithm of Fernandes, N. J., et al. (2022), which is not
+    thrown off by sensor noise: the series is split where a short and a long moving average cross, and the largest
+    value of each part above the long average is a peak and the smallest value of each part below it a nadir. The
+    parts are reduced with np.maximum.reduceat and np.minimum.reduceat. The first and last part of each series are
+    incomplete excursions and are left out.
+
+    Parameters
+    ----------
+    bg_array : ndarray
+        1D array containing regularly sampled data with float or int type.
+    short_window : int, optional
+        The number of values in the short moving average. DEFAULT = 5
+    long_window : int, optional
+        The number of values in the long moving average. DEFAULT = 32
+    round_to_n_digits : int, optional
+        The number of digits to round the result to. DEFAULT = 2
+    axis : int, optional
+        The axis along which each time series runs (e.g. 0 for a matrix where each column is a time series).
+        DEFAULT = None, all of the values are one time series.
+    validate : bool, optional
+        Whether to check the glucose values before the calculation. DEFAULT = True
+    ignore_nan : bool, optional
+        Whether NaN values are missing readings to leave out, so the result is over the valid values only.
+        DEFAULT = False
+
+    Returns
+    -------
+    float or ndarray
+        The MAGE in mg/dL, one per time series when axis is given. NaN when there is no excursion.
+    """
+    if validate:
+        glucose._validate_bg(bg_array)
+    bg_rows = _bg_rows(bg_array, axis)
+    mage = _mage(bg_rows, _std(bg_rows, ignore_nan), short_window, long_window, ignore_nan)
+    return np.round(_from_series(mage, bg_array, axis), round_to_n_digits)
+
+
+@instrumentation.instrumented
+@cache.cached
+def continuous_overall_net_glycemic_action(
+    bg_array: "np.ndarray[np.float64]",
+    n_hours: int = 1,
+    samples_per_day: int = 288,
+    round_to_n_digits: int = 2,
+    axis: int = None,
+    validate: bool = True,
+    ignore_nan: bool = False,
+) -> np.float64:
+    """
+    Calculate the Continuous Overall Net Glycemic Action (CONGA) from McDonnell, C. M., et al. (2005), the sample
+    standard deviation of the differences between each glucose value and the value n_hours earlier.
+
+    Parameters
+    ----------
+    bg_array : ndarray
+        1D array containing regularly sampled data with float or int type.
+    n_hours : int, optional
+        The hours between the values of each difference. DEFAULT = 1
+    samples_per_day : int, optional
+        The number of values in a day. DEFAULT = 288, 5 minute CGM data
+    round_to_n_digits : int, optional
+        The number of digits to round the result to. DEFAULT = 2
+    axis : int, optional
+        The axis along which each time series runs (e.g. 0 for a matrix where each column is a time series).
+        DEFAULT = None, all of the values are one time series.
+    validate : bool, optional
+        Whether to check the glucose values before the calculation. DEFAULT = True
+    ignore_nan : bool, optional
+        Whether NaN values are missing readings to leave out, so the result is over the differences between
+        valid values only. DEFAULT = False
+
+    Returns
+    -------
+    float or ndarray
+        The CONGA in mg/dL, one per time series when axis is given.
+    """
+    if validate:
+        glucose._validate_bg(bg_array)
+    differences = _lagged_differences(_bg_rows(bg_array, axis), n_hours * samples_per_day // 24)
+    conga = _std(differences, ignore_nan, ddof=1)
+    return np.round(_from_series(conga, bg_array, axis), round_to_n_digits)
+
+
+@instrumentation.instrumented
+@cache.cached
+def mean_of_daily_differences(
+    bg_array: "np.ndarray[np.float64]",
+    samples_per_day: int = 288,
+    round_to_n_digits: int = 2,
+    axis: int = None,
+    validate: bool = True,
+    ignore_nan: bool = False,
+) -> np.float64:
+    """
+    Calculate the Mean Of Daily Differences (MODD) from Molnar, G. D., et al. (1972), the mean absolute difference
+    between each glucose value and the value at the same time on the previous day.
+
+    Parameters
+    ----------
+    bg_array : ndarray
+        1D array containing regularly sampled data with float or int type.
+    samples_per_day : int, optional
+        The number of values in a day. DEFAULT = 288, 5 minute CGM data
+    round_to_n_digits : int, optional
+        The number of digits to round the result to. DEFAULT = 2
+    axis : int, optional
+        The axis along which each time series runs (e.g. 0 for a matrix where each column is a time series).
+        DEFAULT = None, all of the values are one time series.
+    validate : bool, optional
+        Whether to check the glucose values before the calculation. DEFAULT = True
+    ignore_nan : bool, optional
+        Whether NaN values are missing readings to leave out, so the result is over the differences between
+        valid values only. DEFAULT = False
+
+    Returns
+    -------
+    float or ndarray
+        The MODD in mg/dL, one per time series when axis is given.
+    """
+    if validate:
+        glucose._validate_bg(bg_array)
+    differences = _lagged_differences(_bg_rows(bg_array, axis), samples_per_day)
+    modd = _mean(np.abs(differences), ignore_nan)
+    return np.round(_from_series(modd, bg_array, axis), round_to_n_digits)
+
+
+@instrumentation.instrumented
+@cache.cached
+def j_index(
+    bg_array: "np.ndarray[np.float64]",
+    round_to_n_digits: int = 2,
+    axis: int = None,
+    validate: bool = True,
+    ignore_nan: bool = False,
+) -> np.float64:
+    """
+    Calculate the J-index from Wojcicki, J. M. (1995), 0.001 * (mean + standard deviation) ** 2 in mg/dL.
+
+    Parameters
+    ----------
+    bg_array : ndarray
+        1D array containing data with float or int type.
+    round_to_n_digits : int, optional
+        The number of digits to round the result to. DEFAULT = 2
+    axis : int, optional
+        The axis along which each time series runs (e.g. 0 for a matrix where each column is a time series).
+        DEFAULT = None, all of the values are one time series.
+    validate : bool, optional
+        Whether to check the glucose values before the calculation. DEFAULT = True
+    ignore_nan : bool, optional
+        Whether NaN values are missing readings to leave out, so the result is over the valid values only.
+        DEFAULT = False
+
+    Returns
+    -------
+    float or ndarray
+        The J-index, one per time series when axis is given.
+    """
+    if validate:
+        glucose._validate_bg(bg_array)
+    bg_rows = _bg_rows(bg_array, axis)
+    j = _j_index(_mean(bg_rows, ignore_nan), _std(bg_rows, ignore_nan))
+    return np.round(_from_series(j, bg_array, axis), round_to_n_digits)
+
+
+@instrumentation.instrumented
+@cache.cached
+def average_daily_risk_range(
+    bg_array: "np.ndarray[np.float64]",
+    samples_per_day: int = 288,
+    timestamps: "np.ndarray[np.datetime64]" = None,
+    round_to_n_digits: int = 2,
+    axis: int = None,
+    validate: bool = True,
+    ignore_nan: bool = False,
+) -> np.float64:
+    """
+    Calculate the Average Daily Risk Range (ADRR) from Kovatchev, B. P., et al. (2006), the mean over the days of
+    the largest low risk (rL) plus the largest high risk (rH) of each day, with the same risk values as
+    blood_glucose_risk_index. The daily maxima are one np.maximum.reduceat over the day boundaries.
+
+    Parameters
+    ----------
+    bg_array : ndarray
+        1D array containing data with float or int type.
+    samples_per_day : int, optional
+        The number of values in a day, when the values start at midnight. Not used with timestamps.
+        DEFAULT = 288, 5 minute CGM data
+    timestamps : ndarray, optional
+        1D array of datetime64 with the local time of each value along axis, shared by every time series. When
+        provided, the days are the calendar days of the timestamps.
+    round_to_n_digits : int, optional
+        The number of digits to round the result to. DEFAULT = 2
+    axis : int, optional
+        The axis along which each time series runs (e.g. 0 for a matrix where each column is a time series).
+        DEFAULT = None, all of the values are one time series.
+    validate : bool, optional
+        Whether to check the glucose values before the calculation. DEFAULT = True
+    ignore_nan : bool, optional
+        Whether NaN values are missing readings to leave out, so the result is over the valid values only.
+        DEFAULT = False
+
+    Returns
+    -------
+    float or ndarray
+        The ADRR, one per time series when axis is given.
+    """
+    if validate:
+        glucose._validate_bg(bg_array)
+    bg_rows = _bg_rows(bg_array, axis)
+    rlBG, rhBG = glucose._risk_values(bg_rows)
+    adrr = _adrr(rlBG, rhBG, _day_starts(bg_rows.shape[1], samples_per_day, timestamps), ignore_nan)
+    return np.round(_from_series(adrr, bg_array, axis), round_to_n_digits)
+
+
+@instrumentation.instrumented
+@cache.cached
+def glycemic_risk_assessment_diabetes_equation(
+    bg_array: "np.ndarray[np.float64]",
+    round_to_n_digits: int = 2,
+    axis: int = None,
+    validate: bool = True,
+    ignore_nan: bool = False,
+) -> np.float64:
+    """
+    Calculate the Glycemic Risk Assessment Diabetes Equation (GRADE) score from Hill, N. R., et al. (2007), the
+    mean of 425 * (log10(log10(bg in mmol/L)) + 0.16) ** 2 over the glucose values, each capped at 50.
+
+    Parameters
+    ----------
+    bg_array : ndarray
+        1D array containing data with float or int type.
+    round_to_n_digits : int, optional
+        The number of digits to round the result to. DEFAULT = 2
+    axis : int, optional
+        The axis along which each time series runs (e.g. 0 for a matrix where each column is a time series).
+        DEFAULT = None, all of the values are one time series.
+    validate : bool, optional
+        Whether to check the glucose values before the calculation. DEFAULT = True
+    ignore_nan : bool, optional
+        Whether NaN values are missing readings to leave out, so the result is over the valid values only.
+        DEFAULT = False
+
+    Returns
+    -------
+    float or ndarray
+        The GRADE score, one per time series when axis is given.
+    """
+    if validate:
+        glucose._validate_bg(bg_array)
+    grade = _mean(_grade_values(_bg_rows(bg_array, axis)), ignore_nan)
+    return np.round(_from_series(grade, bg_array, axis), round_to_n_digits)
+
+
+@instrumentation.instrumented
+@cache.cached
+def variability_summary(
+    bg_array: "np.ndarray[np.float64]",
+    samples_per_day: int = 288,
+    conga_hours: int = 1,
+    timestamps: "np.ndarray[np.datetime64]" = None,
+    round_to_n_digits: int = 2,
+    axis: int = None,
+    validate: bool = True,
+    ignore_nan: bool = False,
+) -> Dict[str, np.float64]:
+    """
+    Calculate every glycemic variability index in one validated pass. The mean, the standard deviation, the risk
+    values and the day boundaries are computed once and shared, instead of once per index. Every value matches the
+    value returned by the corresponding individual function.
+
+    Parameters
+    ----------
+    bg_array : ndarray
+        1D array containing regularly sampled data with float or int type.
+    samples_per_day : int, optional
+        The number of values in a day. DEFAULT = 288, 5 minute CGM data
+    conga_hours : int, optional
+        The hours between the values of each CONGA difference. DEFAULT = 1
+    timestamps : ndarray, optional
+        1D array of datetime64 with the local time of each value along axis, for the days of the ADRR.
+    round_to_n_digits : int, optional
+        The number of digits to round the results to. DEFAULT = 2
+    axis : int, optional
+        The axis along which each time series runs (e.g. 0 for a matrix where each column is a time series).
+        DEFAULT = None, all of the values are one time series.
+    validate : bool, optional
+        Whether to check the glucose values before the calculation. DEFAULT = True
+    ignore_nan : bool, optional
+        Whether NaN values are missing readings to leave out, so the results are over the valid values only.
+        DEFAULT = False
+
+    Returns
+    -------
+    dict
+        "mage", "conga", "modd", "j_index", "adrr" and "grade", each an array with one entry per time series when
+        axis is given.
+    """
+    if validate:
+        glucose._validate_bg(bg_array)
+    bg_rows = _bg_rows(bg_array, axis)
+    mean_bg = _mean(bg_rows, ignore_nan)
+    std_bg = _std(bg_rows, ignore_nan)
+    rlBG, rhBG = glucose._risk_values(bg_rows)
+    indices = {
+        "mage": _mage(bg_rows, std_bg, 5, 32, ignore_nan),
+        "conga": _std(_lagged_differences(bg_rows, conga_hours * samples_per_day // 24), ignore_nan, ddof=1),
+        "modd": _mean(np.abs(_lagged_differences(bg_rows, samples_per_day)), ignore_nan),
+        "j_index": _j_index(mean_bg, std_bg),
+        "adrr": _adrr(rlBG, rhBG, _day_starts(bg_rows.shape[1], samples_per_day, timestamps), ignore_nan),
+        "grade": _mean(_grade_values(bg_rows), ignore_nan),
+    }
+    return {name: np.round(_from_series(index, bg_array, axis), round_to_n_digits) for name, index in indices.items()}
+
+
+def _bg_rows(bg_array: "np.ndarray[np.float64]", axis: int = None) -> "np.ndarray[np.float64]":
+    return glucose._as_series_rows(np.asarray(bg_array), axis).astype(np.float64, copy=False)
+
+
+def _from_series(values: "np.ndarray[np.float64]", bg_array: "np.ndarray[np.float64]", axis: int = None):
+    # one value per series row back to a scalar, or to the shape of the series when axis is given
+    return values[0] if axis is None else values.reshape(glucose._series_shape(np.asarray(bg_array), axis))
+
+
+def _mean(rows: "np.ndarray[np.float64]", ignore_nan: bool) -> "np.ndarray[np.float64]":
+    return np.nanmean(rows, axis=1) if ignore_nan else np.mean(rows, axis=1)
+
+
+def _std(rows: "np.ndarray[np.float64]", ignore_nan: bool, ddof: int = 0) -> "np.ndarray[np.float64]":
+    return np.nanstd(rows, axis=1, ddof=ddof) if ignore_nan else np.std(rows, axis=1, ddof=ddof)
+
+
+def _lagged_differences(rows: "np.ndarray[np.float64]", lag: int) -> "np.ndarray[np.float64]":
+    # each value minus the value lag values earlier in the same series, NaN when either value is missing
+    return rows[:, lag:] - rows[:, : rows.shape[1] - lag]
+
+
+def _j_index(mean_bg: "np.ndarray[np.float64]", std_bg: "np.ndarray[np.float64]") -> "np.ndarray[np.float64]":
+    return 0.001 * (mean_bg + std_bg) ** 2
+
+
+def _grade_values(rows: "np.ndarray[np.float64]") -> "np.ndarray[np.float64]":
+    # log10(log10(bg)) is undefined at and below 1 mmol/L, where the score tends to infinity, so those values take
+    # the cap of 50
+    mmol_l = rows / _MG_DL_PER_MMOL_L
+    with np.errstate(divide="ignore", invalid="ignore"):
+        grade = 425 * (np.log10(np.log10(mmol_l)) + 0.16) ** 2
+    return np.where(mmol_l <= 1, 50, np.minimum(grade, 50))
+
+
+def _day_starts(
+    n_values: int, samples_per_day: int, timestamps: "np.ndarray[np.datetime64]" = None
+) -> "np.ndarray[np.int64]":
+    # the index of the first value of each day
+    if timestamps is None:
+        return np.arange(0, max(n_values, 1), samples_per_day)
+    days = np.asarray(timestamps, dtype="datetime64[ns]").astype("datetime64[D]")
+    if len(days) != n_values:
+        raise Exception("timestamps must have one value per glucose value along axis.")
+    return np.concatenate([[0], np.flatnonzero(days[1:] != days[:-1]) + 1])
+
+
+def _adrr(
+    rlBG: "np.ndarray[np.float64]", rhBG: "np.ndarray[np.float64]", day_starts: "np.ndarray[np.int64]", ignore_nan: bool
+) -> "np.ndarray[np.float64]":
+    # fmax skips NaN, so a day keeps the largest risk of its valid values (and is NaN without any)
+    maximum = np.fmax if ignore_nan else np.maximum
+    daily_risk_range = maximum.reduceat(rlBG, day_starts, axis=1) + maximum.reduceat(rhBG, day_starts, axis=1)
+    return _mean(daily_risk_range, ignore_nan)
+
+
+@backends.kernel
+def _mage(
+    bg_rows: "np.ndarray[np.float64]",
+    std_bg: "np.ndarray[np.float64]",
+    short_window: int,
+    long_window: int,
+    ignore_nan: bool,
+) -> "np.ndarray[np.float64]":
+    # The parts of every series are reduced at once on the flattened rows, where the start of each series is also
+    # the start of a part, so no excursion spans two series.
+    n_series, n_values = bg_rows.shape
+    is_above = _moving_average(bg_rows, short_window, ignore_nan) > _moving_average(bg_rows, long_window, ignore_nan)
+    starts_part = np.ones(bg_rows.shape, dtype=bool)
+    starts_part[:, 1:] = is_above[:, 1:] != is_above[:, :-1]
+    part_starts = np.flatnonzero(starts_part)
+    part_series = part_starts // n_values
+
+    maximum, minimum = (np.fmax, np.fmin) if ignore_nan else (np.maximum, np.minimum)
+    values = bg_rows.ravel()
+    extremes = np.where(
+        is_above.ravel()[part_starts], maximum.reduceat(values, part_starts), minimum.reduceat(values, part_starts)
+    )
+    # an excursion runs from the extreme of one complete part to the extreme of the next part of the same series
+    is_complete = np.zeros(len(part_starts), dtype=bool)
+    is_complete[1:-1] = (part_series[1:-1] == part_series[:-2]) & (part_series[1:-1] == part_series[2:])
+    amplitudes = np.abs(np.diff(extremes))
+    both_complete = is_complete[1:] & is_complete[:-1]
+    excursion_series = part_series[1:]
+    with np.errstate(invalid="ignore"):
+        is_excursion = both_complete & (amplitudes > std_bg[excursion_series])
+    amplitude_sums = np.bincount(excursion_series[is_excursion], weights=amplitudes[is_excursion], minlength=n_series)
+    n_excursions = np.bincount(excursion_series[is_excursion], minlength=n_series)
+    with np.errstate(invalid="ignore"):
+        return amplitude_sums / n_excursions
+
+
+def _moving_average(rows: "np.ndarray[np.float64]", window: int, ignore_nan: bool) -> "np.ndarray[np.float64]":
+    # trailing moving average of each row from cumulative sums, over the values so far for the first window values
+    is_valid = ~np.isnan(rows) if ignore_nan else np.ones(rows.shape, dtype=bool)
+    sums = np.cumsum(np.where(is_valid, rows, 0), axis=1)
+    counts = np.cumsum(is_valid, axis=1)
+    sums[:, window:] = sums[:, window:] - sums[:, :-window]
+    counts[:, window:] = counts[:, window:] - counts[:, :-window]
+    with np.errstate(invalid="ignore"):
+        return sums / counts
@@ -0,0 +1,179 @@
+import numpy as np
+import contextlib
+import functools
+import json
+import threading
+import time
+from typing import Callable, Dict, Iterator
+
+# Instrumentation is off by default. While it is off, an instrumented function only checks this flag before calling
+# the function it wraps, so the overhead is one attribute lookup per call.
+_enabled = False
+
+_lock = threading.Lock()
+_stats = {}
+# the names of the instrumented functions currently running in each thread, innermost last
+_active = threading.local()
+
+_PROMETHEUS_METRICS = (
+    ("calls", "tidepool_metrics_calls_total", "Number of calls of each function."),
+    ("seconds", "tidepool_metrics_seconds_total", "Cumulative wall time of each function in seconds."),
+    ("samples", "tidepool_metrics_samples_total", "Number of values passed to each function."),
+    (
+        "validation_warnings",
+        "tidepool_metrics_validation_warnings_total",
+        "Number of glucose validation warnings raised during each function.",
+    ),
+)
+
+
+def instrumented(function: Callable) -> Callable:
+    """
+    Decorate a function so that its calls, cumulative wall time, samples processed (the size of the first argument)
+    and the validation warnings raised during its calls are recorded while instrumentation is enabled.
+
+    Parameters
+    ----------
+    function : callable
+        The function to instrument. It is recorded as "<module>.<function name>", e.g. "glucose.summary".
+
+    Returns
+    -------
+    callable
+        The instrumented function.
+    """
+    name = f"{function.__module__.rsplit('.', 1)[-1]}.{function.__name__}"
+
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        if not _enabled:
+            return function(*args, **kwargs)
+        stack = _active_stack()
+        stack.append(name)
+        start = time.perf_counter()
+        try:
+            return function(*args, **kwargs)
+        finally:
+            seconds = time.perf_counter() - start
+            stack.pop()
+            _record(name, seconds, _n_samples(args))
+
+    return wrapper
+
+
+def enable():
+    """Start recording the instrumented functions."""
+    global _enabled
+    _enabled = True
+
+
+def disable():
+    """Stop recording the instrumented functions. The recorded statistics are kept until reset."""
+    global _enabled
+    _enabled = False
+
+
+def is_enabled() -> bool:
+    """Whether the instrumented functions are being recorded."""
+    return _enabled
+
+
+def reset():
+    """Clear the recorded statistics."""
+    with _lock:
+        _stats.clear()
+
+
+@contextlib.contextmanager
+def profile(reset_stats: bool = True) -> Iterator[None]:
+    """
+    Record the instrumented functions within a with block, e.g.
+
+        with instrumentation.profile():
+            glucose.summary(bg_array)
+        print(instrumentation.to_prometheus())
+
+    Parameters
+    ----------
+    reset_stats : bool, optional
+        Whether to clear the statistics recorded before the block. DEFAULT = True
+    """
+    global _enabled
+    was_enabled = _enabled
+    if reset_stats:
+        reset()
+    _enabled = True
+    try:
+        yield
+    finally:
+        _enabled = was_enabled
+
+
+def snapshot() -> Dict[str, Dict[str, float]]:
+    """
+    Get a copy of the recorded statistics.
+
+    Returns
+    -------
+    dict
+        The "calls", "seconds", "samples" and "validation_warnings" of each function that was called, keyed by
+        function name. The seconds of a function include the time of the instrumented functions it calls.
+    """
+    with _lock:
+        return {name: dict(stats) for name, stats in sorted(_stats.items())}
+
+
+def to_json() -> str:
+    """The recorded statistics (see snapshot) as a JSON string."""
+    return json.dumps(snapshot())
+
+
+def to_prometheus() -> str:
+    """The recorded statistics (see snapshot) in the Prometheus text exposition format."""
+    stats = snapshot()
+    lines = []
+    for key, metric_name, help_text in _PROMETHEUS_METRICS:
+        lines.append(f"# HELP {metric_name} {help_text}")
+        lines.append(f"# TYPE {metric_name} counter")
+        for name, function_stats in stats.items():
+            lines.append(f'{metric_name}{{function="{name}"}} {function_stats[key]}')
+    return "\n".join(lines) + "\n"
+
+
+def record_validation_warning():
+    """
+    Count a validation warning against every instrumented function that is running in this thread. Called by the
+    glucose validation wherever it warns, and does nothing while instrumentation is disabled.
+    """
+    if not _enabled:
+        return
+    with _lock:
+        for name in _active_stack():
+            _function_stats(name)["validation_warnings"] += 1
+
+
+def _active_stack() -> list:
+    if not hasattr(_active, "stack"):
+        _active.stack = []
+    return _active.stack
+
+
+def _function_stats(name: str) -> Dict[str, float]:
+    if name not in _stats:
+        _stats[name] = {"calls": 0, "seconds": 0.0, "samples": 0, "validation_warnings": 0}
+    return _stats[name]
+
+
+def _record(name: str, seconds: float, n_samples: int):
+    with _lock:
+        stats = _function_stats(name)
+        stats["calls"] += 1
+        stats["seconds"] += seconds
+        stats["samples"] += n_samples
+
+
+def _n_samples(args: tuple) -> int:
+    # the first argument of every metric is the array of values (or a single value)
+    if not args:
+        return 0
+    return int(np.size(args[0]))
@@ -1,6 +1,14 @@
 import numpy as np
+from typing import Callable, Sequence, Tuple, Union
+from tidepool_data_science_metrics.glucose import glucose
+from tidepool_data_science_metrics.cache import cache
+from tidepool_data_science_metrics.instrumentation import instrumentation
 
+# the DKA Index hours at which each DKA risk score starts
+_DKA_RISK_THRESHOLDS = (2, 8, 14, 21)
 
+
+@instrumentation.instrumented
 def approximate_steady_state_iob_from_sbr(scheduled_basal_rate: np.float64) -> np.float64:
     """
     Approximate the amount of insulin-on-board from user's scheduled basal rate (sbr). This value
@@ -8,20 +16,31 @@ def approximate_steady_state_iob_from_sbr(scheduled_basal_rate: np.float64) -> n
 
     Parameters
     ----------
-    scheduled_basal_rate : float
-        a single value that represents the user's insulin needs
-        NOTE: this needs to be updated to account for sbr schedule
+    scheduled_basal_rate : float or ndarray
+        the user's insulin needs, a single value or an array of values (e.g. the rate of each sample
+        of a basal schedule, see dka_index)
     Returns
     -------
     float:
         insulin-on-board
     """
     # TODO: need test coverage here, which can be done by calling the diabetes metabolism model
+    # steady_state_iob computes this from an insulin action curve instead
     return scheduled_basal_rate * 2.111517
 
 
+@instrumentation.instrumented
+@cache.cached
 def dka_index(
-    iob_array: "np.ndarray[np.float64]", scheduled_basal_rate: np.float64, round_to_n_digits: int = 3
+    iob_array: "np.ndarray[np.float64]",
+    scheduled_basal_rate: np.float64 = None,
+    round_to_n_digits: int = 3,
+    basal_schedule: Sequence[Tuple[Union[int, str], float]] = None,
+    timestamps: "np.ndarray[np.datetime64]" = None,
+    sample_minutes: float = 5,
+    max_gap: float = 15,
+    axis: int = None,
+    insulin_model: Union[str, Callable] = None,
 ) -> np.float64:
     """
     Calculate the Tidepool DKA Index, which is the number of hours with less than 50% of the
@@ -29,30 +48,280 @@ def dka_index(
     for their insulin needs.
     https://docs.google.com/document/d/1zrQK7tQ3OJzjOXbwDgmQEeCdcig49F2TpJzNk2FU52k
 
+    Each iob value counts for the time until the next value (at most max_gap minutes, and the typical time between
+    values for the last one), so irregular sampling is weighted by time. Without timestamps the values are
+    sample_minutes apart, starting at midnight.
+
     Parameters
     ----------
     iob_array : ndarray
         1D array containing the insulin-on-board time series with float type.
-    scheduled_basal_rate : float (U/hr)
-        a single value that represents the user's insulin needs
-        NOTE: this needs to be updated to account for sbr schedule
+    scheduled_basal_rate : float or ndarray (U/hr)
+        a single value that represents the user's insulin needs, or one value per time series when axis is given.
+        Not used when basal_schedule is provided.
     round_to_n_digits : int, optional
         The number of digits to round the result to.
+    basal_schedule : list of (start, rate) tuples, optional
+        The scheduled basal rate (U/hr) from each start time of day, as minutes after midnight or "HH:MM", e.g.
+        [("00:00", 0.8), ("06:00", 1.2), ("22:00", 0.9)]. The schedule repeats every day, so a schedule that does
+        not start at midnight continues the last rate of the previous day.
+    timestamps : ndarray, optional
+        Array of datetime64 with the local time of each iob value. Either the same shape as iob_array, or 1D with
+        one timestamp per value along axis when every time series shares the same times.
+    sample_minutes : float, optional
+        The minutes between iob values when timestamps are not provided. DEFAULT = 5
+    max_gap : float, optional
+        The most minutes a single iob value counts for when timestamps are provided. DEFAULT = 15
+    axis : int, optional
+        The axis along which each time series runs (e.g. 1 for a patient x time matrix).
+        DEFAULT = None, all of the values are one time series.
+    insulin_model : str or callable, optional
+        The insulin action curve of the steady state iob (see steady_state_iob), which should match the curve the
+        iob values were computed with (see insulin_on_board).
+        DEFAULT = None, the approximation of approximate_steady_state_iob_from_sbr.
+
+    Returns
+    -------
+    float or ndarray
+        The Tidepool DKA Index in hours, one per time series when axis is given.
+    """
+    if scheduled_basal_rate is None and basal_schedule is None:
+        raise Exception("Either scheduled_basal_rate or basal_schedule must be provided.")
+    iob_array = np.asarray(iob_array, dtype=np.float64)
+    iob_rows = glucose._as_series_rows(iob_array, axis)
+    if timestamps is not None:
+        minute_rows = glucose._minute_rows(timestamps, iob_array, axis)
+        minutes_of_day = minute_rows + glucose._minutes_after_midnight(timestamps)
+        sample_durations = _sample_durations(minute_rows, max_gap)
+    else:
+        minutes_of_day = np.arange(iob_rows.shape[1]) * sample_minutes
+        sample_durations = np.full(iob_rows.shape, float(sample_minutes))
+
+    if basal_schedule is not None:
+        basal_rates = _expand_basal_schedule(basal_schedule, minutes_of_day)
+    else:
+        # a rate per time series lines up with the series rows
+        basal_rates = np.reshape(scheduled_basal_rate, (-1, 1))
+    if insulin_model is None:
+        basal_steady_state_iob = approximate_steady_state_iob_from_sbr(basal_rates)
+    else:
+        basal_steady_state_iob = steady_state_iob(basal_rates, sample_minutes, insulin_model=insulin_model)
+    fifty_percent_steady_state_iob = basal_steady_state_iob / 2
+    indices_with_less_50percent_sbr_iob = iob_rows < fifty_percent_steady_state_iob
+    hours_with_less_50percent_sbr_iob = np.sum(sample_durations * indices_with_less_50percent_sbr_iob, axis=1) / 60
+
+    if axis is None:
+        return round(hours_with_less_50percent_sbr_iob[0], round_to_n_digits)
+    series_shape = glucose._series_shape(iob_array, axis)
+    return np.round(hours_with_less_50percent_sbr_iob.reshape(series_shape), round_to_n_digits)
+
+
+@instrumentation.instrumented
+@cache.cached
+def delivered_insulin(
+    start: np.datetime64,
+    end: np.datetime64,
+    sample_minutes: float = 5,
+    bolus_times: "np.ndarray[np.datetime64]" = None,
+    bolus_units: "np.ndarray[np.float64]" = None,
+    basal_start_times: "np.ndarray[np.datetime64]" = None,
+    basal_end_times: "np.ndarray[np.datetime64]" = None,
+    basal_rates: "np.ndarray[np.float64]" = None,
+) -> Tuple["np.ndarray[np.datetime64]", "np.ndarray[np.float64]"]:
+    """
+    Place bolus and basal dose events onto a regular time grid, as the units of insulin delivered in each interval
+    of sample_minutes. A bolus counts in the interval it was given in, and a basal dose is split over the intervals
+    it overlaps in proportion to the time it was delivered in each.
+
+    Parameters
+    ----------
+    start : datetime64
+        The start of the grid.
+    end : datetime64
+        The end of the grid (exclusive).
+    sample_minutes : float, optional
+        The minutes in each interval of the grid. DEFAULT = 5
+    bolus_times : ndarray, optional
+        Array of datetime64 with the time of each bolus.
+    bolus_units : ndarray, optional
+        The units of insulin of each bolus.
+    basal_start_times : ndarray, optional
+        Array of datetime64 with the start of each basal dose (scheduled or temporary).
+    basal_end_times : ndarray, optional
+        Array of datetime64 with the end of each basal dose.
+    basal_rates : ndarray, optional
+        The rate (U/hr) of each basal dose. Overlapping basal doses add together.
+
+    Returns
+    -------
+    ndarray
+        The datetime64 start of each interval of the grid.
+    ndarray
+        The units of insulin delivered in each interval.
+    """
+    sample_delta = np.timedelta64(int(round(sample_minutes * 60 * 1000)), "ms")
+    grid_times = np.arange(np.datetime64(start, "ms"), np.datetime64(end, "ms"), sample_delta)
+    units = np.zeros(len(grid_times))
+    if bolus_times is not None:
+        minutes = _minutes_after(bolus_times, start)
+        intervals = np.floor(minutes / sample_minutes).astype(np.int64)
+        on_grid = (intervals >= 0) & (intervals < len(units))
+        units += np.bincount(
+            intervals[on_grid], weights=np.asarray(bolus_units, dtype=np.float64)[on_grid], minlength=len(units)
+        )
+    if basal_start_times is not None:
+        # the basal insulin delivered since start is piecewise linear between the dose start and end times, so it is
+        # exact to interpolate it at the interval edges
+        dose_starts = _minutes_after(basal_start_times, start)
+        dose_ends = _minutes_after(basal_end_times, start)
+        rates = np.asarray(basal_rates, dtype=np.float64) / 60
+        change_minutes = np.concatenate([dose_starts, dose_ends])
+        order = np.argsort(change_minutes, kind="stable")
+        change_minutes = change_minutes[order]
+        rate_after_change = np.cumsum(np.concatenate([rates, -rates])[order])
+        delivered = np.concatenate([[0], np.cumsum(rate_after_change[:-1] * np.diff(change_minutes))])
+        edges = np.arange(len(units) + 1) * sample_minutes
+        units += np.diff(np.interp(edges, change_minutes, delivered))
+    return grid_times, units
+
+
+@instrumentation.instrumented
+@cache.cached
+def insulin_on_board(
+    delivered_insulin_array: "np.ndarray[np.float64]",
+    sample_minutes: float = 5,
+    insulin_model: Union[str, Callable] = "exponential",
+    action_duration: float = 360,
+    peak_activity_time: float = 75,
+    axis: int = None,
+) -> "np.ndarray[np.float64]":
+    """
+    Calculate the insulin-on-board time series from the insulin delivered in each interval of a regular time grid
+    (see delivered_insulin), as the convolution of the delivered insulin with an insulin action curve. The
+    convolution is done with one FFT over every time series, so the cost does not depend on the action duration.
+
+    Parameters
+    ----------
+    delivered_insulin_array : ndarray
+        1D array with the units of insulin delivered in each interval.
+    sample_minutes : float, optional
+        The minutes in each interval of the grid. DEFAULT = 5
+    insulin_model : str or callable, optional
+        The insulin action curve, "exponential" (the Loop exponential model) or "linear", or a function that takes
+        an array of minutes since a dose and returns the fraction of the dose still on board. DEFAULT = "exponential"
+    action_duration : float, optional
+        The minutes until a dose is no longer on board. DEFAULT = 360
+    peak_activity_time : float, optional
+        The minutes from a dose to its peak activity, for the "exponential" model. DEFAULT = 75
+    axis : int, optional
+        The axis along which each time series runs (e.g. 1 for a patient x time matrix).
+        DEFAULT = None, all of the values are one time series.
+
+    Returns
+    -------
+    ndarray
+        The insulin-on-board (U) at the start of each interval, including the insulin delivered in that interval.
+    """
+    delivered_insulin_array = np.asarray(delivered_insulin_array, dtype=np.float64)
+    delivered_rows = glucose._as_series_rows(delivered_insulin_array, axis)
+    curve = _insulin_remaining(sample_minutes, insulin_model, action_duration, peak_activity_time)
+    n_values = delivered_rows.shape[1]
+    # zero pad to a fast FFT size, long enough that the convolution does not wrap around
+    n_fft = 1 << int(np.ceil(np.log2(max(n_values + len(curve) - 1, 1))))
+    iob_rows = np.fft.irfft(np.fft.rfft(delivered_rows, n_fft) * np.fft.rfft(curve, n_fft), n_fft)[:, :n_values]
+    return glucose._from_series_rows(iob_rows, delivered_insulin_array, axis)
+
+
+@instrumentation.instrumented
+@cache.cached
+def steady_state_iob(
+    scheduled_basal_rate: np.float64,
+    sample_minutes: float = 5,
+    insulin_model: Union[str, Callable] = "exponential",
+    action_duration: float = 360,
+    peak_activity_time: float = 75,
+) -> np.float64:
+    """
+    Calculate the insulin-on-board after a constant scheduled basal rate (sbr) has been delivered for at least the
+    action duration, with the same insulin action curve as insulin_on_board.
+
+    Parameters
+    ----------
+    scheduled_basal_rate : float or ndarray (U/hr)
+        the user's insulin needs, a single value or an array of values
+    sample_minutes : float, optional
+        The minutes in each interval of the grid. DEFAULT = 5
+    insulin_model : str or callable, optional
+        The insulin action curve, see insulin_on_board. DEFAULT = "exponential"
+    action_duration : float, optional
+        The minutes until a dose is no longer on board. DEFAULT = 360
+    peak_activity_time : float, optional
+        The minutes from a dose to its peak activity, for the "exponential" model. DEFAULT = 75
+
+    Returns
+    -------
+    float or ndarray
+        insulin-on-board
+    """
+    curve = _insulin_remaining(sample_minutes, insulin_model, action_duration, peak_activity_time)
+    return np.asarray(scheduled_basal_rate) * sample_minutes / 60 * np.sum(curve)
+
+
+def exponential_insulin_remaining(
+    minutes: "np.ndarray[np.float64]", action_duration: float = 360, peak_activity_time: float = 75
+) -> "np.ndarray[np.float64]":
+    """
+    The fraction of a dose still on board the given minutes after the dose, for the exponential insulin model of
+    Loop (https://github.com/LoopKit/Loop/issues/388).
+
+    Parameters
+    ----------
+    minutes : ndarray
+        The minutes since the dose.
+    action_duration : float, optional
+        The minutes until a dose is no longer on board. DEFAULT = 360
+    peak_activity_time : float, optional
+        The minutes from a dose to its peak activity. DEFAULT = 75
 
     Returns
     -------
-    float
-        The Tidepool DKA Index in hours.
+    ndarray
+        The fraction of the dose on board.
+    """
+    minutes = np.asarray(minutes, dtype=np.float64)
+    peak_fraction = peak_activity_time / action_duration
+    tau = peak_activity_time * (1 - peak_fraction) / (1 - 2 * peak_fraction)
+    a = 2 * tau / action_duration
+    s = 1 / (1 - a + (1 + a) * np.exp(-action_duration / tau))
+    remaining = 1 - s * (1 - a) * (
+        (minutes ** 2 / (tau * action_duration * (1 - a)) - minutes / tau - 1) * np.exp(-minutes / tau) + 1
+    )
+    return np.where(minutes <= 0, 1.0, np.where(minutes >= action_duration, 0.0, remaining))
+
+
+def linear_insulin_remaining(
+    minutes: "np.ndarray[np.float64]", action_duration: float = 360
+) -> "np.ndarray[np.float64]":
     """
-    # TODO: this funciton needs to be updated to allow for multiple scheduled basal rates, AKA schedules
-    steady_state_iob = approximate_steady_state_iob_from_sbr(scheduled_basal_rate)
-    fifty_percent_steady_state_iob = steady_state_iob / 2
-    indices_with_less_50percent_sbr_iob = iob_array < fifty_percent_steady_state_iob
-    hours_with_less_50percent_sbr_iob = np.sum(indices_with_less_50percent_sbr_iob) * 5 / 60
+    The fraction of a dose still on board the given minutes after the dose, falling linearly to zero over the
+    action duration.
+
+    Parameters
+    ----------
+    minutes : ndarray
+        The minutes since the dose.
+    action_duration : float, optional
+        The minutes until a dose is no longer on board. DEFAULT = 360
 
-    return round(hours_with_less_50percent_sbr_iob, round_to_n_digits)
+    Returns
+    -------
+    ndarray
+        The fraction of the dose on board.
+    """
+    return np.clip(1 - np.asarray(minutes, dtype=np.float64) / action_duration, 0, 1)
 
 
+@instrumentation.instrumented
 def dka_risk_score(hours_with_less_50percent_sbr_iob: np.float64) -> int:
     """
     Calculate the Tidepool DKA Risk Score
@@ -60,22 +329,84 @@ def dka_risk_score(hours_with_less_50percent_sbr_iob: np.float64) -> int:
 
     Parameters
     ----------
-    hours_with_less_50percent_sbr_iob : float
-        calculated from dka_index
+    hours_with_less_50percent_sbr_iob : float or ndarray
+        calculated from dka_index, or an array of DKA Index values (e.g. per patient)
 
     Returns
     -------
-    int
-        The Tidepool DKAI Risk Score.
-    """
-    if hours_with_less_50percent_sbr_iob >= 21:
-        risk_score = 4
-    elif hours_with_less_50percent_sbr_iob >= 14:
-        risk_score = 3
-    elif hours_with_less_50percent_sbr_iob >= 8:
-        risk_score = 2
-    elif hours_with_less_50percent_sbr_iob >= 2:
-        risk_score = 1
-    else:
-        risk_score = 0
-    return risk_score
+    int or ndarray
+        The Tidepool DKAI Risk Score, with the same shape as hours_with_less_50percent_sbr_iob for an array.
+    """
+    # scores 1 to 4 start at 2, 8, 14 and 21 hours, and NaN scores 0
+    hours = np.asarray(hours_with_less_50percent_sbr_iob)
+    risk_score = np.where(np.isnan(hours), 0, np.digitize(hours, _DKA_RISK_THRESHOLDS))
+    return int(risk_score) if risk_score.ndim == 0 else risk_score
+
+
+@instrumentation.instrumented
+def dka_risk_score_counts(
+    hours_with_less_50percent_sbr_iob: "np.ndarray[np.float64]", axis: int = None
+) -> "np.ndarray[np.int64]":
+    """
+    Count the DKA Index values at each Tidepool DKA Risk Score, see dka_risk_score.
+
+    Parameters
+    ----------
+    hours_with_less_50percent_sbr_iob : ndarray
+        Array of DKA Index values.
+    axis : int, optional
+        The axis to count along. DEFAULT = None, the counts over all of the values.
+
+    Returns
+    -------
+    ndarray
+        The number of values with each risk score from 0 to 4, on the last axis when axis is given.
+    """
+    risk_scores = dka_risk_score(hours_with_less_50percent_sbr_iob)
+    return glucose._risk_score_counts(risk_scores, len(_DKA_RISK_THRESHOLDS) + 1, axis)
+
+
+def _expand_basal_schedule(
+    basal_schedule: Sequence[Tuple[Union[int, str], float]], minutes_of_day: "np.ndarray[np.float64]"
+) -> "np.ndarray[np.float64]":
+    # the scheduled basal rate at each time, found with one searchsorted over the sorted segment start times
+    start_minutes = np.array([_minutes_of_day(start) for start, _ in basal_schedule], dtype=np.float64)
+    rates = np.array([rate for _, rate in basal_schedule], dtype=np.float64)
+    order = np.argsort(start_minutes)
+    start_minutes, rates = start_minutes[order], rates[order]
+    # times before the first segment get index -1, the last segment of the previous day
+    segments = np.searchsorted(start_minutes, np.mod(minutes_of_day, 24 * 60), side="right") - 1
+    return rates[segments]
+
+
+def _minutes_of_day(start: Union[int, str]) -> float:
+    if isinstance(start, str):
+        hours, minutes = start.split(":")
+        return int(hours) * 60 + int(minutes)
+    return start
+
+
+def _sample_durations(minute_rows: "np.ndarray[np.float64]", max_gap: float) -> "np.ndarray[np.float64]":
+    # the minutes each value counts for: the time until the next value, and the typical interval for the last value
+    minutes_between = np.diff(minute_rows, axis=1)
+    typical_interval = np.median(minutes_between, axis=1) if minutes_between.shape[1] else np.zeros(len(minute_rows))
+    sample_durations = np.concatenate([minutes_between, typical_interval[:, np.newaxis]], axis=1)
+    return np.minimum(sample_durations, max_gap)
+
+
+def _insulin_remaining(
+    sample_minutes: float, insulin_model: Union[str, Callable], action_duration: float, peak_activity_time: float
+) -> "np.ndarray[np.float64]":
+    # the fraction of a dose on board at each sample from the dose until the end of the action duration
+    minutes = np.arange(0, action_duration, sample_minutes)
+    if callable(insulin_model):
+        return np.asarray(insulin_model(minutes), dtype=np.float64)
+    if insulin_model == "exponential":
+        return exponential_insulin_remaining(minutes, action_duration, peak_activity_time)
+    if insulin_model == "linear":
+        return linear_insulin_remaining(minutes, action_duration)
+    raise Exception(f"Unknown insulin model {insulin_model}, expected \"exponential\", \"linear\" or a function.")
+
+
+def _minutes_after(times: "np.ndarray[np.datetime64]", start: np.datetime64) -> "np.ndarray[np.float64]":
+    return (np.asarray(times, dtype="datetime64[ms]") - np.datetime64(start, "ms")) / np.timedelta64(1, "m")
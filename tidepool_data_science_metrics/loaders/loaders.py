@@ -0,0 +1,148 @@
+import numpy as np
+import os
+from typing import Dict, Iterator, List
+
+
+def load(path: str, columns: List[str] = None):
+    """
+    Load glucose (or insulin) values from a file, without copying them where the file format allows it.
+
+    Parameters
+    ----------
+    path : str
+        Path of a .npy, Arrow IPC (.arrow, .feather, .ipc), Parquet (.parquet) or .csv file.
+    columns : list of str, optional
+        The columns to read from an Arrow or Parquet file. DEFAULT = all of the columns.
+
+    Returns
+    -------
+    ndarray or dict
+        The array for .npy and .csv files, and a dict of column name to array for Arrow and Parquet files.
+    """
+    extension = os.path.splitext(path)[1].lower()
+    if extension == ".npy":
+        return load_npy(path)
+    if extension in (".arrow", ".feather", ".ipc"):
+        return load_arrow(path, columns=columns)
+    if extension == ".parquet":
+        return load_parquet(path, columns=columns)
+    if extension == ".csv":
+        return np.loadtxt(path, delimiter=",")
+    raise Exception(f"Unsupported file type {extension}, expected .npy, .arrow, .feather, .ipc, .parquet or .csv.")
+
+
+def load_npy(path: str, mmap: bool = True) -> "np.ndarray[np.float64]":
+    """
+    Load an array saved with np.save, memory mapped by default so that only the parts the metrics read are paged
+    into memory and arrays larger than RAM can be used.
+
+    Parameters
+    ----------
+    path : str
+        Path of the .npy file.
+    mmap : bool, optional
+        Whether to memory map the file (read only) instead of reading it into memory. DEFAULT = True
+
+    Returns
+    -------
+    ndarray
+        The array, a read only numpy.memmap when mmap is True.
+    """
+    return np.load(path, mmap_mode="r" if mmap else None)
+
+
+def load_arrow(path: str, columns: List[str] = None) -> Dict[str, "np.ndarray[np.float64]"]:
+    """
+    Load columns of an Arrow IPC (Feather V2) file as numpy arrays. The file is memory mapped and a column that is
+    stored in a single chunk with no missing values is returned as a view of the file, without any copy.
+    Columns with missing values are copied with NaN in place of the missing values.
+
+    Parameters
+    ----------
+    path : str
+        Path of the Arrow IPC file.
+    columns : list of str, optional
+        The columns to read. DEFAULT = all of the columns.
+
+    Returns
+    -------
+    dict
+        The array of each column, by column name.
+    """
+    pa = _import_pyarrow()
+    table = pa.ipc.open_file(pa.memory_map(path, "r")).read_all()
+    return _table_columns(table, columns)
+
+
+def load_parquet(path: str, columns: List[str] = None) -> Dict[str, "np.ndarray[np.float64]"]:
+    """
+    Load columns of a Parquet file as numpy arrays. Only the requested columns are decoded, and the decoded columns
+    are returned as views of the Arrow buffers without another copy.
+
+    Parameters
+    ----------
+    path : str
+        Path of the Parquet file.
+    columns : list of str, optional
+        The columns to read. DEFAULT = all of the columns.
+
+    Returns
+    -------
+    dict
+        The array of each column, by column name.
+    """
+    _import_pyarrow()
+    import pyarrow.parquet as pq
+
+    table = pq.read_table(path, columns=columns, memory_map=True)
+    return _table_columns(table, columns)
+
+
+def iter_blocks(bg_array: "np.ndarray[np.float64]", block_size: int, axis: int = -1) -> Iterator["np.ndarray"]:
+    """
+    Iterate over consecutive blocks of an array (e.g. a memory mapped matrix larger than RAM) as views, so the
+    metrics can be evaluated one block of time series at a time. Blocks along the last axis of a C ordered array,
+    such as the columns of a matrix where each column is a time series, can be processed with axis=0 on each block.
+
+    Parameters
+    ----------
+    bg_array : ndarray
+        The array to split.
+    block_size : int
+        The number of entries along axis in each block (the last block may be smaller).
+    axis : int, optional
+        The axis to split along. DEFAULT = -1
+
+    Yields
+    ------
+    ndarray
+        A view of each block.
+    """
+    if block_size < 1:
+        raise Exception("block_size must be positive.")
+    n_entries = bg_array.shape[axis]
+    for start in range(0, n_entries, block_size):
+        index = [slice(None)] * bg_array.ndim
+        index[axis] = slice(start, start + block_size)
+        yield bg_array[tuple(index)]
+
+
+def _import_pyarrow():
+    try:
+        import pyarrow
+    except ImportError:
+        raise ImportError("pyarrow is required to read Arrow and Parquet files, install it with: pip install pyarrow")
+    return pyarrow
+
+
+def _table_columns(table, columns: List[str] = None) -> Dict[str, "np.ndarray[np.float64]"]:
+    if columns is None:
+        columns = table.column_names
+    arrays = {}
+    for name in columns:
+        column = table.column(name)
+        if column.num_chunks == 1 and column.null_count == 0:
+            arrays[name] = column.chunk(0).to_numpy(zero_copy_only=True)
+        else:
+            arrays[name] = column.to_numpy()
+    return arrays
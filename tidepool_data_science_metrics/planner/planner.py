@@ -0,0 +1,453 @@
+import numpy as np
+from typing import Callable, Dict, Iterable, List, NamedTuple, Sequence, Tuple
+from tidepool_data_science_metrics.common import common
+from tidepool_data_science_metrics.glucose import glucose, variability
+from tidepool_data_science_metrics.insulin import insulin
+from tidepool_data_science_metrics.cache import cache
+from tidepool_data_science_metrics.instrumentation import instrumentation
+
+
+class _Step(NamedTuple):
+    requires: Tuple[str, ...]
+    function: Callable
+    inputs: Tuple[str, ...] = ()
+
+
+class PlanStep(NamedTuple):
+    """
+    One step of an execution plan: compute the intermediate or metric called name (kind is "intermediate" or
+    "metric"), then release the intermediates that no later step needs.
+    """
+
+    name: str
+    kind: str
+    release: Tuple[str, ...]
+
+
+# the registered intermediates and metrics, each with the intermediates it requires
+_INTERMEDIATES: Dict[str, _Step] = {}
+_METRICS: Dict[str, _Step] = {}
+
+
+def register_intermediate(name: str, requires: Sequence[str] = ()) -> Callable:
+    """
+    Register a function as an intermediate that metrics (and other intermediates) can require, e.g.
+
+        @planner.register_intermediate("sorted", requires=("rows",))
+        def _sorted(context, rows):
+            return np.sort(rows, axis=1)
+
+    The function is called with the context of the calculation (a dict with the bg_array, axis, ignore_nan and
+    the other arguments of compute) followed by the value of each required intermediate, in order.
+
+    Parameters
+    ----------
+    name : str
+        The name metrics require the intermediate by.
+    requires : sequence of str, optional
+        The names of the intermediates the function takes.
+
+    Returns
+    -------
+    callable
+        The decorator, which returns the function unchanged.
+    """
+
+    def decorator(function: Callable) -> Callable:
+        _INTERMEDIATES[name] = _Step(tuple(requires), function)
+        return function
+
+    return decorator
+
+
+def register_metric(name: str, requires: Sequence[str] = (), inputs: Sequence[str] = ("bg_array",)) -> Callable:
+    """
+    Register a function as a metric that compute can calculate. Like register_intermediate, the function is called
+    with the context followed by the value of each required intermediate, and returns one value per series row
+    (see glucose._as_series_rows), which compute puts back into the shape of the time series.
+
+    Parameters
+    ----------
+    name : str
+        The name of the metric, by convention the name of the function that calculates it individually.
+    requires : sequence of str, optional
+        The names of the intermediates the function takes.
+    inputs : sequence of str, optional
+        The arguments of compute the metric needs (e.g. "iob_array"). By default compute only calculates the metrics
+        whose inputs are given. DEFAULT = ("bg_array",)
+
+    Returns
+    -------
+    callable
+        The decorator, which returns the function unchanged.
+    """
+
+    def decorator(function: Callable) -> Callable:
+        _METRICS[name] = _Step(tuple(requires), function, tuple(inputs))
+        return function
+
+    return decorator
+
+
+def registered_metrics() -> List[str]:
+    """The names of every metric that compute can calculate."""
+    return list(_METRICS)
+
+
+def plan(metric_names: Iterable[str]) -> List[PlanStep]:
+    """
+    Build the execution plan of a set of metrics: every intermediate that the metrics need (directly or through
+    other intermediates) is computed once, before its first use, and is released right after its last use, so only
+    the intermediates that a later step still needs are held at any time. The metrics are ordered to release each
+    intermediate as early as possible.
+
+    Parameters
+    ----------
+    metric_names : iterable of str
+        The metrics to calculate, see registered_metrics.
+
+    Returns
+    -------
+    list of PlanStep
+        The steps in the order they run.
+    """
+    metric_names = list(dict.fromkeys(metric_names))
+    unknown = [name for name in metric_names if name not in _METRICS]
+    if unknown:
+        raise Exception(f"Unknown metrics {', '.join(unknown)}, expected any of {', '.join(_METRICS)}.")
+
+    # a depth first walk of the dependency DAG puts every intermediate after the intermediates it requires
+    order = []
+    visiting = set()
+
+    def visit(name: str):
+        if (name, "intermediate") in order:
+            return
+        if name not in _INTERMEDIATES:
+            raise Exception(f"Unknown intermediate {name}.")
+        if name in visiting:
+            raise Exception(f"The intermediate {name} requires itself.")
+        visiting.add(name)
+        for required in _INTERMEDIATES[name].requires:
+            visit(required)
+        visiting.remove(name)
+        order.append((name, "intermediate"))
+
+    for metric_name in _schedule(metric_names):
+        for required in _METRICS[metric_name].requires:
+            visit(required)
+        order.append((metric_name, "metric"))
+
+    registry = {"intermediate": _INTERMEDIATES, "metric": _METRICS}
+    last_use = {}
+    for i, (name, kind) in enumerate(order):
+        for required in registry[kind][name].requires:
+            last_use[required] = i
+    releases = [[] for _ in order]
+    for name, i in last_use.items():
+        releases[i].append(name)
+    return [PlanStep(name, kind, tuple(release)) for (name, kind), release in zip(order, releases)]
+
+
+def _schedule(metric_names: List[str]) -> List[str]:
+    # Greedily run next the metric that is the last user of the most intermediates that are already computed, so
+    # they are released as early as possible (e.g. the ADRR right after the LBGI and HBGI, which free the risk values
+    # together), and otherwise the metric that reuses the most of them, keeping the requested order on ties.
+    remaining = list(metric_names)
+    computed = set()
+    scheduled = []
+    while remaining:
+
+        def score(metric_name):
+            requires = _closure(_METRICS[metric_name].requires) & computed
+            others = [_closure(_METRICS[name].requires) for name in remaining if name != metric_name]
+            return len(requires - set().union(*others)), len(requires)
+
+        metric_name = max(remaining, key=score)
+        remaining.remove(metric_name)
+        computed |= _closure(_METRICS[metric_name].requires)
+        scheduled.append(metric_name)
+    return scheduled
+
+
+def _closure(requires: Iterable[str]) -> set:
+    # the intermediates required directly or through other intermediates
+    closure = set()
+    stack = list(requires)
+    while stack:
+        name = stack.pop()
+        if name not in closure:
+            closure.add(name)
+            stack.extend(_INTERMEDIATES[name].requires if name in _INTERMEDIATES else ())
+    return closure
+
+
+@instrumentation.instrumented
+@cache.cached
+def compute(
+    bg_array: "np.ndarray[np.float64]",
+    metric_names: Iterable[str] = None,
+    axis: int = None,
+    timestamps: "np.ndarray[np.datetime64]" = None,
+    samples_per_day: int = 288,
+    episodes_threshold: int = 54,
+    min_ct_per_ep: int = 3,
+    validate: bool = True,
+    ignore_nan: bool = False,
+    iob_array: "np.ndarray[np.float64]" = None,
+    scheduled_basal_rate: np.float64 = None,
+) -> Dict[str, np.float64]:
+    """
+    Calculate a set of metrics on a set of glucose values, computing each shared intermediate (the validated values,
+    the series rows, the mean and standard deviation, the sorted values, the risk values, the episode runs and the
+    day boundaries) once and releasing it as soon as no later metric needs it, which keeps the peak memory bounded
+    on large matrices. Every value matches the value returned by the corresponding individual function with its
+    default rounding.
+
+    Parameters
+    ----------
+    bg_array : ndarray
+        1D array containing data with float or int type.
+    metric_names : iterable of str, optional
+        The metrics to calculate, see registered_metrics. DEFAULT = None, every registered metric whose inputs are
+        given (e.g. the insulin metrics only with iob_array).
+    axis : int, optional
+        The axis along which each time series runs (e.g. 0 for a matrix where each column is a time series).
+        DEFAULT = None, all of the values are one time series.
+    timestamps : ndarray, optional
+        1D array of datetime64 with the local time of each value along axis, for the days of the ADRR.
+    samples_per_day : int, optional
+        The number of values in a day, for the variability indices. DEFAULT = 288, 5 minute CGM data
+    episodes_threshold : int, optional
+        Any bg values below this value will be considered as within an episode. DEFAULT = 54
+    min_ct_per_ep : int, optional
+        The number of consecutive bg values required in the threshold range to be considered an episode.
+    validate : bool, optional
+        Whether to check the glucose values before the calculation. DEFAULT = True
+    ignore_nan : bool, optional
+        Whether NaN values are missing readings to leave out, so the results are over the valid values only.
+        DEFAULT = False
+    iob_array : ndarray, optional
+        The insulin-on-board time series, in the same layout as bg_array, for the DKA Index. See insulin.dka_index.
+    scheduled_basal_rate : float or ndarray, optional
+        The scheduled basal rate (U/hr) of the DKA Index, one per time series when axis is given.
+
+    Returns
+    -------
+    dict
+        The calculated metrics keyed by name, each an array with one entry per time series when axis is given.
+    """
+    context = {
+        "bg_array": bg_array,
+        "axis": axis,
+        "timestamps": timestamps,
+        "samples_per_day": samples_per_day,
+        "episodes_threshold": episodes_threshold,
+        "min_ct_per_ep": min_ct_per_ep,
+        "validate": validate,
+        "ignore_nan": ignore_nan,
+        "iob_array": iob_array,
+        "scheduled_basal_rate": scheduled_basal_rate,
+    }
+
+    def has_inputs(name):
+        return all(context[input_name] is not None for input_name in _METRICS[name].inputs)
+
+    if metric_names is None:
+        metric_names = [name for name in registered_metrics() if has_inputs(name)]
+    metric_names = list(metric_names)
+    missing = [name for name in metric_names if name in _METRICS and not has_inputs(name)]
+    if missing:
+        raise Exception(f"The metrics {', '.join(missing)} need inputs that were not given.")
+    steps = plan(metric_names)
+    intermediates = {}
+    results = dict.fromkeys(metric_names)  # the results in the requested order
+    for step in steps:
+        if step.kind == "intermediate":
+            function, requires = _INTERMEDIATES[step.name].function, _INTERMEDIATES[step.name].requires
+            intermediates[step.name] = function(context, *[intermediates[name] for name in requires])
+        else:
+            function, requires = _METRICS[step.name].function, _METRICS[step.name].requires
+            values = function(context, *[intermediates[name] for name in requires])
+            results[step.name] = variability._from_series(values, bg_array, axis)
+        for name in step.release:
+            del intermediates[name]
+    return results
+
+
+@register_intermediate("validated")
+def _validated(context):
+    if context["validate"]:
+        glucose._validate_bg(context["bg_array"])
+    return np.asarray(context["bg_array"])
+
+
+@register_intermediate("rows", requires=("validated",))
+def _rows(context, bg_array):
+    return variability._bg_rows(bg_array, context["axis"])
+
+
+@register_intermediate("n_values", requires=("rows",))
+def _n_values(context, rows):
+    return np.broadcast_to(glucose._n_values(rows, axis=1, ignore_nan=context["ignore_nan"]), rows.shape[:1])
+
+
+@register_intermediate("mean", requires=("rows",))
+def _mean(context, rows):
+    return variability._mean(rows, context["ignore_nan"])
+
+
+@register_intermediate("std", requires=("rows",))
+def _std(context, rows):
+    return variability._std(rows, context["ignore_nan"])
+
+
+@register_intermediate("sorted", requires=("rows",))
+def _sorted(context, rows):
+    return np.sort(rows, axis=1)  # NaN sorts to the end, after every threshold
+
+
+@register_intermediate("threshold_counts", requires=("sorted",))
+def _threshold_counts(context, sorted_rows):
+    # the number of values below (lt) and at or below (le) each summary threshold of each series, by binary search
+    # of the sorted values instead of a comparison mask per metric
+    bounds = np.array(glucose._LT_THRESHOLDS + glucose._LE_THRESHOLDS, dtype=np.float64)
+    inclusive = np.arange(len(bounds)) >= len(glucose._LT_THRESHOLDS)
+    counts = glucose._sorted_counts(sorted_rows, bounds, inclusive)
+    n_lt, n_le = np.split(counts, [len(glucose._LT_THRESHOLDS)], axis=1)
+    return dict(zip(glucose._LT_THRESHOLDS, n_lt.T)), dict(zip(glucose._LE_THRESHOLDS, n_le.T))
+
+
+@register_intermediate("risk", requires=("rows",))
+def _risk(context, rows):
+    return glucose._risk_values(rows)
+
+
+@register_intermediate("risk_means", requires=("risk",))
+def _risk_means(context, risk):
+    # the unrounded LBGI and HBGI
+    return variability._mean(risk[0], context["ignore_nan"]), variability._mean(risk[1], context["ignore_nan"])
+
+
+@register_intermediate("day_starts", requires=("rows",))
+def _day_starts(context, rows):
+    return variability._day_starts(rows.shape[1], context["samples_per_day"], context["timestamps"])
+
+
+@register_intermediate("episode_counts", requires=("rows",))
+def _episode_counts(context, rows):
+    in_range_rows, _ = glucose._episode_rows(rows, context["episodes_threshold"], context["ignore_nan"])
+    return glucose._run_counts(in_range_rows, context["min_ct_per_ep"])
+
+
+@register_intermediate("dka_index")
+def _dka_index(context):
+    dka_index = insulin.dka_index(context["iob_array"], context["scheduled_basal_rate"], axis=context["axis"])
+    return np.reshape(dka_index, -1)
+
+
+@register_metric("count", requires=("n_values",))
+def _count(context, n_values):
+    return n_values
+
+
+@register_metric("mean", requires=("mean",))
+def _mean_metric(context, mean_bg):
+    return np.round(mean_bg, 2)
+
+
+@register_metric("std_deviation", requires=("std",))
+def _std_deviation(context, std_bg):
+    return np.round(std_bg, 2)
+
+
+@register_metric("coefficient_of_variation", requires=("mean", "std"))
+def _coefficient_of_variation(context, mean_bg, std_bg):
+    return common._coefficient_of_variation(mean_bg, std_bg)
+
+
+@register_metric("glucose_management_index", requires=("mean",))
+def _glucose_management_index(context, mean_bg):
+    return np.round(glucose._gmi(np.round(mean_bg, 2)), 3)
+
+
+def _register_range(name: str, bounds: Tuple[Tuple[str, int], Tuple[str, int]], is_percent: bool):
+    # a percent (or count) metric of one of the summary ranges, from the shared threshold counts
+    def range_metric(context, threshold_counts, n_values):
+        n_meet_criteria = glucose._range_count(*threshold_counts, *bounds)
+        return glucose._percent(n_meet_criteria, n_values) if is_percent else n_meet_criteria
+
+    register_metric(name, requires=("threshold_counts", "n_values"))(range_metric)
+
+
+for _name, _bounds in glucose._PERCENT_RANGES.items():
+    _register_range(_name, _bounds, is_percent=True)
+for _name, _bounds in glucose._COUNT_RANGES.items():
+    _register_range(_name, _bounds, is_percent=False)
+
+
+@register_metric("lbgi", requires=("risk_means",))
+def _lbgi(context, risk_means):
+    return np.round(risk_means[0], 2)
+
+
+@register_metric("hbgi", requires=("risk_means",))
+def _hbgi(context, risk_means):
+    return np.round(risk_means[1], 2)
+
+
+@register_metric("bgri", requires=("risk_means",))
+def _bgri(context, risk_means):
+    return np.round(risk_means[0] + risk_means[1], 2)
+
+
+@register_metric("lbgi_risk_score", requires=("risk_means",))
+def _lbgi_risk_score(context, risk_means):
+    return glucose.lbgi_risk_score(np.round(risk_means[0], 2))
+
+
+@register_metric("episodes", requires=("episode_counts",))
+def _episodes(context, episode_counts):
+    return episode_counts
+
+
+@register_metric("mage", requires=("rows", "std"))
+def _mage(context, rows, std_bg):
+    return np.round(variability._mage(rows, std_bg, 5, 32, context["ignore_nan"]), 2)
+
+
+@register_metric("conga", requires=("rows",))
+def _conga(context, rows):
+    differences = variability._lagged_differences(rows, context["samples_per_day"] // 24)
+    return np.round(variability._std(differences, context["ignore_nan"], ddof=1), 2)
+
+
+@register_metric("modd", requires=("rows",))
+def _modd(context, rows):
+    differences = variability._lagged_differences(rows, context["samples_per_day"])
+    return np.round(variability._mean(np.abs(differences), context["ignore_nan"]), 2)
+
+
+@register_metric("j_index", requires=("mean", "std"))
+def _j_index(context, mean_bg, std_bg):
+    return np.round(variability._j_index(mean_bg, std_bg), 2)
+
+
+@register_metric("adrr", requires=("risk", "day_starts"))
+def _adrr(context, risk, day_starts):
+    return np.round(variability._adrr(risk[0], risk[1], day_starts, context["ignore_nan"]), 2)
+
+
+@register_metric("grade", requires=("rows",))
+def _grade(context, rows):
+    return np.round(variability._mean(variability._grade_values(rows), context["ignore_nan"]), 2)
+
+
+@register_metric("dka_index", requires=("dka_index",), inputs=("iob_array", "scheduled_basal_rate"))
+def _dka_index_metric(context, dka_index):
+    return dka_index
+
+
+@register_metric("dka_risk_score", requires=("dka_index",), inputs=("iob_array", "scheduled_basal_rate"))
+def _dka_risk_score(context, dka_index):
+    return insulin.dka_risk_score(dka_index)